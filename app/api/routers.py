@@ -1,32 +1,32 @@
 # app/api/routers.py
-from fastapi import APIRouter, Depends, Header, UploadFile, File, BackgroundTasks, HTTPException
+from fastapi import APIRouter, Depends, Header, Request, UploadFile, File, BackgroundTasks, HTTPException
 from fastapi.responses import StreamingResponse, JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from pydantic import BaseModel
 import json
-import qdrant_client
+import asyncio
 from app.core.config import get_settings
 
 # --- Imports from App Structure ---
+# ⚡️ 这里只放轻量依赖。LangChain / LlamaIndex / Langfuse / qdrant_client / dashscope / torch
+# 都在各自子系统第一次被调用时才导入 (见 chat_endpoint)，
+# 只服务 /feedback、/upload/{task_id} 的 worker 启动时不会加载它们。
 from app.utils.database import get_db
-from app.core.redis import redis_manager
+from app.core.redis import redis_manager, chat_history_store
+from app.services.history_manager import history_manager
 from app.services.llm_factory import ModelFactory
-from app.services.file_service import handle_file_upload
-from app.services.query_rewriter import condense_question
-from app.core.models import Feedback  # 👈 假设你移动了 models.py
-from app.core.prompts import DB_SCHEMA_TEXT, CORE_SYSTEM_PROMPT # 👈 假设你移动了 prompts.py
-
-# --- LangChain & Langfuse ---
-from langchain.agents import AgentExecutor, create_tool_calling_agent
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_core.prompts import ChatPromptTemplate
-from langfuse import Langfuse
-from langfuse.langchain import CallbackHandler
-
-# --- Tools ---
-from app.tools.policy_tool import lookup_policy_doc
-from app.tools.sql_tool import query_business_data
+from app.services.agent_factory import AgentFactory
+from app.services.file_service import handle_file_upload, handle_bulk_upload
+from app.services.document_registry import document_registry
+from app.services.upload_stream import UploadTooLarge, InvalidUpload
+from app.services.query_rewriter import speculative_condense
+from app.services.rewrite_cache import rewrite_cache
+from app.services.semantic_cache import semantic_cache
+from app.services.retrieval_policy import retrieval_policy
+from app.services.sql_cache import sql_result_cache
+from app.services import feedback_rollup
+from app.core.models import Feedback, FeedbackTag, split_tags  # 👈 假设你移动了 models.py
 
 import os
 from dotenv import load_dotenv
@@ -49,10 +49,6 @@ class FeedbackRequest(BaseModel):
     tags: List[str] = []
     comment: Optional[str] = ""
 
-# --- Helper: Get History ---
-def get_chat_history_dep(x_session_id: str = Header(..., alias="X-Session-ID")):
-    return redis_manager.get_chat_history(x_session_id)
-
 settings = get_settings()
 # ==========================
 # 1. 💬 Chat 接口
@@ -60,54 +56,67 @@ settings = get_settings()
 @router.post("/chat")
 async def chat_endpoint(
     request: ChatRequest,
-    x_session_id: str = Header(..., alias="X-Session-ID"),
-    history_dicts: List[dict] = Depends(get_chat_history_dep)
+    x_session_id: str = Header(..., alias="X-Session-ID")
 ):
-    print(f"🔔 新请求 Session ID: {x_session_id}, 历史消息数: {len(history_dicts)}")
+    # --- LangChain & Langfuse (首次对话时加载) ---
+    from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+    from langfuse.langchain import CallbackHandler
 
-  
-    # 0. 查询改写 
+    # 0. 历史加载 & 查询改写 (并行启动)
+    # 改写不再是串行的第一跳：它和历史加载、Agent 获取同时进行，
+    # 并且受 REWRITE_TIMEOUT_SECONDS 预算约束。
     # 将改写后的问题用于 Agent 推理，但历史记录中仍保存用户原话
-    final_query = condense_question(history_dicts, request.message)
-    # 1. 准备工具和模型
-    tools = [lookup_policy_doc, query_business_data]
-    llm = ModelFactory.get_llm()
+    # 只读取最近 CHAT_HISTORY_WINDOW 条消息 + 滚动摘要，并按 HISTORY_TOKEN_BUDGET 裁剪
+    history_task = asyncio.create_task(history_manager.load(x_session_id))
+
+    async def recent_messages():
+        _, messages = await history_task
+        return messages
+
+    rewrite_task = asyncio.create_task(speculative_condense(recent_messages(), request.message))
+
+    # 1~3. 获取 Agent
+    # System Prompt (rag-core-system) 由 PromptRegistry 在后台定时刷新，
+    # Agent 按 Prompt 版本缓存，版本变化时后台重建并原子替换；请求链路不再访问 Langfuse
+    agent_executor = AgentFactory.get_agent_executor()
 
-    # 2. 转换历史记录 (Dict -> LangChain Objects)
+    # 4. 等待历史 & 改写结果，转换历史记录 (Dict -> LangChain Objects)
+    history_summary, history_dicts = await history_task
+    print(f"🔔 新请求 Session ID: {x_session_id}, 历史消息数: {len(history_dicts)}, 摘要: {'有' if history_summary else '无'}")
     lc_history = []
+    # 更早的对话已折叠成摘要，放在最前面
+    if history_summary:
+        lc_history.append(SystemMessage(content=f"【之前的对话摘要】\n{history_summary}"))
     for msg in history_dicts:
         if msg.get("role") == "user":
             lc_history.append(HumanMessage(content=msg.get("content")))
         elif msg.get("role") == "assistant":
             lc_history.append(AIMessage(content=msg.get("content")))
 
-    langfuse = Langfuse()
-    # 3. 动态获取 Prompt (CMS 模式)
-    try:
-        # cache_ttl_seconds=0 方便调试，生产环境可去掉
-        langfuse_prompt = langfuse.get_prompt("rag-core-system", cache_ttl_seconds=0)
-        final_system_prompt_str = langfuse_prompt.compile(schema=DB_SCHEMA_TEXT)
-        print(f"✅ Prompt 拉取成功: {final_system_prompt_str}")
-    except Exception as e:
-        print(f"⚠️ Prompt 拉取失败: {e}")
-        # 兜底逻辑
-        final_system_prompt_str = CORE_SYSTEM_PROMPT.format()
+    final_query = await rewrite_task
+
+    # 4.5 语义缓存：近似重复的问题直接回放历史答案 (含 __SOURCES__ 尾巴)
+    # generation 在生成答案之前读取，写缓存时沿用 (期间知识库更新的话，答案会落到旧 generation)
+    cache_generation = None
+    if settings.SEMANTIC_CACHE_ENABLED:
+        try:
+            cache_generation = await semantic_cache.current_generation()
+            cache_hit = await semantic_cache.lookup(final_query, cache_generation)
+        except Exception as e:
+            print(f"⚠️ 语义缓存查询失败: {e}")
+            cache_hit = None
+        if cache_hit:
+            print(f"🎯 语义缓存命中 (score={cache_hit['score']:.4f}): {final_query}")
+            return StreamingResponse(
+                replay_cached_answer(cache_hit, x_session_id, request.message),
+                media_type="text/plain"
+            )
 
-    # 4. 构建 Agent
-    prompt = ChatPromptTemplate.from_messages([
-        SystemMessage(content=final_system_prompt_str),
-        ("placeholder", "{chat_history}"),
-        ("human", "{input}"),
-        ("placeholder", "{agent_scratchpad}"),
-    ])
-    
-    agent = create_tool_calling_agent(llm, tools, prompt)
-    agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
-    
     # 5. 定义流式生成器
     async def event_generator():
         full_response = ""
         captured_sources = [] # 🟢  初始化容器，用于暂存来源信息
+        used_sql_tool = False # SQL 结果会随业务数据变化，不能进语义缓存
         langfuse_handler = CallbackHandler()
         
         try:
@@ -127,6 +136,8 @@ async def chat_endpoint(
                 if kind == "on_tool_end":
                     # 打印日志方便调试
                     print(f"🔧 Tool End: {event['name']}")
+                    if event["name"] == "query_business_data":
+                        used_sql_tool = True
                     
                     # 仅处理文档检索工具的 Source
                     if event["name"] == "lookup_policy_doc":
@@ -165,35 +176,108 @@ async def chat_endpoint(
                 # 按照前端协议：换行 + __SOURCES__ + 换行 + JSON
                 sources_payload = json.dumps(captured_sources, ensure_ascii=False)
                 yield f"\n\n__SOURCES__\n{sources_payload}"         
-            # 6. 保存历史到 Redis
+            # 6. 保存历史到 Redis (只追加本轮的两条消息)
             if full_response:
-                new_history = history_dicts + [
+                await chat_history_store.append(x_session_id, [
                     {"role": "user", "content": request.message},
                     {"role": "assistant", "content": full_response}
-                ]
-                redis_manager.save_chat_history(x_session_id, new_history)
+                ])
+                # 超出 Token 预算时由小模型在后台折叠旧消息
+                history_manager.schedule_compaction(x_session_id)
+
+            # 7. 写入语义缓存 (只缓存有文档来源、且不依赖实时数据的回答)
+            if (settings.SEMANTIC_CACHE_ENABLED and cache_generation is not None
+                    and full_response and captured_sources and not used_sql_tool):
+                try:
+                    await semantic_cache.store(final_query, full_response, captured_sources, cache_generation)
+                except Exception as e:
+                    print(f"⚠️ 写入语义缓存失败: {e}")
                 
         except Exception as e:
             yield f"系统错误: {str(e)}"
 
     return StreamingResponse(event_generator(), media_type="text/plain")
 
+
+async def replay_cached_answer(cache_hit: dict, x_session_id: str, message: str):
+    """把缓存的答案按流式协议回放给前端，并照常写入会话历史"""
+    answer = cache_hit["answer"]
+    chunk_size = 16
+    for i in range(0, len(answer), chunk_size):
+        yield answer[i:i + chunk_size]
+    if cache_hit["sources"]:
+        sources_payload = json.dumps(cache_hit["sources"], ensure_ascii=False)
+        yield f"\n\n__SOURCES__\n{sources_payload}"
+    if answer:
+        await chat_history_store.append(x_session_id, [
+            {"role": "user", "content": message},
+            {"role": "assistant", "content": answer}
+        ])
+        history_manager.schedule_compaction(x_session_id)
+
 # ==========================
 # 2. 📤 上传接口
 # ==========================
-@router.post("/upload")
+# 请求体由 upload_stream 自己流式解析 (不走 UploadFile 的整体缓存)，这里手动声明给 /docs 用
+_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    }
+}
+
+@router.post("/upload", openapi_extra=_UPLOAD_OPENAPI)
 async def upload_file(
-    file: UploadFile = File(...), 
+    request: Request,
     background_tasks: BackgroundTasks = BackgroundTasks()
 ):
-    task_id = await handle_file_upload(file, background_tasks)
+    try:
+        task_id = await handle_file_upload(request, background_tasks)
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"detail": str(e)})
+    except InvalidUpload as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
     return {"status": "success", "task_id": task_id, "message": "开始后台处理"}
 
+_BULK_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"files": {"type": "array", "items": {"type": "string", "format": "binary"}}},
+            "required": ["files"],
+        }}},
+    }
+}
+
+@router.post("/upload/bulk", openapi_extra=_BULK_UPLOAD_OPENAPI)
+async def upload_bulk(
+    request: Request,
+    background_tasks: BackgroundTasks = BackgroundTasks()
+):
+    """批量上传：多个文件或 zip 包，返回一个批次 task_id，进度见 /upload/{task_id}"""
+    try:
+        task_id = await handle_bulk_upload(request, background_tasks)
+    except UploadTooLarge as e:
+        return JSONResponse(status_code=413, content={"detail": str(e)})
+    except InvalidUpload as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
+    return {"status": "success", "task_id": task_id, "message": "开始后台批量处理"}
+
 @router.get("/upload/{task_id}")
 async def get_upload_status(task_id: str):
-    task_info = redis_manager.get_client().hgetall(f"task:{task_id}")
+    client = redis_manager.get_async_client()
+    task_info = await client.hgetall(f"task:{task_id}")
     if not task_info:
         return JSONResponse(status_code=404, content={"status": "not_found"})
+    # 批量任务：附带每个文件的状态
+    if "files_total" in task_info:
+        files = await client.hgetall(f"task:{task_id}:files")
+        task_info["files"] = {name: json.loads(raw) for name, raw in files.items()}
     return task_info
 
 # ==========================
@@ -205,7 +289,8 @@ async def submit_feedback(
     db: AsyncSession = Depends(get_db)
 ):
     try:
-        tags_str = ",".join(request.tags)
+        tags = split_tags(request.tags)
+        tags_str = ",".join(tags)
         new_feedback = Feedback(
             session_id=request.session_id,
             question=request.question,
@@ -215,47 +300,76 @@ async def submit_feedback(
             comment=request.comment
         )
         db.add(new_feedback)
+        # 先 flush 拿到自增 id，标签关联行和反馈在同一个事务里提交
+        await db.flush()
+        db.add_all([FeedbackTag(feedback_id=new_feedback.id, tag=tag) for tag in tags])
+        # 汇总表 (天 × 评分 × 标签) 增量 +1，和原始数据一起提交
+        await feedback_rollup.record_feedback(db, new_feedback.rating, tags)
         await db.commit()
         await db.refresh(new_feedback)
-        return {"status": "success", "id": new_feedback.id}
     except Exception as e:
         await db.rollback()
         return JSONResponse(status_code=500, content={"detail": str(e)})
+
+    # 数据已变化：bump 表版本号，query_business_data 的旧缓存结果立即失效
+    try:
+        await sql_result_cache.bump("feedbacks", "feedback_tags", *feedback_rollup.ROLLUP_TABLES)
+    except Exception as e:
+        print(f"⚠️ SQL 结果缓存失效失败 (缓存最多 {settings.SQL_CACHE_TTL_SECONDS}s 后过期): {e}")
+    return {"status": "success", "id": new_feedback.id}
     
 
 # ==========================
 # 4. 📂 文件列表接口 (补全这个)
 # ==========================
 @router.get("/files")
-async def get_indexed_files():
-    """获取知识库中已索引的文件列表"""
+async def get_indexed_files(
+    page: int = 1,
+    page_size: int = 20,
+    sort: str = "uploaded_at",
+    order: str = "desc",
+):
+    """
+    获取知识库文件列表 (分页 / 排序)。
+    数据来自入库时维护的文档登记表，耗时与知识库大小无关；sort 可选 uploaded_at / name / size_bytes / chunk_count
+    """
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), 100)
     try:
-        # 连接 Qdrant
-        client = qdrant_client.QdrantClient(url=settings.QDRANT_URL)
-        
-        # 1. 检查集合是否存在
-        if not client.collection_exists(settings.COLLECTION_NAME):
-            return {"count": 0, "files": []}
-
-        # 2. 遍历数据 (这里简单取前100个用于展示)
-        # 生产环境如果文件很多，可以使用 Scroll 分页
-        scroll_result = client.scroll(
-            collection_name=settings.COLLECTION_NAME,
-            limit=100,
-            with_payload=True,
-            with_vectors=False
-        )
-        
-        points, _ = scroll_result
-        files = set()
-        for point in points:
-            # 提取 payload 里的 file_name
-            if point.payload and "file_name" in point.payload:
-                files.add(point.payload["file_name"])
-        
-        return {"count": len(files), "files": list(files)}
-        
+        result = await document_registry.list(sort=sort, order=order, page=page, page_size=page_size)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"detail": str(e)})
     except Exception as e:
         print(f"❌ 查询文件列表失败: {e}")
         # 出错不返回 500，返回空列表防止前端崩
-        return {"count": 0, "files": []}    
\ No newline at end of file
+        return {"count": 0, "total": 0, "page": page, "page_size": page_size, "files": [], "items": []}
+
+    return {
+        "count": len(result["items"]),
+        "total": result["total"],
+        "page": page,
+        "page_size": page_size,
+        # files 保持旧格式 (文件名列表)，详细信息见 items
+        "files": [item["file_name"] for item in result["items"]],
+        "items": result["items"],
+    }
+
+
+# ==========================
+# 5. 📊 缓存命中率 (用于评估缓存容量)
+# ==========================
+@router.get("/cache/stats")
+async def get_cache_stats():
+    try:
+        stats = {
+            "rewrite": await rewrite_cache.stats(),
+            "semantic": await semantic_cache.stats(),
+            "sql": await sql_result_cache.stats(),
+        }
+        # 查询向量缓存是进程内的 (每个 worker 各自统计)
+        stats["query_embedding"] = ModelFactory.get_embed_cache_stats()
+        # 自适应检索各路径的次数和平均耗时 (同样是进程内统计)
+        stats["retrieval"] = retrieval_policy.stats()
+        return stats
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"detail": str(e)})
@@ -2,6 +2,7 @@
 import os
 from dotenv import load_dotenv
 from functools import lru_cache
+from typing import Dict
 from urllib.parse import quote_plus  # 👈 必须导入这个，用于处理密码里的特殊字符
 from pydantic_settings import BaseSettings
 load_dotenv()
@@ -16,10 +17,48 @@ class Settings(BaseSettings):
      # --- 2. 模型路径 ---
     EMBEDDING_MODEL_PATH: str = os.path.join(BASE_DIR, "models", "bge-large-zh-v1.5/BAAI/bge-large-zh-v1___5")
     RERANK_MODEL_PATH: str = os.path.join(BASE_DIR, "models", "bge-reranker-base/BAAI/bge-reranker-base")
+
+    # 推理后端: "torch" (默认，HuggingFace/FlagEmbedding) 或 "onnx" (ONNX Runtime，CPU 节点推荐)
+    INFERENCE_BACKEND: str = "torch"
+    # ONNX 导出目录 (首次启动时自动导出)
+    ONNX_MODEL_DIR: str = os.path.join(BASE_DIR, "models", "onnx")
+    # 是否使用 int8 动态量化模型
+    ONNX_QUANTIZE: bool = True
+    # 0 = 由 ONNX Runtime 按物理核数自动决定
+    ONNX_INTRA_OP_THREADS: int = 0
+    ONNX_INTER_OP_THREADS: int = 1
    
     # --- 3. Qdrant 配置 ---
     QDRANT_URL: str = "http://localhost:6333"
     COLLECTION_NAME: str = "enterprise_knowledge_base_hybrid_v1"
+    # gRPC 传输 (批量写入 / 高 QPS 检索比 HTTP+JSON 快)，需要 Qdrant 开放 6334 端口
+    QDRANT_PREFER_GRPC: bool = False
+    QDRANT_GRPC_PORT: int = 6334
+
+    # 集合性能配置 (只在创建集合时生效；已有集合需重建或 update_collection)
+    # 量化: "none" | "scalar" (int8，内存约 1/4) | "product" (PQ，内存更小、精度损失更大)
+    QDRANT_QUANTIZATION: str = "none"
+    QDRANT_QUANTIZATION_ALWAYS_RAM: bool = True
+    # PQ 压缩比: x4 / x8 / x16 / x32 / x64
+    QDRANT_PQ_COMPRESSION: str = "x16"
+    # 检索时用原始向量对候选重打分，oversampling 倍数决定先取多少候选
+    QDRANT_RESCORE: bool = True
+    QDRANT_OVERSAMPLING: float = 2.0
+    # HNSW 图参数：m 越大召回越高、内存越大；ef_construct 影响建图质量和速度
+    QDRANT_HNSW_M: int = 16
+    QDRANT_HNSW_EF_CONSTRUCT: int = 100
+    # 检索时的 ef (0 = 使用 Qdrant 默认值)
+    QDRANT_HNSW_EF_SEARCH: int = 0
+    # 原始向量 / payload 放磁盘 (mmap)，配合量化使用可大幅降低内存
+    QDRANT_VECTORS_ON_DISK: bool = False
+    QDRANT_PAYLOAD_ON_DISK: bool = False
+    # 需要建 payload 索引的字段及类型 (按文件名 / 类型 / 上传时间过滤时不再全量扫描)
+    QDRANT_PAYLOAD_INDEXES: Dict[str, str] = {
+        "file_name": "keyword",
+        "source_type": "keyword",
+        "uploaded_at": "float",
+        "codes": "keyword",
+    }
 
     # --- 4. 数据库原子配置 (从 .env 读取) ---
     # 这里我们把连接串拆开，这样更安全，也更容易处理转义
@@ -47,13 +86,132 @@ class Settings(BaseSettings):
             f"{self.MYSQL_HOST}:{self.MYSQL_PORT}/"
             f"{self.MYSQL_DB}"
         )
+    @property
+    def QDRANT_CLIENT_KWARGS(self) -> dict:
+        """QdrantClient / AsyncQdrantClient 的连接参数 (所有创建客户端的地方共用)"""
+        return {
+            "url": self.QDRANT_URL,
+            "prefer_grpc": self.QDRANT_PREFER_GRPC,
+            "grpc_port": self.QDRANT_GRPC_PORT,
+        }
+
     # --- 6. 文件存储配置  ---
     # 存放在项目根目录下的 storage 文件夹
     UPLOAD_DIR: str = os.path.join(os.getcwd(), "storage") 
     # 对应的访问前缀 (Base URL)
     # 如果在 Docker 或服务器跑，这里可能需要改成 "http://你的IP:8000"
     API_BASE_URL: str = "http://localhost:8000"
-    
+    # 单个上传文件大小上限 (字节)，超过时上传过程中立即中止并返回 413
+    UPLOAD_MAX_BYTES: int = 50 * 1024 * 1024
+
+    # --- 7. 文件入库 (Ingestion) ---
+    # "queue": API 只把任务写入 Redis 队列，由独立 Worker (python -m app.workers.ingest) 处理
+    # "inline": 旧模式，在 API 进程里用 BackgroundTasks 处理 (本地调试用)
+    INGEST_MODE: str = "queue"
+    INGEST_WORKER_CONCURRENCY: int = 2
+    # 失败后最多重试的次数 (不含首次执行)，即一个任务最多执行 1 + INGEST_MAX_RETRIES 次
+    INGEST_MAX_RETRIES: int = 3
+    # 重试退避：base * 2^(attempt-1) 秒
+    INGEST_RETRY_BACKOFF_SECONDS: float = 5.0
+    # Worker 心跳过期时间；心跳消失的 Worker 手里的任务会被重新入队
+    INGEST_HEARTBEAT_TTL_SECONDS: int = 30
+    # 向量化批大小：每批 embed 完立即写入 Qdrant，同时下一批开始 embed (流水线)
+    INGEST_EMBED_BATCH_SIZE: int = 64
+    # 文档解析在独立子进程里进行：并行数 / 单文件超时 / 单进程内存上限 (0 = 不限制)
+    INGEST_PARSE_PROCESSES: int = 2
+    INGEST_PARSE_TIMEOUT_SECONDS: int = 120
+    INGEST_PARSE_MEMORY_MB: int = 2048
+    # 批量上传 (/upload/bulk)：单次最多文件数 (zip 解压后计数) / 单个文件或 zip 的大小上限
+    BULK_UPLOAD_MAX_FILES: int = 50
+    BULK_UPLOAD_MAX_BYTES: int = 200 * 1024 * 1024
+
+    # --- 8. 会话历史 (Redis List，追加写) ---
+    # 服务端只保留最近 N 条消息 (LTRIM)，超出的直接丢弃
+    CHAT_HISTORY_MAX_MESSAGES: int = 50
+    # 每轮对话实际读取的尾部消息数 (喂给 Agent 的上下文窗口)
+    CHAT_HISTORY_WINDOW: int = 20
+    CHAT_HISTORY_TTL_SECONDS: int = 3600
+    # 喂给 qwen-max 的历史 Token 预算：最近的消息原样保留，更早的折叠进滚动摘要
+    HISTORY_TOKEN_BUDGET: int = 1500
+    # 触发压缩后，原文部分压到预算的这个比例以下 (留出余量，避免每轮都压缩)
+    HISTORY_COMPACT_TARGET_RATIO: float = 0.5
+    HISTORY_SUMMARY_MODEL: str = "qwen-turbo"
+    HISTORY_SUMMARY_MAX_CHARS: int = 400
+
+    # --- 9. 启动预热 ---
+    # 开启后启动时加载 Embedding / Reranker、初始化 Index 并做一次空推理；
+    # 预热完成前 /ready 返回 503，负载均衡不会把流量打到冷 worker 上
+    WARMUP_ON_STARTUP: bool = False
+
+    # --- 10. Prompt CMS ---
+    # Langfuse Prompt 的后台刷新间隔 (秒)；请求链路只读本地缓存
+    PROMPT_REFRESH_INTERVAL_SECONDS: float = 60.0
+
+    # --- 11. 查询改写配置 ---
+    REWRITE_MODEL: str = "qwen-turbo"
+    # 改写的总时间预算 (秒)，超时直接使用用户原话，保证改写永远不会拖慢首字延迟
+    REWRITE_TIMEOUT_SECONDS: float = 1.5
+    # 改写结果缓存 (Redis)：相同的最近历史 + 相同追问直接复用，不再调用 LLM
+    REWRITE_CACHE_ENABLED: bool = True
+    REWRITE_CACHE_TTL_SECONDS: int = 24 * 3600
+    REWRITE_CACHE_MAX_ENTRIES: int = 10000
+
+    # --- 12. 语义答案缓存 (Qdrant 独立集合) ---
+    # 近似重复的问题 ("年假怎么请") 直接回放历史答案，跳过 Agent + 检索 + qwen-max
+    SEMANTIC_CACHE_ENABLED: bool = True
+    SEMANTIC_CACHE_COLLECTION: str = "semantic_answer_cache_v1"
+    # 余弦相似度阈值，越高越保守 (BGE 向量下 0.95 基本只命中同义改写)
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+
+    # --- 13. 查询向量缓存 (lookup_policy_doc / 语义缓存共用) ---
+    QUERY_EMBED_CACHE_SIZE: int = 2048
+    # 开启后多个 worker 通过 Redis 共享查询向量
+    QUERY_EMBED_CACHE_REDIS: bool = False
+    QUERY_EMBED_CACHE_TTL_SECONDS: int = 24 * 3600
+
+    # --- 14. Reranker 微批 ---
+    RERANK_TOP_N: int = 3
+    # 一个批次最多多少个 (query, passage) 对
+    RERANK_MAX_BATCH_SIZE: int = 64
+    # 第一个请求到达后最多等多久来凑批 (毫秒)
+    RERANK_BATCH_WINDOW_MS: float = 10.0
+
+    # --- 15. 自适应检索 (lookup_policy_doc) ---
+    # 分数单位：稠密一路的原始余弦相似度 (跨查询可比)；混合检索的融合分只用于排序
+    RETRIEVAL_ADAPTIVE: bool = True
+    # 关闭自适应时的固定召回数
+    RETRIEVAL_DEFAULT_K: int = 10
+    # 第一轮召回数；分数分布太平 (区分不开) 时扩大到 MAX_K 再重排
+    RETRIEVAL_INITIAL_K: int = 6
+    RETRIEVAL_MAX_K: int = 20
+    RETRIEVAL_FLAT_SPREAD: float = 0.05
+    # 最高分低于该值：直接判定 "未找到"，不再重排
+    RETRIEVAL_SCORE_FLOOR: float = 0.35
+    # 第一名足够高且领先第二名足够多：跳过 Reranker，直接用检索排序
+    RETRIEVAL_DECISIVE_SCORE: float = 0.75
+    RETRIEVAL_DECISIVE_MARGIN: float = 0.15
+    # 裸编号查询 (整句只有合同编号 / 工号 / 订单号) 走 codes payload 索引精确匹配，
+    # 匹配不到再走纯稀疏检索；两条路径都不做稠密 Embedding 和重排
+    CODE_FAST_PATH_ENABLED: bool = True
+    CODE_LOOKUP_MAX_CANDIDATES: int = 50
+
+    # --- 16. 共享 HTTP 客户端 (Keep-Alive 连接池) ---
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    HTTP_TIMEOUT_SECONDS: float = 30.0
+
+    # --- 17. SQL 工具 (query_business_data) ---
+    # 预览行数 (LIMIT 下推到 SQL 里，不再全量拉取)
+    SQL_PREVIEW_ROWS: int = 10
+    # 总数统计 (COUNT) 的超时；超时后取消，只提示"超过 N 条"
+    SQL_COUNT_TIMEOUT_SECONDS: float = 2.0
+    # 结果缓存 (Redis)：相同 SQL 在数据没变时直接复用；Key 里带表版本号，
+    # submit_feedback 每次写入都会 bump，旧结果立即失效。TTL 兜底 NOW()/CURDATE() 这类随时间变化的查询
+    SQL_CACHE_ENABLED: bool = True
+    SQL_CACHE_TTL_SECONDS: int = 300
+
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,12 @@
+# app/core/langfuse_client.py
+# Langfuse 客户端 (Prompt CMS / Tracing) 全局单例
+# import langfuse 会连带加载 OpenTelemetry 等一大串依赖，所以按需创建，不在模块导入时初始化
+_langfuse = None
+
+
+def get_langfuse():
+    global _langfuse
+    if _langfuse is None:
+        from langfuse import Langfuse
+        _langfuse = Langfuse() # Langfuse 会自动读取环境变量中的 Key
+    return _langfuse
@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, JSON, ForeignKey, Index
 from sqlalchemy.sql import func
 from app.utils.database import Base
 
@@ -17,6 +17,57 @@ class Feedback(Base):
     # 自动记录创建时间
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+
+class FeedbackTag(Base):
+    """
+    反馈标签关联表 (一条反馈一个标签一行)。
+    按标签统计走 (tag, feedback_id) 索引 + GROUP BY，不再对 feedbacks.tags 做 LIKE 全表扫描；
+    feedbacks.tags 仍然保留 (旧数据 / 展示用)，新写入两边同时写
+    """
+    __tablename__ = "feedback_tags"
+
+    feedback_id = Column(Integer, ForeignKey("feedbacks.id", ondelete="CASCADE"), primary_key=True)
+    tag = Column(String(64), primary_key=True)
+
+    __table_args__ = (
+        Index("ix_feedback_tags_tag", "tag", "feedback_id"),
+    )
+
+
+class FeedbackDailyStat(Base):
+    """反馈日汇总 (天 × 评分)：满意度 / 反馈量趋势直接读这里，写入反馈时增量 +1"""
+    __tablename__ = "feedback_daily_stats"
+
+    day = Column(Date, primary_key=True)
+    rating = Column(Integer, primary_key=True)
+    feedback_count = Column(Integer, nullable=False, default=0)
+
+
+class FeedbackDailyTagStat(Base):
+    """反馈标签日汇总 (天 × 评分 × 标签)：一条反馈有几个标签就计几次，所以反馈总数要查 feedback_daily_stats"""
+    __tablename__ = "feedback_daily_tag_stats"
+
+    day = Column(Date, primary_key=True)
+    rating = Column(Integer, primary_key=True)
+    tag = Column(String(64), primary_key=True)
+    feedback_count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_feedback_daily_tag_stats_tag", "tag", "day"),
+    )
+
+
+def split_tags(tags) -> list:
+    """ "冗长, 错误" 或 ["冗长", "错误"] -> 去空白、去重、保持顺序的标签列表"""
+    if isinstance(tags, str):
+        tags = tags.split(",")
+    result = []
+    for tag in tags or []:
+        tag = (tag or "").strip()[:64]
+        if tag and tag not in result:
+            result.append(tag)
+    return result
+
 # 未来你可以加 User 表
 # class User(Base):
 #     __tablename__ = "users"
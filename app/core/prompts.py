@@ -12,16 +12,44 @@ DB_SCHEMA_TEXT = """
 - question (text): 用户提问的问题
 - answer (text): AI 的回答
 - rating (int): 用户评分 (1=赞, 0=踩)
-- tags (varchar): 反馈标签 (例如: '答非所问', '数据陈旧', '过于冗长')。注意：这是一个逗号分隔的字符串。
+- tags (varchar): 反馈标签的逗号分隔字符串，仅用于展示。⚠️ 不要用它做统计或过滤。
 - comment (text): 用户具体的文字评论
 - created_at (datetime): 反馈创建时间
 
+表名: feedback_tags (反馈标签表，一条反馈的每个标签一行)
+
+字段说明:
+- feedback_id (int): 对应 feedbacks.id
+- tag (varchar): 单个标签 (例如: '答非所问', '数据陈旧', '过于冗长')，已建索引
+
+表名: feedback_daily_stats (反馈日汇总，写入反馈时实时更新，每天每个评分一行)
+
+字段说明:
+- day (date): 日期
+- rating (int): 评分 (1=赞, 0=踩)
+- feedback_count (int): 当天该评分的反馈条数
+
+表名: feedback_daily_tag_stats (反馈标签日汇总，每天每个评分每个标签一行)
+
+字段说明:
+- day (date): 日期
+- rating (int): 评分 (1=赞, 0=踩)
+- tag (varchar): 标签
+- feedback_count (int): 当天该评分下带这个标签的反馈条数
+
 【SQL 编写注意事项】
 1. 统计"满意度"时：计算 rating=1 的数量。
-2. 统计"反馈类型"时：请针对 `tags` 字段进行分析。
-   - 注意：因为 tags 是字符串，可能包含多个标签，统计时请使用 `LIKE` 或精准匹配。
-   - 例如：统计包含 '答非所问' 的数量 -> `WHERE tags LIKE '%答非所问%'`
-3. 表名必须使用复数 `feedbacks`。
+2. 统计"反馈类型 / 标签"时：一律查询 `feedback_tags`，用等值匹配或 GROUP BY，不要对 tags 字段用 LIKE。
+   - 各标签数量 -> `SELECT tag, COUNT(*) AS cnt FROM feedback_tags GROUP BY tag ORDER BY cnt DESC`
+   - 包含 '答非所问' 的数量 -> `SELECT COUNT(*) FROM feedback_tags WHERE tag = '答非所问'`
+   - 需要评分 / 时间条件时再 JOIN -> `FROM feedback_tags t JOIN feedbacks f ON f.id = t.feedback_id WHERE f.created_at >= ...`
+3. 只涉及 日期 / 评分 / 标签 的统计 (满意度、数量、分布、按天趋势)：优先查汇总表，用 SUM(feedback_count) 聚合，不要扫原始表。
+   - 满意度 -> `SELECT SUM(CASE WHEN rating = 1 THEN feedback_count ELSE 0 END) / SUM(feedback_count) FROM feedback_daily_stats WHERE day >= ...`
+   - 每日反馈趋势 -> `SELECT day, SUM(feedback_count) FROM feedback_daily_stats WHERE day >= ... GROUP BY day ORDER BY day`
+   - 标签分布 -> `SELECT tag, SUM(feedback_count) AS cnt FROM feedback_daily_tag_stats WHERE day >= ... GROUP BY tag ORDER BY cnt DESC`
+   - 注意：一条反馈可能有多个标签，反馈总数只能从 feedback_daily_stats 计算。
+   - 需要具体问题 / 评论内容，或按小时等更细粒度统计时，再查 feedbacks / feedback_tags。
+4. 表名必须使用复数 `feedbacks` / `feedback_tags`。
 """
 
 # 2. 定义 System Prompt 模板
@@ -131,6 +159,7 @@ TOOL_DESC_LOOKUP_POLICY = """
 【查文档工具】
 当用户询问公司的规章制度、合同细节、项目内容、请假流程等非结构化文本信息时，必须使用此工具。
 输入：具体的查询问题（例如："CG2023合同的金额是多少"）。
+可选过滤：file_name (文件名或编号)、source_type、uploaded_after / uploaded_before (YYYY-MM-DD)，只在问题明确指向时填写。
 """
 
 # SQL 工具的描述
@@ -186,4 +215,27 @@ AI助手: 您需要填写申请表...
 
 --> 改写后:
 """
-)
\ No newline at end of file
+)
+
+# 会话历史压缩 (Rolling Summary) Prompt
+# 由便宜的小模型在后台执行，把较早的对话折叠进摘要，保证长会话的 Prompt 长度不再增长
+HISTORY_SUMMARY_TEMPLATE = PromptTemplate(
+    input_variables=["previous_summary", "new_messages", "max_chars"],
+    template="""
+你是对话记录整理助手。请把【已有摘要】和【新增对话】合并成一份新的对话摘要。
+
+【要求】
+1. 保留用户关心的核心实体和事实（如制度名称、合同编号、日期、数字结论）。
+2. 保留尚未解决的问题和用户的偏好。
+3. 删除寒暄、重复内容和格式标记（如 <<CHART_DATA>>、<<SUGGESTIONS>>）。
+4. 不超过 {max_chars} 字，直接输出摘要正文，不要加标题。
+
+【已有摘要】
+{previous_summary}
+
+【新增对话】
+{new_messages}
+
+--> 新摘要:
+"""
+)
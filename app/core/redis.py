@@ -1,10 +1,11 @@
 # app/core/redis.py
 # Redis 连接 (用于任务队列 & 会话历史)
 import redis
+import redis.asyncio as aioredis
 import json
-from typing import List, Dict
+from typing import List, Dict, Optional
 import os
-from llama_index.core.llms import ChatMessage
+from app.core.config import get_settings
 
 # 简单封装，生产环境建议把 host/port 放入 config.py
 REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
@@ -20,32 +21,141 @@ class RedisManager:
             db=0, 
             decode_responses=True # decode_responses=True，自动解码响应结果。不用每次取数据都手动 decode 一下
         )
+        # 异步客户端：给 async handler / 缓存使用，避免同步 IO 卡住事件循环
+        self.aclient = aioredis.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            password=REDIS_PASSWORD,
+            db=0,
+            decode_responses=True
+        )
         self.ttl = 3600  # 1小时过期
 
     def get_client(self):
         return self.client
 
-    def get_chat_history(self, session_id: str) -> List[Dict]:
-        key = f"chat_session:{session_id}"
-        raw = self.client.get(key)
-        if raw:
-            try:
-                return json.loads(raw)
-            except:
-                return []
-        return []
-    def save_chat_history(self, session_id: str, history: List[Dict]):
-        key = f"chat_session:{session_id}"
-        self.client.setex(
-            name=key,
-            time=self.ttl,
-            value=json.dumps(history, ensure_ascii=False)
-        )
+    def get_async_client(self):
+        return self.aclient
 
 # 单例模式
 redis_manager = RedisManager()
 
 
+# 按绝对位置裁掉已压缩的前缀：seq 是累计追加过的消息数，列表头部的绝对位置 = seq - LLEN。
+# append 的 LTRIM 可能已经从左边裁掉了一部分，这里只裁剩下的，不会误删新消息
+_REPLACE_PREFIX_LUA = """
+local seq = tonumber(redis.call('GET', KEYS[3]) or '0')
+local head = seq - redis.call('LLEN', KEYS[1])
+local drop = tonumber(ARGV[1]) - head
+if drop > 0 then
+    redis.call('LTRIM', KEYS[1], drop, -1)
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+return drop
+"""
+
+
+class ChatHistoryStore:
+    """
+    异步会话历史 (追加写)：
+    - 每条消息是 Redis List 里的一个元素，新一轮对话只 RPUSH 两条，不再整体重写 JSON
+    - LTRIM 在服务端截断长度，EXPIRE 刷新过期时间，和 RPUSH 一起在一个 pipeline 里一次往返完成
+    - 读取时只 LRANGE 需要的尾部
+    - 更早的对话被压缩成滚动摘要，存在旁边的 chat_summary:{id}，和列表一起续期
+    - chat_history_seq:{id} 记录累计追加的消息数，压缩时用绝对位置定位要裁掉的前缀
+    """
+    PREFIX = "chat_history"
+    SUMMARY_PREFIX = "chat_summary"
+    SEQ_PREFIX = "chat_history_seq"
+
+    def __init__(self, manager: RedisManager, max_messages: int, ttl: int):
+        self.manager = manager
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self._replace_script = None
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.PREFIX}:{session_id}"
+
+    def _seq_key(self, session_id: str) -> str:
+        return f"{self.SEQ_PREFIX}:{session_id}"
+
+    def _summary_key(self, session_id: str) -> str:
+        return f"{self.SUMMARY_PREFIX}:{session_id}"
+
+    @staticmethod
+    def _decode(raw_items) -> List[Dict]:
+        history = []
+        for raw in raw_items:
+            try:
+                history.append(json.loads(raw))
+            except (TypeError, ValueError):
+                continue
+        return history
+
+    async def get_tail(self, session_id: str, last_n: Optional[int] = None) -> List[Dict]:
+        """读取最近 last_n 条消息 (None 表示全部)"""
+        start = -last_n if last_n else 0
+        raw_items = await self.manager.get_async_client().lrange(self._key(session_id), start, -1)
+        return self._decode(raw_items)
+
+    async def get_context(self, session_id: str, last_n: Optional[int] = None):
+        """一次往返同时取回 (滚动摘要, 最近 last_n 条消息)"""
+        start = -last_n if last_n else 0
+        pipe = self.manager.get_async_client().pipeline(transaction=False)
+        pipe.get(self._summary_key(session_id))
+        pipe.lrange(self._key(session_id), start, -1)
+        summary, raw_items = await pipe.execute()
+        return summary or "", self._decode(raw_items)
+
+    async def get_snapshot(self, session_id: str):
+        """
+        压缩用：原子地取回 (滚动摘要, 全部消息, 列表头部的绝对位置)。
+        绝对位置之后传给 replace_prefix_with_summary，期间有追加 / 裁剪也能正确定位
+        """
+        pipe = self.manager.get_async_client().pipeline(transaction=True)
+        pipe.get(self._summary_key(session_id))
+        pipe.lrange(self._key(session_id), 0, -1)
+        pipe.get(self._seq_key(session_id))
+        summary, raw_items, seq = await pipe.execute()
+        return summary or "", self._decode(raw_items), int(seq or 0) - len(raw_items)
+
+    async def replace_prefix_with_summary(self, session_id: str, folded_until: int, summary: str):
+        """
+        把绝对位置 folded_until 之前的消息替换成新摘要 (Lua 脚本内一次完成，和 append 互不穿插)。
+        压缩期间 append 的 LTRIM 已经裁掉的部分不会重复裁剪
+        """
+        if self._replace_script is None:
+            self._replace_script = self.manager.get_async_client().register_script(_REPLACE_PREFIX_LUA)
+        await self._replace_script(
+            keys=[self._key(session_id), self._summary_key(session_id), self._seq_key(session_id)],
+            args=[folded_until, summary, self.ttl],
+        )
+
+    async def append(self, session_id: str, messages: List[Dict]):
+        if not messages:
+            return
+        key = self._key(session_id)
+        pipe = self.manager.get_async_client().pipeline(transaction=True)
+        pipe.rpush(key, *[json.dumps(m, ensure_ascii=False) for m in messages])
+        pipe.incrby(self._seq_key(session_id), len(messages))
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.expire(key, self.ttl)
+        pipe.expire(self._seq_key(session_id), self.ttl)
+        pipe.expire(self._summary_key(session_id), self.ttl)
+        await pipe.execute()
+
+
+_settings = get_settings()
+chat_history_store = ChatHistoryStore(
+    redis_manager,
+    max_messages=_settings.CHAT_HISTORY_MAX_MESSAGES,
+    ttl=_settings.CHAT_HISTORY_TTL_SECONDS,
+)
+
+
 
 # # 初始化 Redis (建议放在全局或单独的 config 文件)
 # def get_chat_history(x_session_id: str = Header(..., alias="X-Session-ID")) -> List[ChatMessage]:
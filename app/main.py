@@ -1,5 +1,6 @@
 # app/main.py
 import os
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -10,6 +11,9 @@ from fastapi.staticfiles import StaticFiles
 from app.api.routers import router as api_router
 from app.utils.database import engine, Base
 from app.core.config import get_settings
+from app.services.llm_factory import ModelFactory
+from app.services.warmup import run_warmup, warmup_state
+from app.services.prompt_registry import prompt_registry
 
 
 
@@ -35,16 +39,24 @@ async def lifespan(app: FastAPI):
             await conn.run_sync(Base.metadata.create_all)
         print("✅ MySQL 表结构已同步")
         
-        # 2. 这里可以预加载模型 (可选，因为 Factory 是懒加载的)
-        # ModelFactory.get_embed_model()
-      
-        
     except Exception as e:
         print(f"❌ 启动初始化失败: {e}")
+
+    # 2. Prompt 后台定时刷新 (Langfuse 上改了 Prompt 不用重启服务)
+    prompt_registry.start()
+
+    # 3. 预热模型和 Index (可选，WARMUP_ON_STARTUP=true 开启)
+    # 在后台进行，服务照常启动；完成前 /ready 返回 503
+    warmup_task = asyncio.create_task(run_warmup()) if warmup_state.enabled else None
     
     yield
     
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
     print("🛑 服务正在关闭...")
+    await prompt_registry.stop()
+    # 释放共享的 Keep-Alive 连接池
+    await ModelFactory.aclose()
 
 app = FastAPI(title="RAG Intelligent Assistant", lifespan=lifespan)
 
@@ -69,6 +81,12 @@ async def validation_exception_handler(request, exc):
 # 注册路由
 app.include_router(api_router, prefix="/api")
 
+# 就绪探针：给负载均衡 / K8s readinessProbe 使用
+@app.get("/ready")
+async def readiness():
+    status_code = 200 if warmup_state.ready else 503
+    return JSONResponse(status_code=status_code, content=warmup_state.to_dict())
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
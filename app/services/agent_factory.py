@@ -0,0 +1,92 @@
+# app/services/agent_factory.py
+# Agent 缓存：按 rag-core-system 的 Prompt 版本缓存 AgentExecutor，Prompt 更新时后台重建并原子替换
+import asyncio
+import threading
+from typing import List
+from app.services.llm_factory import ModelFactory
+from app.services.prompt_registry import prompt_registry
+
+SYSTEM_PROMPT_NAME = "rag-core-system"
+
+
+class AgentFactory:
+    # (prompt_version, agent_executor)，整体替换保证原子性
+    _cached = None
+    _lock = threading.Lock()
+    # 热路径发现版本落后时触发的后台重建 (同一时间只有一个)
+    _rebuild_task = None
+
+    @classmethod
+    def _build(cls, langfuse_prompt):
+        from langchain.agents import AgentExecutor, create_tool_calling_agent
+        from langchain_core.messages import SystemMessage
+        from langchain_core.prompts import ChatPromptTemplate
+        from app.core.prompts import DB_SCHEMA_TEXT, CORE_SYSTEM_PROMPT
+        from app.tools.policy_tool import lookup_policy_doc
+        from app.tools.sql_tool import query_business_data
+
+        # 1. 编译 System Prompt (CMS 模式，拿不到时使用本地兜底)
+        final_system_prompt_str = None
+        if langfuse_prompt is not None:
+            try:
+                final_system_prompt_str = langfuse_prompt.compile(schema=DB_SCHEMA_TEXT)
+            except Exception as e:
+                print(f"⚠️ Prompt 编译失败: {e}")
+        if final_system_prompt_str is None:
+            final_system_prompt_str = CORE_SYSTEM_PROMPT.format()
+
+        # 2. 构建 Agent
+        tools = [lookup_policy_doc, query_business_data]
+        prompt = ChatPromptTemplate.from_messages([
+            SystemMessage(content=final_system_prompt_str),
+            ("placeholder", "{chat_history}"),
+            ("human", "{input}"),
+            ("placeholder", "{agent_scratchpad}"),
+        ])
+        agent = create_tool_calling_agent(ModelFactory.get_llm(), tools, prompt)
+        return AgentExecutor(agent=agent, tools=tools, verbose=True)
+
+    @classmethod
+    def rebuild(cls):
+        langfuse_prompt = prompt_registry.get(SYSTEM_PROMPT_NAME)
+        version = prompt_registry.version(SYSTEM_PROMPT_NAME) or "local"
+        with cls._lock:
+            if cls._cached is not None and cls._cached[0] == version:
+                return cls._cached[1]
+            executor = cls._build(langfuse_prompt)
+            cls._cached = (version, executor)
+        print(f"🤖 [AgentFactory] Agent 已构建 (Prompt 版本: {version})")
+        return executor
+
+    @classmethod
+    def get_agent_executor(cls):
+        """
+        热路径：永远不等重建。
+        已有缓存时即使 Prompt 版本变了也先返回旧 Agent，由 _on_prompt_update 在后台重建后替换；
+        只有进程里还没有任何 Agent 时才同步构建
+        """
+        cached = cls._cached
+        if cached is None:
+            return cls.rebuild()
+        # 版本落后且后台没有在重建 (例如上次重建失败)：补一个后台重建，本次仍用旧 Agent
+        if cached[0] != (prompt_registry.version(SYSTEM_PROMPT_NAME) or "local"):
+            cls._schedule_rebuild()
+        return cached[1]
+
+    @classmethod
+    def _schedule_rebuild(cls):
+        if cls._rebuild_task is not None and not cls._rebuild_task.done():
+            return
+        try:
+            cls._rebuild_task = asyncio.get_running_loop().create_task(asyncio.to_thread(cls.rebuild))
+        except RuntimeError:
+            pass  # 不在事件循环里 (线程池调用)，等下一次请求
+
+
+async def _on_prompt_update(changed: List[str]):
+    # 只有 Agent 已经被用过 (说明这个进程在服务 Chat) 才需要重建；重建期间热路径继续用旧 Agent
+    if SYSTEM_PROMPT_NAME in changed and AgentFactory._cached is not None:
+        await asyncio.to_thread(AgentFactory.rebuild)
+
+
+prompt_registry.add_listener(_on_prompt_update)
@@ -0,0 +1,122 @@
+# app/services/code_lookup.py
+# 编号类查询快速通道：订单号 / 工号 / 合同编号这类查询本质是精确匹配，
+# 不需要稠密向量 Embedding，也不需要 Cross-Encoder 重排
+import re
+from typing import List, Optional
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# 同时包含字母和数字的 token (CG2023、HT-2024-001、EMP_0042)，或 6 位以上纯数字 (订单号)
+_CODE_PATTERN = re.compile(
+    r"(?<![A-Za-z0-9])(?:(?=[A-Za-z0-9_-]*\d)(?=[A-Za-z0-9_-]*[A-Za-z])[A-Za-z0-9][A-Za-z0-9_-]{2,31}|\d{6,20})(?![A-Za-z0-9])"
+)
+CODES_METADATA_KEY = "codes"
+MAX_CODES_PER_CHUNK = 50
+
+
+def normalize_code(code: str) -> str:
+    """CG-2023 / cg_2023 / CG2023 统一成 CG2023"""
+    return re.sub(r"[-_]", "", code).upper()
+
+
+def extract_codes(text: str, limit: int = MAX_CODES_PER_CHUNK) -> List[str]:
+    codes = []
+    for match in _CODE_PATTERN.finditer(text or ""):
+        code = normalize_code(match.group(0))
+        if code not in codes:
+            codes.append(code)
+            if len(codes) >= limit:
+                break
+    return codes
+
+
+def tag_codes(nodes: List):
+    """入库时给切片打上编号标签 (codes 字段有 keyword payload 索引)，不参与 Embedding / 不喂给 LLM"""
+    for node in nodes:
+        node.metadata[CODES_METADATA_KEY] = extract_codes(node.get_content(metadata_mode="none"))
+        node.excluded_embed_metadata_keys.append(CODES_METADATA_KEY)
+        node.excluded_llm_metadata_keys.append(CODES_METADATA_KEY)
+
+
+class CodeLookup:
+    def __init__(self, max_candidates: int):
+        self.max_candidates = max_candidates
+        self._aclient = None
+
+    # qdrant_client 按需导入
+    def _get_aclient(self):
+        if self._aclient is None:
+            import qdrant_client
+            self._aclient = qdrant_client.AsyncQdrantClient(**settings.QDRANT_CLIENT_KWARGS)
+        return self._aclient
+
+    async def lookup(self, vector_store, codes: List[str], payload_filter=None, top_n: int = 3) -> List:
+        """
+        纯 payload 过滤 (codes MatchAny)，不做任何模型推理；
+        候选按编号在正文中出现的次数打分 (出现越多越可能是"讲这个编号"的段落)
+        """
+        from qdrant_client import models
+        from llama_index.core.schema import NodeWithScore
+
+        must = [models.FieldCondition(key=CODES_METADATA_KEY, match=models.MatchAny(any=codes))]
+        if payload_filter is not None:
+            must.append(payload_filter)
+        records, _ = await self._get_aclient().scroll(
+            collection_name=settings.COLLECTION_NAME,
+            scroll_filter=models.Filter(must=must),
+            limit=self.max_candidates,
+            with_payload=True,
+            with_vectors=False,
+        )
+        if not records:
+            return []
+
+        result = vector_store.parse_to_query_result(records)
+        scored = []
+        for node in result.nodes:
+            text = normalize_code(node.get_content(metadata_mode="none"))
+            hits = sum(text.count(code) for code in codes)
+            scored.append(NodeWithScore(node=node, score=float(hits)))
+        scored.sort(key=lambda n: n.score, reverse=True)
+        return scored[:top_n]
+
+    async def sparse_only(self, vector_store, query: str, top_k: int, payload_filter=None,
+                          search_params=None) -> List:
+        """只走稀疏向量 (关键词) 检索：跳过稠密 Embedding，适合旧切片还没有 codes 标签的情况"""
+        from llama_index.core.schema import NodeWithScore
+        from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryMode
+
+        result = await vector_store.aquery(
+            VectorStoreQuery(
+                query_str=query,
+                mode=VectorStoreQueryMode.SPARSE,
+                similarity_top_k=top_k,
+                sparse_top_k=top_k,
+            ),
+            qdrant_filters=payload_filter,
+            search_params=search_params,
+        )
+        return [
+            NodeWithScore(node=node, score=score)
+            for node, score in zip(result.nodes or [], result.similarities or [])
+        ]
+
+
+# 单例模式
+code_lookup = CodeLookup(max_candidates=settings.CODE_LOOKUP_MAX_CANDIDATES)
+
+
+def route_codes(query: str) -> Optional[List[str]]:
+    """
+    只有"裸编号"查询 (整句就是一个或几个编号，例如 "CG2023" / "HT-2024-001, EMP_0042") 返回编号，否则返回 None。
+    "CG2023合同的金额是多少" 这类自然语言问题即使带编号也走常规混合检索 + 重排：
+    按编号出现次数排序找不到回答问题的那一段
+    """
+    if not settings.CODE_FAST_PATH_ENABLED:
+        return None
+    tokens = [t for t in re.split(r"[\s,，;；、]+", query.strip()) if t]
+    if not tokens or not all(_CODE_PATTERN.fullmatch(t) for t in tokens):
+        return None
+    return extract_codes(" ".join(tokens)) or None
@@ -0,0 +1,93 @@
+# app/services/doc_parser.py
+# 隔离解析：每个文件在独立子进程里解析，带超时和内存上限
+# 单个畸形 PDF 卡死 / 内存爆掉时只会杀掉自己的子进程，不影响整批任务和 Worker 本身
+import time
+import queue
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, List
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# 批量上传里允许解析的扩展名 (SimpleDirectoryReader 支持的常见文档类型)
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".doc", ".txt", ".md", ".csv", ".pptx", ".xlsx", ".html", ".htm", ".epub"}
+
+
+class ParseError(Exception):
+    pass
+
+
+def _parse_worker(file_path: str, memory_mb: int, result_queue):
+    """子进程入口：先设内存上限，再用 SimpleDirectoryReader 解析"""
+    try:
+        if memory_mb > 0:
+            import resource
+            limit = memory_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        from llama_index.core import SimpleDirectoryReader
+        documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
+        result_queue.put(("ok", documents))
+    except MemoryError:
+        result_queue.put(("error", f"解析超过内存上限 ({memory_mb} MB)"))
+    except Exception as e:
+        result_queue.put(("error", f"{type(e).__name__}: {e}"))
+
+
+def parse_isolated(file_path: str, timeout: float = None, memory_mb: int = None) -> List:
+    """在子进程里解析单个文件；超时则强制终止子进程并抛出 ParseError"""
+    timeout = timeout or settings.INGEST_PARSE_TIMEOUT_SECONDS
+    memory_mb = settings.INGEST_PARSE_MEMORY_MB if memory_mb is None else memory_mb
+
+    # spawn：子进程不继承父进程里已加载的模型 / 线程 / Redis 连接
+    ctx = mp.get_context("spawn")
+    result_queue = ctx.Queue(maxsize=1)
+    proc = ctx.Process(target=_parse_worker, args=(file_path, memory_mb, result_queue), daemon=True)
+    proc.start()
+    deadline = time.monotonic() + timeout
+    try:
+        # 必须先读队列再 join，否则大结果会卡在管道里导致子进程无法退出
+        while True:
+            try:
+                status, payload = result_queue.get(timeout=1)
+                break
+            except queue.Empty:
+                if not proc.is_alive():
+                    try:
+                        # 子进程可能刚好在两次检查之间写完结果并退出
+                        status, payload = result_queue.get(timeout=1)
+                        break
+                    except queue.Empty:
+                        # 被 OOM Killer 杀掉 / 段错误等，没来得及回传结果
+                        raise ParseError(f"解析进程异常退出 (exitcode={proc.exitcode})")
+                if time.monotonic() > deadline:
+                    proc.kill()
+                    raise ParseError(f"解析超时 ({timeout:.0f}s)")
+    finally:
+        proc.join(timeout=5)
+        if proc.is_alive():
+            proc.kill()
+        result_queue.close()
+
+    if status != "ok":
+        raise ParseError(payload)
+    return payload
+
+
+def parse_many(file_paths: Iterable[str], on_result: Callable[[str, List, Exception], None],
+               processes: int = None):
+    """
+    最多 processes 个子进程并行解析；每个文件解析完立即回调 on_result(path, documents, error)，
+    回调在调用方线程里串行执行 (Embedding / 写库不需要额外加锁)。
+    """
+    processes = processes or settings.INGEST_PARSE_PROCESSES
+    with ThreadPoolExecutor(max_workers=processes, thread_name_prefix="doc-parse") as executor:
+        futures = {executor.submit(parse_isolated, path): path for path in file_paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                documents, error = future.result(), None
+            except Exception as e:
+                documents, error = [], e
+            on_result(path, documents, error)
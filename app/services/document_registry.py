@@ -0,0 +1,195 @@
+# app/services/document_registry.py
+# 文档登记表 (Redis)：入库时维护，/files 直接分页读取，不再扫描 Qdrant
+import re
+import time
+from typing import Dict, List, Optional
+
+from app.core.redis import redis_manager
+
+
+class DocumentRegistry:
+    """
+    - ingest:doc:{file_name}      Hash，每个逻辑文档一条 (按文件名)：
+                                  file_hash / file_path / file_url / size_bytes / chunk_count /
+                                  status / task_id / uploaded_at / indexed_at / error
+    - ingest:docs:{sort_field}    ZSET 排序索引，分页只需 ZRANGE (O(log N + 页大小))；
+                                  name 索引分数全为 0，同分时 Redis 按成员字典序排列
+    file_hash / file_path 只在入库成功后更新，代表"当前已入库的版本" (去重判断依赖它)。
+    """
+    PREFIX = "ingest:doc"
+    INDEX_PREFIX = "ingest:docs"
+    SORT_FIELDS = ("uploaded_at", "name", "size_bytes", "chunk_count")
+
+    def __init__(self, manager=redis_manager):
+        self.manager = manager
+
+    def key(self, file_name: str) -> str:
+        return f"{self.PREFIX}:{file_name}"
+
+    def _index_key(self, field: str) -> str:
+        return f"{self.INDEX_PREFIX}:{field}"
+
+    # ---------- 写入 (同步，入库 Worker / 上传接口调用) ----------
+    def indexed_hash(self, file_name: str) -> Optional[str]:
+        return self.manager.get_client().hget(self.key(file_name), "file_hash")
+
+    def indexed_path(self, file_name: str) -> Optional[str]:
+        return self.manager.get_client().hget(self.key(file_name), "file_path")
+
+    def mark_uploaded(self, file_name: str, size_bytes: int, task_id: str):
+        pipe = self.manager.get_client().pipeline(transaction=True)
+        self.queue_uploaded(pipe, file_name, size_bytes, task_id)
+        pipe.execute()
+
+    def queue_uploaded(self, pipe, file_name: str, size_bytes: int, task_id: str):
+        """把 mark_uploaded 的写入追加到调用方的 pipeline (同步 / 异步均可)，由调用方统一 execute"""
+        now = time.time()
+        pipe.hset(self.key(file_name), mapping={
+            "file_name": file_name,
+            "status": "pending",
+            "task_id": task_id,
+            "uploaded_at": now,
+            "pending_size_bytes": size_bytes,
+        })
+        pipe.hdel(self.key(file_name), "error")
+        pipe.zadd(self._index_key("uploaded_at"), {file_name: now})
+        pipe.zadd(self._index_key("name"), {file_name: 0})
+        # 新文档还没有入库版本：先用这次上传的大小参与排序
+        pipe.zadd(self._index_key("size_bytes"), {file_name: size_bytes}, nx=True)
+        pipe.zadd(self._index_key("chunk_count"), {file_name: 0}, nx=True)
+
+    def mark_status(self, file_name: str, status: str, error: str = None):
+        mapping = {"status": status}
+        if error is not None:
+            mapping["error"] = error[:500]
+        self.manager.get_client().hset(self.key(file_name), mapping=mapping)
+
+    def mark_indexed(self, file_name: str, file_hash: str, file_path: str, file_url: str,
+                     size_bytes: int, chunk_count: int):
+        pipe = self.manager.get_client().pipeline(transaction=True)
+        pipe.hset(self.key(file_name), mapping={
+            "file_name": file_name,
+            "file_hash": file_hash,
+            "file_path": file_path,
+            "file_url": file_url,
+            "size_bytes": size_bytes,
+            "chunk_count": chunk_count,
+            "status": "indexed",
+            "indexed_at": time.time(),
+        })
+        pipe.hdel(self.key(file_name), "error", "pending_size_bytes")
+        pipe.zadd(self._index_key("name"), {file_name: 0})
+        pipe.zadd(self._index_key("size_bytes"), {file_name: size_bytes})
+        pipe.zadd(self._index_key("chunk_count"), {file_name: chunk_count})
+        # 回填的旧文档没有上传时间，用入库时间代替
+        pipe.zadd(self._index_key("uploaded_at"), {file_name: time.time()}, nx=True)
+        pipe.execute()
+
+    # ---------- 读取 (异步，/files 接口 / 上传接口) ----------
+    async def aindexed_hashes(self, file_names: List[str]) -> Dict[str, Optional[str]]:
+        """一次往返取回多个文档当前已入库版本的哈希"""
+        if not file_names:
+            return {}
+        pipe = self.manager.get_async_client().pipeline(transaction=False)
+        for name in file_names:
+            pipe.hget(self.key(name), "file_hash")
+        return dict(zip(file_names, await pipe.execute()))
+
+    async def list(self, sort: str = "uploaded_at", order: str = "desc",
+                   page: int = 1, page_size: int = 20) -> Dict:
+        if sort not in self.SORT_FIELDS:
+            raise ValueError(f"sort 只能是 {', '.join(self.SORT_FIELDS)}")
+        client = self.manager.get_async_client()
+        index_key = self._index_key(sort)
+        start = (page - 1) * page_size
+        names = await client.zrange(index_key, start, start + page_size - 1, desc=(order == "desc"))
+
+        pipe = client.pipeline(transaction=False)
+        pipe.zcard(index_key)
+        for name in names:
+            pipe.hgetall(self.key(name))
+        total, *rows = await pipe.execute()
+        return {"total": total, "items": [self._format(row) for row in rows if row]}
+
+    async def resolve_names(self, fragment: str, limit: int = 20) -> List[str]:
+        """
+        把 "CG2023合同" 这类模糊说法解析成登记表里的真实文件名：
+        完全匹配优先，否则按 (忽略大小写的) 子串匹配；开销与文档数 (而不是切片数) 成正比
+        """
+        client = self.manager.get_async_client()
+        fragment = fragment.strip()
+        if not fragment:
+            return []
+        if await client.zscore(self._index_key("name"), fragment) is not None:
+            return [fragment]
+        needle = fragment.lower()
+        # 子串匹配不到时，退化为"包含全部编号 / 英文词" (例如 "CG2023合同" → CG2023采购合同.pdf)
+        tokens = [t.lower() for t in re.findall(r"[A-Za-z0-9]{2,}", fragment)]
+        substring, by_tokens = [], []
+        async for name, _ in client.zscan_iter(self._index_key("name"), count=500):
+            lowered = name.lower()
+            if needle in lowered:
+                substring.append(name)
+                if len(substring) >= limit:
+                    break
+            elif tokens and all(t in lowered for t in tokens):
+                by_tokens.append(name)
+        return substring or by_tokens[:limit]
+
+    @staticmethod
+    def _format(row: Dict) -> Dict:
+        size = row.get("size_bytes") or row.get("pending_size_bytes") or 0
+        return {
+            "file_name": row.get("file_name"),
+            "status": row.get("status"),
+            "chunk_count": int(row.get("chunk_count") or 0),
+            "size_bytes": int(float(size)),
+            "uploaded_at": float(row["uploaded_at"]) if row.get("uploaded_at") else None,
+            "indexed_at": float(row["indexed_at"]) if row.get("indexed_at") else None,
+            "file_url": row.get("file_url"),
+            "error": row.get("error"),
+        }
+
+    # ---------- 回填 (一次性，登记表上线前已入库的文档) ----------
+    def backfill_from_qdrant(self, client, collection_name: str) -> int:
+        """全量 scroll 一次知识库集合，按 file_name 统计切片数后写入登记表"""
+        counts: Dict[str, int] = {}
+        meta: Dict[str, Dict] = {}
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=collection_name,
+                limit=1024,
+                offset=offset,
+                with_payload=["file_name", "file_hash", "source_url"],
+                with_vectors=False,
+            )
+            for point in points:
+                payload = point.payload or {}
+                name = payload.get("file_name")
+                if not name:
+                    continue
+                counts[name] = counts.get(name, 0) + 1
+                meta.setdefault(name, payload)
+            if offset is None:
+                break
+
+        existing: List[str] = []
+        for name, count in counts.items():
+            if self.manager.get_client().hget(self.key(name), "status") == "indexed":
+                existing.append(name)
+                continue
+            payload = meta[name]
+            self.mark_indexed(
+                file_name=name,
+                file_hash=payload.get("file_hash", ""),
+                file_path="",
+                file_url=payload.get("source_url", ""),
+                size_bytes=0,
+                chunk_count=count,
+            )
+        return len(counts) - len(existing)
+
+
+# 单例模式
+document_registry = DocumentRegistry()
@@ -0,0 +1,202 @@
+# app/services/embedding_cache.py
+# 查询向量缓存：BGE-large 在 CPU 上编码一次查询要几百毫秒，
+# 同一轮 Agent 内的重复调用、不同用户的相同问题都不应该重复计算。
+import base64
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+from app.core.redis import redis_manager
+
+
+def _encode_vector(vector: List[float]) -> str:
+    # float32 二进制再 base64，比 JSON 小 3~4 倍 (Redis 客户端开了 decode_responses，只能存字符串)
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode("ascii")
+
+
+def _decode_vector(raw: str) -> List[float]:
+    return np.frombuffer(base64.b64decode(raw), dtype=np.float32).tolist()
+
+
+def cache_namespace(model_path: str, backend: str, quantized: bool = False) -> str:
+    """
+    同一个模型在不同推理后端 (torch / onnx fp32 / onnx int8) 下算出的向量有细微差别，
+    namespace 里带上后端，切换后端后不会读到另一套向量
+    """
+    if backend == "onnx":
+        backend = "onnx-int8" if quantized else "onnx-fp32"
+    return f"{model_path}|{backend}"
+
+
+class EmbeddingCache:
+    """
+    两级缓存：
+    - L1: 进程内 LRU (OrderedDict)，容量 max_entries
+    - L2: Redis (可选)，多个 worker 共享，带 TTL
+    """
+    PREFIX = "query_embed"
+
+    def __init__(self, namespace: str, max_entries: int, use_redis: bool = False, ttl: int = 86400):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.use_redis = use_redis
+        self.ttl = ttl
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()  # 会在线程池里被并发访问
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _key(self, query: str) -> str:
+        digest = hashlib.sha256(f"{self.namespace}\x1f{query.strip()}".encode("utf-8")).hexdigest()
+        return f"{self.PREFIX}:{digest}"
+
+    def _get_local(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+            return vector
+
+    def _put_local(self, key: str, vector: List[float]):
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def _record_redis_hit(self):
+        with self._lock:
+            self.redis_hits += 1
+
+    def get(self, query: str) -> Optional[List[float]]:
+        key = self._key(query)
+        vector = self._get_local(key)
+        if vector is not None:
+            return vector
+        if self.use_redis:
+            try:
+                raw = redis_manager.get_client().get(key)
+                if raw:
+                    vector = _decode_vector(raw)
+                    self._put_local(key, vector)
+                    self._record_redis_hit()
+                    return vector
+            except Exception as e:
+                print(f"⚠️ [EmbedCache] Redis 读取失败: {e}")
+        self._record_miss()
+        return None
+
+    async def aget(self, query: str) -> Optional[List[float]]:
+        key = self._key(query)
+        vector = self._get_local(key)
+        if vector is not None:
+            return vector
+        if self.use_redis:
+            try:
+                raw = await redis_manager.get_async_client().get(key)
+                if raw:
+                    vector = _decode_vector(raw)
+                    self._put_local(key, vector)
+                    self._record_redis_hit()
+                    return vector
+            except Exception as e:
+                print(f"⚠️ [EmbedCache] Redis 读取失败: {e}")
+        self._record_miss()
+        return None
+
+    def put(self, query: str, vector: List[float]):
+        key = self._key(query)
+        self._put_local(key, vector)
+        if self.use_redis:
+            try:
+                redis_manager.get_client().set(key, _encode_vector(vector), ex=self.ttl)
+            except Exception as e:
+                print(f"⚠️ [EmbedCache] Redis 写入失败: {e}")
+
+    async def aput(self, query: str, vector: List[float]):
+        key = self._key(query)
+        self._put_local(key, vector)
+        if self.use_redis:
+            try:
+                await redis_manager.get_async_client().set(key, _encode_vector(vector), ex=self.ttl)
+            except Exception as e:
+                print(f"⚠️ [EmbedCache] Redis 写入失败: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.hits + self.redis_hits
+            total = hits + self.misses
+            return {
+                "local_hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "size": len(self._lru),
+                "max_entries": self.max_entries,
+                "redis_enabled": self.use_redis,
+                "hit_rate": round(hits / total, 4) if total else 0.0,
+            }
+
+
+class CachedQueryEmbedding(BaseEmbedding):
+    """
+    包装任意 LlamaIndex Embedding：查询向量走缓存，文档向量原样透传。
+    异步查询在线程池中计算，不再阻塞事件循环。
+    """
+    _inner: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, inner: BaseEmbedding, cache: EmbeddingCache, **kwargs):
+        super().__init__(
+            model_name=inner.model_name,
+            embed_batch_size=inner.embed_batch_size,
+            **kwargs
+        )
+        self._inner = inner
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedQueryEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        return self._inner
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        vector = self._cache.get(query)
+        if vector is None:
+            vector = self._inner.get_query_embedding(query)
+            self._cache.put(query, vector)
+        return vector
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        vector = await self._cache.aget(query)
+        if vector is None:
+            vector = await asyncio.to_thread(self._inner.get_query_embedding, query)
+            await self._cache.aput(query, vector)
+        return vector
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._inner.get_text_embedding(text)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return await self._inner.aget_text_embedding(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._inner.get_text_embedding_batch(texts)
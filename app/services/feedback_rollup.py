@@ -0,0 +1,44 @@
+# app/services/feedback_rollup.py
+# 反馈汇总表维护：趋势 / 分布类问题读几百行汇总，而不是扫几百万行原始反馈
+from typing import List
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.mysql import insert
+
+from app.core.models import FeedbackDailyStat, FeedbackDailyTagStat
+
+# 汇总表名 (写入反馈时需要一起让 SQL 结果缓存失效)
+ROLLUP_TABLES = (FeedbackDailyStat.__tablename__, FeedbackDailyTagStat.__tablename__)
+
+
+async def record_feedback(db, rating: int, tags: List[str]):
+    """
+    在 submit_feedback 的同一个事务里增量更新汇总表 (INSERT ... ON DUPLICATE KEY UPDATE +1)。
+    day 用数据库的 CURRENT_DATE，与 feedbacks.created_at 的 server_default now() 口径一致
+    """
+    day = func.current_date()
+    stmt = insert(FeedbackDailyStat).values(day=day, rating=rating, feedback_count=1)
+    await db.execute(stmt.on_duplicate_key_update(feedback_count=FeedbackDailyStat.feedback_count + 1))
+    for tag in tags:
+        stmt = insert(FeedbackDailyTagStat).values(day=day, rating=rating, tag=tag, feedback_count=1)
+        await db.execute(stmt.on_duplicate_key_update(feedback_count=FeedbackDailyTagStat.feedback_count + 1))
+
+
+async def rebuild(conn):
+    """
+    从原始表全量重建汇总 (首次上线 / 数据修复时使用)，在一个事务里完成，读到的不会是半成品。
+    重建期间新写入的反馈可能漏计或重复计，建议在低峰期执行
+    """
+    await conn.execute(text("DELETE FROM feedback_daily_tag_stats"))
+    await conn.execute(text("DELETE FROM feedback_daily_stats"))
+    await conn.execute(text(
+        "INSERT INTO feedback_daily_stats (day, rating, feedback_count) "
+        "SELECT DATE(created_at), rating, COUNT(*) FROM feedbacks "
+        "WHERE created_at IS NOT NULL GROUP BY DATE(created_at), rating"
+    ))
+    await conn.execute(text(
+        "INSERT INTO feedback_daily_tag_stats (day, rating, tag, feedback_count) "
+        "SELECT DATE(f.created_at), f.rating, t.tag, COUNT(*) "
+        "FROM feedback_tags t JOIN feedbacks f ON f.id = t.feedback_id "
+        "WHERE f.created_at IS NOT NULL GROUP BY DATE(f.created_at), f.rating, t.tag"
+    ))
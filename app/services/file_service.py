@@ -1,94 +1,393 @@
 # app/services/file_service.py
 import os
-import shutil
+import time
+import asyncio
 import uuid
-from fastapi import UploadFile, BackgroundTasks
-from llama_index.core import SimpleDirectoryReader, VectorStoreIndex
-from llama_index.core.node_parser import SentenceSplitter
+import json
+import hashlib
+import zipfile
+from typing import List, Tuple
+from fastapi import Request, BackgroundTasks
 
 from app.core.redis import redis_manager
-from app.services.rag_engine import get_index
 from app.core.config import get_settings
+from app.services.semantic_cache import semantic_cache
+from app.services.ingest_queue import ingest_queue
+from app.services.document_registry import document_registry
+from app.services.upload_stream import stream_files_to_disk, StreamedFile, UploadTooLarge, InvalidUpload
+from app.services.doc_parser import SUPPORTED_EXTENSIONS
 
 # 获取 Redis 客户端
 r = redis_manager.get_client()
 settings = get_settings()
 
-def process_file_task(task_id: str, file_path: str, original_filename: str,file_url: str):
-    """后台任务：处理文件并构建索引"""
-    try:
-        # 1. 更新状态：处理中
-        r.hset(f"task:{task_id}", mapping={
-            "status": "processing", 
-            "message": "正在解析文档..."
-        })
-        
-       # 读取文件 (从持久化路径读取)
-        new_documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
-        for doc in new_documents:
-            doc.metadata["file_name"] = original_filename
-            # 存入下载链接和类型
-            doc.metadata["source_url"] = file_url
-            doc.metadata["source_type"] = "file_download" # 标记这是可下载文件
-            # 也可以存页码 (LlamaIndex 默认会有 page_label，但为了保险可以手动检查)
-            # if "page_label" not in doc.metadata: doc.metadata["page_label"] = "1"
-        r.hset(f"task:{task_id}", mapping={"message": "正在向量化..."})
-        
-        # 3. 获取全局 Index 并插入数据
-        # 注意：这里我们调用 get_index() 获取已初始化的 Qdrant 连接
-        index = get_index() 
-        
-        # 4. 插入文档 (LlamaIndex 会自动处理 Embedding 和存储)
-        # 注意：VectorStoreIndex.from_documents 默认会创建新 index，
-        # 如果要增量更新，应该使用 index.insert_nodes 或类似的 API。
-        # 这里为了兼容旧逻辑，我们使用 insert 逻辑：
-        pipeline = SentenceSplitter(chunk_size=512, chunk_overlap=50)
-        nodes = pipeline.get_nodes_from_documents(new_documents)
-        index.insert_nodes(nodes)
-
-        # 5. 更新状态：完成
-        r.hset(f"task:{task_id}", mapping={
-            "status": "completed", 
-            "message": "索引构建完成"
+def _file_sha256(file_path: str) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _annotate(documents, original_filename: str, file_url: str, uploaded_at: float):
+    for doc in documents:
+        doc.metadata["file_name"] = original_filename
+        # 存入下载链接和类型
+        doc.metadata["source_url"] = file_url
+        doc.metadata["source_type"] = "file_download" # 标记这是可下载文件
+        # 上传时间 (时间戳)，供 lookup_policy_doc 按日期过滤；不参与 Embedding / 不喂给 LLM
+        doc.metadata["uploaded_at"] = uploaded_at
+        doc.excluded_embed_metadata_keys.append("uploaded_at")
+        doc.excluded_llm_metadata_keys.append("uploaded_at")
+        # 也可以存页码 (LlamaIndex 默认会有 page_label，但为了保险可以手动检查)
+        # if "page_label" not in doc.metadata: doc.metadata["page_label"] = "1"
+
+
+def index_documents(task_id: str, documents, original_filename: str, file_path: str, file_url: str, file_hash: str) -> str:
+    """
+    切分 → 向量化 → 入库 (单文件上传和批量上传共用)。
+    按切片哈希做增量更新：内容没变的切片直接复用，只 embed 新切片，只删除过时切片。
+    """
+    from llama_index.core.node_parser import SentenceSplitter
+    from app.services.ingest_pipeline import embed_and_upsert, tag_chunk_hashes, diff_against_index, apply_diff
+    from app.services.code_lookup import tag_codes
+
+    uploaded_at = time.time()
+    _annotate(documents, original_filename, file_url, uploaded_at)
+
+    # 1. 切分 + 计算切片哈希 + 提取编号
+    pipeline = SentenceSplitter(chunk_size=512, chunk_overlap=50)
+    nodes = pipeline.get_nodes_from_documents(documents)
+    tag_chunk_hashes(nodes, file_hash)
+    tag_codes(nodes)
+
+    # 2. 与已入库的同名文档对比，只处理变化的部分
+    fresh_nodes, obsolete_ids, kept = diff_against_index(nodes, original_filename)
+
+    # 3. 分批向量化 + 写入 Qdrant (流水线并行，进度实时写入 task:{id})
+    embed_and_upsert(fresh_nodes, task_id)
+
+    # 4. 新切片写完后再删旧切片，替换过程中检索不会出现"文档消失"的空窗
+    apply_diff(obsolete_ids, kept, {"source_url": file_url, "file_hash": file_hash, "uploaded_at": uploaded_at})
+
+    if fresh_nodes or obsolete_ids:
+        # 知识库变了，语义缓存里的旧答案可能过时，立即失效
+        semantic_cache.invalidate()
+
+    # 5. 登记最新版本 (/files 直接读登记表)；旧版本的文件已经没有切片引用，可以删除
+    old_path = document_registry.indexed_path(original_filename)
+    document_registry.mark_indexed(
+        original_filename, file_hash, file_path, file_url,
+        size_bytes=os.path.getsize(file_path), chunk_count=len(nodes),
+    )
+    if old_path and old_path != file_path and os.path.exists(old_path):
+        os.remove(old_path)
+
+    return f"新增 {len(fresh_nodes)} / 复用 {len(kept)} / 删除 {len(obsolete_ids)} 个切片"
+
+
+def ingest_file(task_id: str, file_path: str, original_filename: str, file_url: str, file_hash: str = None):
+    """
+    解析 → 切分 → 向量化 → 入库，并更新 task:{id} 状态。
+    失败时直接抛出异常，由调用方决定是重试 (Worker) 还是标记失败 (内联模式)。
+    """
+    # LlamaIndex / Qdrant 只在真正入库时才导入，API 进程启动不再为它们买单
+    from llama_index.core import SimpleDirectoryReader
+
+    file_hash = file_hash or _file_sha256(file_path)
+
+    # 1. 更新状态：处理中
+    r.hset(f"task:{task_id}", mapping={
+        "status": "processing", 
+        "message": "正在解析文档..."
+    })
+    document_registry.mark_status(original_filename, "processing")
+    
+   # 读取文件 (从持久化路径读取)
+    new_documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
+    r.hset(f"task:{task_id}", mapping={"message": "正在向量化..."})
+
+    summary = index_documents(task_id, new_documents, original_filename, file_path, file_url, file_hash)
+
+    # 更新状态：完成
+    r.hset(f"task:{task_id}", mapping={
+        "status": "completed", 
+        "message": f"索引构建完成 ({summary})"
+    })
+    r.expire(f"task:{task_id}", 3600)
+    print(f"✅ 任务 {task_id} 完成 ({summary})，文件已归档: {file_path}")
+
+
+def _file_status_json(status: str, message: str = "") -> str:
+    return json.dumps({"status": status, "message": message}, ensure_ascii=False)
+
+
+def _set_file_status(task_id: str, filename: str, status: str, message: str = ""):
+    r.hset(f"task:{task_id}:files", filename, _file_status_json(status, message))
+
+
+def ingest_batch(task_id: str, files: List[dict]):
+    """
+    批量入库：文件在子进程池里并行解析 (带超时 / 内存上限)，解析完一个就入库一个。
+    单个文件失败只记录在 task:{id}:files 里，不影响同批其他文件。
+    """
+    from app.services.doc_parser import parse_many
+
+    task_key = f"task:{task_id}"
+    by_path = {item["file_path"]: item for item in files}
+    total = len(by_path)
+    counters = {"done": 0, "failed": 0}
+    r.hset(task_key, mapping={"status": "processing", "message": f"正在解析 {total} 个文件...", "files_total": total})
+
+    def on_result(path: str, documents, error: Exception):
+        item = by_path[path]
+        name = item["original_filename"]
+        try:
+            if error is not None:
+                raise error
+            _set_file_status(task_id, name, "indexing", "正在向量化...")
+            document_registry.mark_status(name, "processing")
+            summary = index_documents(task_id, documents, name, path, item["file_url"], item["file_hash"])
+            _set_file_status(task_id, name, "completed", summary)
+            counters["done"] += 1
+        except Exception as e:
+            _set_file_status(task_id, name, "failed", str(e))
+            document_registry.mark_status(name, "failed", str(e))
+            counters["failed"] += 1
+            print(f"❌ [Batch {task_id}] {name} 失败: {e}")
+        r.hset(task_key, mapping={
+            "files_done": counters["done"],
+            "files_failed": counters["failed"],
+            "message": f"已处理 {counters['done'] + counters['failed']}/{total} 个文件",
         })
-        print(f"✅ 任务 {task_id} 完成，文件已归档: {file_path}")
 
+    parse_many(list(by_path), on_result)
+
+    status = "failed" if total and counters["failed"] == total else "completed"
+    r.hset(task_key, mapping={
+        "status": status,
+        "message": f"批量入库完成：成功 {counters['done']}，失败 {counters['failed']}",
+    })
+    r.expire(task_key, 3600)
+    r.expire(f"{task_key}:files", 3600)
+    print(f"✅ 批量任务 {task_id} 完成：成功 {counters['done']}，失败 {counters['failed']}")
+
+
+def process_file_task(task_id: str, file_path: str, original_filename: str,file_url: str, file_hash: str = None):
+    """后台任务：处理文件并构建索引 (INGEST_MODE=inline 时在 API 进程内执行)"""
+    try:
+        ingest_file(task_id, file_path, original_filename, file_url, file_hash)
     except Exception as e:
         r.hset(f"task:{task_id}", mapping={
             "status": "failed", 
             "message": str(e)
         })
+        document_registry.mark_status(original_filename, "failed", str(e))
         print(f"❌ 任务 {task_id} 失败: {e}")
     finally:
-        
-        pass 
         r.expire(f"task:{task_id}", 3600)
 
-async def handle_file_upload(file: UploadFile, background_tasks: BackgroundTasks):
+def process_batch_task(task_id: str, files: List[dict]):
+    """后台任务：批量入库 (INGEST_MODE=inline 时在 API 进程内执行)"""
+    try:
+        ingest_batch(task_id, files)
+    except Exception as e:
+        r.hset(f"task:{task_id}", mapping={"status": "failed", "message": str(e)})
+        print(f"❌ 批量任务 {task_id} 失败: {e}")
+    finally:
+        r.expire(f"task:{task_id}", 3600)
+
+async def _store_content_addressed(tmp_path: str, filename: str, file_hash: str):
+    """按内容寻址落盘：同样的内容只保存一份 (例如：3f2a...-contract.pdf)"""
+    safe_filename = f"{file_hash[:16]}-{filename}"
+    file_path = os.path.join(settings.UPLOAD_DIR, safe_filename)
+    if os.path.exists(file_path):
+        await asyncio.to_thread(os.remove, tmp_path)
+    else:
+        await asyncio.to_thread(os.replace, tmp_path, file_path)
+    # 结果类似: http://localhost:8000/static/3f2a...-contract.pdf
+    return file_path, f"{settings.API_BASE_URL}/static/{safe_filename}"
+
+
+def _extract_zip(zip_path: str, max_files: int, max_bytes: int) -> Tuple[List[StreamedFile], List[Tuple[str, str]]]:
+    """
+    解压 zip 到临时文件 (边解压边算哈希)。
+    防 zip 炸弹：按实际解压出的字节数计数 (不信任头部声明的大小)，文件数 / 总大小超限立即中止。
+    返回 (解压出的文件, [(被跳过的文件名, 原因)])
+    """
+    extracted, skipped, total_bytes = [], [], 0
+    try:
+        with zipfile.ZipFile(zip_path) as zf:
+            for info in zf.infolist():
+                if info.is_dir():
+                    continue
+                name = os.path.basename(info.filename)
+                if not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                    continue
+                if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTENSIONS:
+                    skipped.append((name, "不支持的文件类型"))
+                    continue
+                if len(extracted) >= max_files:
+                    raise InvalidUpload(f"zip 内文件数超过上限 ({max_files})")
+
+                tmp_path = os.path.join(settings.UPLOAD_DIR, f".{uuid.uuid4()}.part")
+                h = hashlib.sha256()
+                size = 0
+                extracted.append(StreamedFile(filename=name, tmp_path=tmp_path, size=0, sha256=""))
+                with zf.open(info) as src, open(tmp_path, "wb") as dst:
+                    for block in iter(lambda: src.read(1024 * 1024), b""):
+                        size += len(block)
+                        total_bytes += len(block)
+                        if total_bytes > max_bytes:
+                            raise UploadTooLarge(max_bytes)
+                        h.update(block)
+                        dst.write(block)
+                extracted[-1].size = size
+                extracted[-1].sha256 = h.hexdigest()
+    except zipfile.BadZipFile:
+        raise InvalidUpload("zip 文件已损坏或格式不正确")
+    except BaseException:
+        for item in extracted:
+            if os.path.exists(item.tmp_path):
+                os.remove(item.tmp_path)
+        raise
+    return extracted, skipped
+
+
+async def handle_file_upload(request: Request, background_tasks: BackgroundTasks):
     """Service 层入口"""
     task_id = str(uuid.uuid4())
 
-    # 🟢 1. 生成唯一文件名 (防止同名覆盖)
-    # 例如：uuid-original_name.pdf
-    safe_filename = f"{uuid.uuid4()}-{file.filename}"
-    file_path = os.path.join(settings.UPLOAD_DIR, safe_filename)
+    # 🟢 1. 流式写入临时文件，边写边算内容哈希 (超过 UPLOAD_MAX_BYTES 立即中止)
+    streamed = (await stream_files_to_disk(request, settings.UPLOAD_DIR, settings.UPLOAD_MAX_BYTES))[0]
+    file_hash = streamed.sha256
+    filename = streamed.filename
 
-    # 🟢 2. 保存到持久化目录
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # 🟢 3. 生成访问 URL
-    # 结果类似: http://localhost:8000/static/bed7...-contract.pdf
-    file_url = f"{settings.API_BASE_URL}/static/{safe_filename}"
+    # 🟢 2. 按内容寻址落盘 + 生成访问 URL
+    file_path, file_url = await _store_content_addressed(streamed.tmp_path, filename, file_hash)
+
+    # 同名文档内容完全没变：不入队，直接完成 (全部走异步 Redis，不阻塞事件循环)
+    aclient = redis_manager.get_async_client()
+    indexed = await document_registry.aindexed_hashes([filename])
+    if indexed[filename] == file_hash:
+        pipe = aclient.pipeline(transaction=True)
+        pipe.hset(f"task:{task_id}", mapping={
+            "status": "completed",
+            "message": "文件内容未变化，已跳过入库",
+            "filename": filename
+        })
+        pipe.expire(f"task:{task_id}", 3600)
+        await pipe.execute()
+        return task_id
    
-    # 初始化 Redis 状态
-    r.hset(f"task:{task_id}", mapping={
+    # 初始化 Redis 状态 (任务状态 + 文档登记表，一次往返)
+    pipe = aclient.pipeline(transaction=True)
+    pipe.hset(f"task:{task_id}", mapping={
         "status": "pending", 
         "message": "已加入队列",
-        "filename": file.filename
+        "filename": filename
     })
+    document_registry.queue_uploaded(pipe, filename, streamed.size, task_id)
+    await pipe.execute()
 
     # 🟢 4. 传递 file_path 和 file_url 给后台任务
-    background_tasks.add_task(process_file_task, task_id, file_path, file.filename, file_url)
+    if settings.INGEST_MODE == "queue":
+        # 交给独立的入库 Worker (python -m app.workers.ingest)，API 进程只负责入队
+        await ingest_queue.enqueue({
+            "task_id": task_id,
+            "file_path": file_path,
+            "original_filename": filename,
+            "file_url": file_url,
+            "file_hash": file_hash,
+        })
+    else:
+        background_tasks.add_task(process_file_task, task_id, file_path, filename, file_url, file_hash)
     
-    return task_id
\ No newline at end of file
+    return task_id
+
+
+async def handle_bulk_upload(request: Request, background_tasks: BackgroundTasks):
+    """批量上传入口：支持多个文件 (字段名 files) 或 zip 包，整批共用一个 task_id"""
+    task_id = str(uuid.uuid4())
+
+    # 1. 流式落盘 (每个文件 / zip 单独受 BULK_UPLOAD_MAX_BYTES 限制)
+    streamed = await stream_files_to_disk(
+        request, settings.UPLOAD_DIR, settings.BULK_UPLOAD_MAX_BYTES,
+        field_name="files", max_files=settings.BULK_UPLOAD_MAX_FILES,
+    )
+
+    # 2. 展开 zip，过滤不支持的类型
+    candidates, skipped = [], []
+    try:
+        for item in streamed:
+            if item.filename.lower().endswith(".zip"):
+                extracted, zip_skipped = await asyncio.to_thread(
+                    _extract_zip, item.tmp_path, settings.BULK_UPLOAD_MAX_FILES, settings.BULK_UPLOAD_MAX_BYTES
+                )
+                await asyncio.to_thread(os.remove, item.tmp_path)
+                candidates.extend(extracted)
+                skipped.extend(zip_skipped)
+            elif os.path.splitext(item.filename)[1].lower() in SUPPORTED_EXTENSIONS:
+                candidates.append(item)
+            else:
+                await asyncio.to_thread(os.remove, item.tmp_path)
+                skipped.append((item.filename, "不支持的文件类型"))
+        if len(candidates) > settings.BULK_UPLOAD_MAX_FILES:
+            raise InvalidUpload(f"单次最多上传 {settings.BULK_UPLOAD_MAX_FILES} 个文件")
+    except BaseException:
+        for item in streamed + candidates:
+            if os.path.exists(item.tmp_path):
+                os.remove(item.tmp_path)
+        raise
+
+    # 3. 按内容寻址落盘；同名同内容的文件直接跳过，批次内重名只保留第一个
+    # 已入库版本的哈希一次往返批量取回 (异步客户端)
+    indexed = await document_registry.aindexed_hashes(list({item.filename for item in candidates}))
+    files, seen = [], set()
+    for item in candidates:
+        if item.filename in seen:
+            await asyncio.to_thread(os.remove, item.tmp_path)
+            skipped.append((item.filename, "批次内文件名重复"))
+            continue
+        seen.add(item.filename)
+        file_path, file_url = await _store_content_addressed(item.tmp_path, item.filename, item.sha256)
+        if indexed.get(item.filename) == item.sha256:
+            skipped.append((item.filename, "文件内容未变化"))
+            continue
+        files.append({
+            "file_path": file_path,
+            "original_filename": item.filename,
+            "file_url": file_url,
+            "file_hash": item.sha256,
+            "size_bytes": item.size,
+        })
+
+    # 4. 初始化批次状态 (整体 + 每个文件 + 文档登记表)，合并成一个异步 pipeline，一次往返
+    pipe = redis_manager.get_async_client().pipeline(transaction=True)
+    pipe.hset(f"task:{task_id}", mapping={
+        "status": "pending" if files else "completed",
+        "message": "已加入队列" if files else "没有需要入库的文件",
+        "files_total": len(files),
+        "files_done": 0,
+        "files_failed": 0,
+        "files_skipped": len(skipped),
+    })
+    file_statuses = {item["original_filename"]: _file_status_json("pending") for item in files}
+    file_statuses.update({name: _file_status_json("skipped", reason) for name, reason in skipped})
+    if file_statuses:
+        pipe.hset(f"task:{task_id}:files", mapping=file_statuses)
+    for item in files:
+        document_registry.queue_uploaded(pipe, item["original_filename"], item.pop("size_bytes"), task_id)
+    pipe.expire(f"task:{task_id}:files", 3600)
+    if not files:
+        pipe.expire(f"task:{task_id}", 3600)
+    await pipe.execute()
+    if not files:
+        return task_id
+
+    # 5. 入队 (与单文件共用同一个 Worker 队列)
+    if settings.INGEST_MODE == "queue":
+        await ingest_queue.enqueue({"type": "batch", "task_id": task_id, "files": files})
+    else:
+        background_tasks.add_task(process_batch_task, task_id, files)
+    return task_id
@@ -0,0 +1,135 @@
+# app/services/history_manager.py
+# 会话历史 Token 预算管理：最近的消息原样保留，更早的消息由小模型在后台折叠进滚动摘要
+import re
+import asyncio
+from typing import Dict, List, Tuple
+from app.core.config import get_settings
+from app.core.redis import redis_manager, chat_history_store, ChatHistoryStore
+from app.services.llm_factory import ModelFactory
+
+settings = get_settings()
+
+_CJK = re.compile(r"[一-鿿　-〿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 Token 数：中文 1 字 ≈ 1 token，其余 4 字符 ≈ 1 token (不引入 tokenizer 依赖)"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _message_tokens(msg: Dict) -> int:
+    # +4 近似 role / 分隔符的开销
+    return estimate_tokens(msg.get("content", "")) + 4
+
+
+def _format_messages(messages: List[Dict]) -> str:
+    lines = []
+    for msg in messages:
+        role_label = "用户" if msg.get("role") == "user" else "AI助手"
+        content = msg.get("content", "")
+        lines.append(f"{role_label}: {content[:500]}")
+    return "\n".join(lines)
+
+
+class HistoryManager:
+    LOCK_PREFIX = "chat_compact_lock"
+
+    def __init__(
+        self,
+        store: ChatHistoryStore,
+        token_budget: int,
+        target_ratio: float,
+        summary_model: str,
+        summary_max_chars: int,
+        window: int,
+    ):
+        self.store = store
+        self.token_budget = token_budget
+        self.target_ratio = target_ratio
+        self.summary_model = summary_model
+        self.summary_max_chars = summary_max_chars
+        self.window = window
+        self._tasks = set()  # 持有后台任务引用，防止被 GC
+
+    @staticmethod
+    def _fit_budget(messages: List[Dict], budget: int) -> int:
+        """从最新一条往前累加，返回预算内能保留的最早下标"""
+        used = 0
+        start = len(messages)
+        for i in range(len(messages) - 1, -1, -1):
+            cost = _message_tokens(messages[i])
+            if used + cost > budget:
+                break
+            used += cost
+            start = i
+        return start
+
+    async def load(self, session_id: str) -> Tuple[str, List[Dict]]:
+        """
+        热路径：一次往返取回 (摘要, 最近消息)，并按 Token 预算裁剪原文部分。
+        后台压缩还没追上时，超出预算的旧消息本轮直接不带，保证 Prompt 大小稳定。
+        """
+        summary, messages = await self.store.get_context(session_id, self.window)
+        budget = max(self.token_budget - estimate_tokens(summary), 0)
+        start = self._fit_budget(messages, budget)
+        if start > 0:
+            print(f"✂️ [History] Token 预算内保留最近 {len(messages) - start}/{len(messages)} 条消息")
+        return summary, messages[start:]
+
+    def schedule_compaction(self, session_id: str):
+        """本轮对话保存后调用：在后台检查是否需要压缩，不占用请求链路"""
+        task = asyncio.create_task(self.compact(session_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def compact(self, session_id: str):
+        client = redis_manager.get_async_client()
+        lock_key = f"{self.LOCK_PREFIX}:{session_id}"
+        # 同一会话同时只允许一个压缩任务
+        if not await client.set(lock_key, "1", nx=True, ex=60):
+            return
+        try:
+            summary, messages, head = await self.store.get_snapshot(session_id)
+            total = sum(_message_tokens(m) for m in messages)
+            if total <= self.token_budget:
+                return
+
+            # 原文部分压到 budget * target_ratio 以下，且保证保留部分从用户消息开始
+            keep_from = self._fit_budget(messages, int(self.token_budget * self.target_ratio))
+            while keep_from < len(messages) and messages[keep_from].get("role") != "user":
+                keep_from += 1
+            folded = messages[:keep_from]
+            if not folded:
+                return
+
+            from app.core.prompts import HISTORY_SUMMARY_TEMPLATE
+            prompt = HISTORY_SUMMARY_TEMPLATE.format(
+                previous_summary=summary or "(无)",
+                new_messages=_format_messages(folded),
+                max_chars=self.summary_max_chars,
+            )
+            new_summary = (await ModelFactory.acomplete(prompt, model=self.summary_model)).strip()
+            if not new_summary:
+                return
+            new_summary = new_summary[: self.summary_max_chars * 2]
+
+            await self.store.replace_prefix_with_summary(session_id, head + len(folded), new_summary)
+            print(f"🗜️ [History] 会话 {session_id} 已压缩 {len(folded)} 条消息 ({total} tokens -> 摘要 {estimate_tokens(new_summary)} tokens)")
+        except Exception as e:
+            print(f"⚠️ [History] 会话压缩失败: {e}")
+        finally:
+            await client.delete(lock_key)
+
+
+# 单例模式
+history_manager = HistoryManager(
+    store=chat_history_store,
+    token_budget=settings.HISTORY_TOKEN_BUDGET,
+    target_ratio=settings.HISTORY_COMPACT_TARGET_RATIO,
+    summary_model=settings.HISTORY_SUMMARY_MODEL,
+    summary_max_chars=settings.HISTORY_SUMMARY_MAX_CHARS,
+    window=settings.CHAT_HISTORY_WINDOW,
+)
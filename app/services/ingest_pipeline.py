@@ -0,0 +1,187 @@
+# app/services/ingest_pipeline.py
+# 入库流水线：分批向量化，第 N 批写 Qdrant 的同时第 N+1 批在做 Embedding
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+
+from app.core.redis import redis_manager
+from app.core.config import get_settings
+from app.services.llm_factory import ModelFactory
+
+r = redis_manager.get_client()
+settings = get_settings()
+
+
+def _upsert(vector_store, batch: List):
+    vector_store.add(batch)
+    # 写入后释放向量，大文件不会把所有 Embedding 同时留在内存里
+    for node in batch:
+        node.embedding = None
+
+
+def embed_and_upsert(nodes: List, task_id: str, batch_size: int = None) -> int:
+    """
+    分批 Embedding + 写入，并把进度 (已完成 / 总数 / 吞吐) 写进 task:{id}。
+    写入只用一个后台线程，同一时刻最多一批在写，内存占用约为 2 个批次的向量。
+    """
+    from app.services.rag_engine import get_index
+
+    batch_size = batch_size or settings.INGEST_EMBED_BATCH_SIZE
+    embed_model = ModelFactory.get_embed_model()
+    vector_store = get_index().vector_store
+
+    total = len(nodes)
+    task_key = f"task:{task_id}"
+    r.hset(task_key, mapping={"chunks_total": total, "chunks_done": 0, "message": f"正在向量化 (0/{total})"})
+
+    start = time.perf_counter()
+    done = 0
+    pending = None  # (future, batch)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="qdrant-upsert") as executor:
+        for offset in range(0, total, batch_size):
+            batch = nodes[offset: offset + batch_size]
+            texts = [node.get_content(metadata_mode="embed") for node in batch]
+            embeddings = embed_model.get_text_embedding_batch(texts)
+            for node, embedding in zip(batch, embeddings):
+                node.embedding = embedding
+
+            # 上一批写完才提交这一批；等待期间这一批的 Embedding 已经算好了
+            if pending is not None:
+                pending[0].result()
+                done += len(pending[1])
+                _report(task_key, done, total, start)
+            pending = (executor.submit(_upsert, vector_store, batch), batch)
+
+        if pending is not None:
+            pending[0].result()
+            done += len(pending[1])
+            _report(task_key, done, total, start)
+
+    elapsed = time.perf_counter() - start
+    print(f"📦 [Ingest] {total} 个切片入库完成，耗时 {elapsed:.1f}s ({total / max(elapsed, 1e-6):.1f} chunks/s)")
+    return done
+
+
+def _report(task_key: str, done: int, total: int, start: float):
+    rate = done / max(time.perf_counter() - start, 1e-6)
+    r.hset(task_key, mapping={
+        "chunks_done": done,
+        "chunks_per_second": round(rate, 1),
+        "message": f"正在向量化 ({done}/{total})",
+    })
+
+
+# ---------- 内容哈希去重 / 增量更新 ----------
+# 这些字段只用于去重，不参与 Embedding，也不喂给 LLM
+HASH_METADATA_KEYS = ["file_hash", "chunk_hash"]
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# 参与切片哈希的元数据 (白名单)：只放影响引用位置的字段。
+# file_path / source_url 里带内容寻址的文件名、还有文件大小 / 修改时间等，每个版本都不同，不能参与
+CITATION_METADATA_KEYS = ("page_label", "header_path", "section", "title")
+
+
+def _hash_input(node) -> str:
+    """正文 + 白名单元数据 (页码 / 章节)：段落换了位置时哈希变化，引用不会指向旧位置"""
+    citation = {k: node.metadata[k] for k in CITATION_METADATA_KEYS if node.metadata.get(k) is not None}
+    return node.get_content(metadata_mode="none") + "\x1f" + json.dumps(citation, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def tag_chunk_hashes(nodes: List, file_hash: str):
+    for node in nodes:
+        node.metadata["file_hash"] = file_hash
+        node.metadata["chunk_hash"] = chunk_hash(_hash_input(node))
+        node.excluded_embed_metadata_keys.extend(HASH_METADATA_KEYS)
+        node.excluded_llm_metadata_keys.extend(HASH_METADATA_KEYS)
+
+
+def _file_filter(file_name: str):
+    from qdrant_client import models
+    return models.Filter(must=[
+        models.FieldCondition(key="file_name", match=models.MatchValue(value=file_name))
+    ])
+
+
+def diff_against_index(nodes: List, file_name: str, client=None) -> Tuple[List, List, List]:
+    """
+    按 (文件名, 切片哈希) 对比已入库的切片：
+    返回 (需要新 embed 的切片, 已过时的 point id, 内容没变可以复用的 [(point id, _node_content)])。
+    client 默认取知识库 Index 的 Qdrant 客户端
+    """
+    if client is None:
+        from app.services.rag_engine import get_index
+        client = get_index().vector_store.client
+    existing = {}  # chunk_hash -> [(point_id, _node_content)]
+    obsolete_ids = []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=settings.COLLECTION_NAME,
+            scroll_filter=_file_filter(file_name),
+            limit=256,
+            offset=offset,
+            with_payload=["chunk_hash", "_node_content"],
+            with_vectors=False,
+        )
+        for point in points:
+            h = (point.payload or {}).get("chunk_hash")
+            if h:
+                existing.setdefault(h, []).append((point.id, point.payload.get("_node_content")))
+            else:
+                # 去重上线前入库的旧切片没有哈希，直接替换
+                obsolete_ids.append(point.id)
+        if offset is None:
+            break
+
+    new_hashes = {node.metadata["chunk_hash"] for node in nodes}
+    fresh_nodes = [node for node in nodes if node.metadata["chunk_hash"] not in existing]
+    kept = [item for h, items in existing.items() if h in new_hashes for item in items]
+    obsolete_ids += [pid for h, items in existing.items() if h not in new_hashes for pid, _ in items]
+    return fresh_nodes, obsolete_ids, kept
+
+
+def apply_diff(obsolete_ids: List, kept: List, metadata_updates: dict):
+    """
+    删除过时切片；复用的切片不重新 embed，只刷新元数据 (下载链接 / 文件哈希)，
+    并补上编号标签 codes (编号快速通道上线前入库的切片没有这个字段)。
+    LlamaIndex 读回节点时用的是 _node_content 里的 metadata，所以两处都要改。
+    """
+    from qdrant_client import models
+    from app.services.rag_engine import get_index
+    from app.services.code_lookup import CODES_METADATA_KEY, extract_codes
+
+    client = get_index().vector_store.client
+    if obsolete_ids:
+        client.delete(
+            collection_name=settings.COLLECTION_NAME,
+            points_selector=models.PointIdsList(points=obsolete_ids),
+        )
+    if not kept:
+        return
+    operations = []
+    for point_id, node_content in kept:
+        payload = dict(metadata_updates)
+        if node_content:
+            node_json = json.loads(node_content)
+            payload[CODES_METADATA_KEY] = extract_codes(node_json.get("text", ""))
+            node_json.setdefault("metadata", {}).update(payload)
+            # 和 tag_codes 一致：codes 不参与 Embedding，也不喂给 LLM
+            for exclude_key in ("excluded_embed_metadata_keys", "excluded_llm_metadata_keys"):
+                excluded = node_json.setdefault(exclude_key, [])
+                if CODES_METADATA_KEY not in excluded:
+                    excluded.append(CODES_METADATA_KEY)
+            payload["_node_content"] = json.dumps(node_json, ensure_ascii=False)
+        operations.append(models.SetPayloadOperation(
+            set_payload=models.SetPayload(payload=payload, points=[point_id])
+        ))
+    for i in range(0, len(operations), 256):
+        client.batch_update_points(
+            collection_name=settings.COLLECTION_NAME,
+            update_operations=operations[i: i + 256],
+        )
@@ -0,0 +1,98 @@
+# app/services/ingest_queue.py
+# 入库任务队列 (Redis)：API 进程只入队，独立 Worker 消费
+import json
+import time
+from typing import Optional, Tuple
+from app.core.redis import redis_manager
+
+# 把到期的延迟任务 (重试) 原子地搬回主队列
+_PROMOTE_DELAYED_LUA = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], 0, ARGV[1], 'LIMIT', 0, 100)
+for _, raw in ipairs(due) do
+    redis.call('ZREM', KEYS[1], raw)
+    redis.call('LPUSH', KEYS[2], raw)
+end
+return #due
+"""
+
+
+class IngestQueue:
+    """
+    可靠队列 (Reliable Queue) 模式：
+    - ingest:queue                 主队列 (LPUSH 入队，BLMOVE 从右侧取出 → FIFO)
+    - ingest:processing:{consumer} 每个消费者正在处理的任务；处理完才 LREM，进程崩溃时任务不会丢
+    - ingest:heartbeat:{consumer}  消费者心跳 (带 TTL)；心跳消失后其 processing 列表会被重新入队
+    - ingest:delayed               ZSET，失败重试的任务按到期时间排队 (指数退避)
+    """
+    QUEUE_KEY = "ingest:queue"
+    DELAYED_KEY = "ingest:delayed"
+    PROCESSING_PREFIX = "ingest:processing"
+    HEARTBEAT_PREFIX = "ingest:heartbeat"
+
+    def __init__(self, manager=redis_manager):
+        self.manager = manager
+        self._promote_script = None
+
+    # ---------- API 侧 ----------
+    async def enqueue(self, job: dict):
+        job = {**job, "attempts": job.get("attempts", 0), "enqueued_at": time.time()}
+        await self.manager.get_async_client().lpush(self.QUEUE_KEY, json.dumps(job, ensure_ascii=False))
+
+    # ---------- Worker 侧 (同步客户端，跑在 Worker 线程里) ----------
+    def _processing_key(self, consumer_id: str) -> str:
+        return f"{self.PROCESSING_PREFIX}:{consumer_id}"
+
+    def _heartbeat_key(self, consumer_id: str) -> str:
+        return f"{self.HEARTBEAT_PREFIX}:{consumer_id}"
+
+    def promote_delayed(self) -> int:
+        if self._promote_script is None:
+            self._promote_script = self.manager.get_client().register_script(_PROMOTE_DELAYED_LUA)
+        return self._promote_script(keys=[self.DELAYED_KEY, self.QUEUE_KEY], args=[time.time()])
+
+    def reserve(self, consumer_id: str, timeout: int = 5) -> Optional[Tuple[str, dict]]:
+        """阻塞取出一个任务，同时原子地放进自己的 processing 列表"""
+        raw = self.manager.get_client().blmove(
+            self.QUEUE_KEY, self._processing_key(consumer_id), timeout, "RIGHT", "LEFT"
+        )
+        if raw is None:
+            return None
+        try:
+            return raw, json.loads(raw)
+        except ValueError:
+            print(f"⚠️ [IngestQueue] 丢弃无法解析的任务: {raw[:200]}")
+            self.ack(consumer_id, raw)
+            return None
+
+    def ack(self, consumer_id: str, raw: str):
+        self.manager.get_client().lrem(self._processing_key(consumer_id), 1, raw)
+
+    def retry_later(self, consumer_id: str, raw: str, job: dict, delay: float):
+        """从 processing 移除并放入延迟队列 (同一个事务里完成)"""
+        job = {**job, "attempts": job.get("attempts", 0) + 1}
+        pipe = self.manager.get_client().pipeline(transaction=True)
+        pipe.lrem(self._processing_key(consumer_id), 1, raw)
+        pipe.zadd(self.DELAYED_KEY, {json.dumps(job, ensure_ascii=False): time.time() + delay})
+        pipe.execute()
+
+    def heartbeat(self, consumer_id: str, ttl: int):
+        self.manager.get_client().set(self._heartbeat_key(consumer_id), int(time.time()), ex=ttl)
+
+    def requeue_orphans(self) -> int:
+        """把心跳已经消失的消费者手里的任务搬回主队列 (Worker 崩溃 / 被 kill 的情况)"""
+        client = self.manager.get_client()
+        moved = 0
+        for key in client.scan_iter(match=f"{self.PROCESSING_PREFIX}:*"):
+            consumer_id = key[len(self.PROCESSING_PREFIX) + 1:]
+            if client.exists(self._heartbeat_key(consumer_id)):
+                continue
+            # 搬回主队列的消费端 (右侧)，这些任务会被优先重新处理
+            while client.lmove(key, self.QUEUE_KEY, "RIGHT", "RIGHT") is not None:
+                moved += 1
+        if moved:
+            print(f"♻️ [IngestQueue] 已将 {moved} 个孤儿任务重新入队")
+        return moved
+
+
+# 单例模式
+ingest_queue = IngestQueue()
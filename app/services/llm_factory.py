@@ -1,11 +1,11 @@
 # app/services/llm_factory.py
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.postprocessor.flag_embedding_reranker import FlagEmbeddingReranker
-from langchain_openai import ChatOpenAI
 from app.core.config import get_settings
-import torch
+import os
+import httpx
 
 # 使用 单例模式 (Singleton) 或 lru_cache 来确保模型只加载一次，而不是每次请求都加载。
+# ⚡️ torch / LlamaIndex / FlagEmbedding / LangChain 都在第一次 get_xxx() 时才导入，
+# 只服务 /feedback、/upload/{task_id} 的 worker 启动时完全不加载它们。
 
 settings = get_settings()
 
@@ -13,32 +13,95 @@ class ModelFactory:
     _embed_model = None
     _reranker = None
     _llm = None
+    _http_client = None
 
     @classmethod
     def get_embed_model(cls):
         if cls._embed_model is None:
-            print(f"🔄 正在加载 Embedding: {settings.EMBEDDING_MODEL_PATH} ...")
-            cls._embed_model = HuggingFaceEmbedding(
-                model_name=settings.EMBEDDING_MODEL_PATH,
-                device="cuda" if torch.cuda.is_available() else "cpu", # 有显卡用显卡，没显卡用 CPU
-                trust_remote_code=True # 允许执行模型里的自定义 Python 代码
+            print(f"🔄 正在加载 Embedding ({settings.INFERENCE_BACKEND}): {settings.EMBEDDING_MODEL_PATH} ...")
+            from app.services.embedding_cache import CachedQueryEmbedding, EmbeddingCache, cache_namespace
+            if settings.INFERENCE_BACKEND == "onnx":
+                base_model = cls._load_onnx_embedding()
+            else:
+                import torch
+                from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+                base_model = HuggingFaceEmbedding(
+                    model_name=settings.EMBEDDING_MODEL_PATH,
+                    device="cuda" if torch.cuda.is_available() else "cpu", # 有显卡用显卡，没显卡用 CPU
+                    trust_remote_code=True # 允许执行模型里的自定义 Python 代码
+                )
+            # 查询向量走 LRU 缓存 (可选 Redis 二级缓存)，文档向量不受影响
+            cls._embed_model = CachedQueryEmbedding(
+                inner=base_model,
+                cache=EmbeddingCache(
+                    namespace=cache_namespace(
+                        settings.EMBEDDING_MODEL_PATH, settings.INFERENCE_BACKEND, settings.ONNX_QUANTIZE
+                    ),
+                    max_entries=settings.QUERY_EMBED_CACHE_SIZE,
+                    use_redis=settings.QUERY_EMBED_CACHE_REDIS,
+                    ttl=settings.QUERY_EMBED_CACHE_TTL_SECONDS,
+                )
             )
         return cls._embed_model
 
+    @classmethod
+    def get_embed_cache_stats(cls):
+        """查询向量缓存命中率 (进程内统计；模型未加载时返回 None)"""
+        if cls._embed_model is None:
+            return None
+        return cls._embed_model.cache.stats()
+
     @classmethod
     def get_reranker(cls):
         if cls._reranker is None:
-            print("🔄 正在加载 Reranker ...")
-            cls._reranker = FlagEmbeddingReranker(
-                top_n=3, # 最终只选出 3 个最好的给大模型看，这能极大减少大模型的幻觉，并节省 Token 费用。
-                model=settings.RERANK_MODEL_PATH,
-                use_fp16=False # 是否开启半精度加速（CPU 必须关，GPU 可以开以省显存）
+            print(f"🔄 正在加载 Reranker ({settings.INFERENCE_BACKEND}) ...")
+            from app.services.reranker import MicroBatchReranker
+            if settings.INFERENCE_BACKEND == "onnx":
+                model = cls._load_onnx_reranker()
+            else:
+                from FlagEmbedding import FlagReranker
+                model = FlagReranker(
+                    settings.RERANK_MODEL_PATH,
+                    use_fp16=False # 是否开启半精度加速（CPU 必须关，GPU 可以开以省显存）
+                )
+            # 并发请求的 (query, passage) 对在一个小时间窗内合并成一批，在事件循环之外推理
+            cls._reranker = MicroBatchReranker(
+                model=model,
+                top_n=settings.RERANK_TOP_N, # 最终只选出 3 个最好的给大模型看，这能极大减少大模型的幻觉，并节省 Token 费用。
+                max_batch_size=settings.RERANK_MAX_BATCH_SIZE,
+                batch_window_ms=settings.RERANK_BATCH_WINDOW_MS,
             )
         return cls._reranker
 
+    # ---------- ONNX Runtime 后端 ----------
+    @staticmethod
+    def _load_onnx_embedding():
+        from app.services.onnx_backend import OnnxEmbedding, export_onnx
+        output_dir = os.path.join(settings.ONNX_MODEL_DIR, "embedding")
+        onnx_path = export_onnx(settings.EMBEDDING_MODEL_PATH, output_dir, task="embedding", quantize=settings.ONNX_QUANTIZE)
+        return OnnxEmbedding(
+            model_dir=output_dir,
+            onnx_path=onnx_path,
+            intra_op_threads=settings.ONNX_INTRA_OP_THREADS,
+            inter_op_threads=settings.ONNX_INTER_OP_THREADS,
+        )
+
+    @staticmethod
+    def _load_onnx_reranker():
+        from app.services.onnx_backend import OnnxReranker, export_onnx
+        output_dir = os.path.join(settings.ONNX_MODEL_DIR, "reranker")
+        onnx_path = export_onnx(settings.RERANK_MODEL_PATH, output_dir, task="rerank", quantize=settings.ONNX_QUANTIZE)
+        return OnnxReranker(
+            model_dir=output_dir,
+            onnx_path=onnx_path,
+            intra_op_threads=settings.ONNX_INTRA_OP_THREADS,
+            inter_op_threads=settings.ONNX_INTER_OP_THREADS,
+        )
+
     @classmethod
     def get_llm(cls):
         if cls._llm is None:
+            from langchain_openai import ChatOpenAI
             cls._llm = ChatOpenAI(
                 openai_api_base=settings.DASHSCOPE_BASE_URL,
                 openai_api_key=settings.DASHSCOPE_API_KEY,
@@ -46,4 +109,44 @@ class ModelFactory:
                 temperature=0, # 必须为 0，保证工具调用稳定
                 streaming=True # 流式输出（像打字机一样一个字一个字蹦）
             )
-        return cls._llm
\ No newline at end of file
+        return cls._llm
+
+    @classmethod
+    def get_http_client(cls) -> httpx.AsyncClient:
+        """
+        全局共享的异步 HTTP 客户端 (Keep-Alive 连接池)。
+        直接调用 DashScope 兼容接口的场景 (如查询改写) 复用它，避免每次请求重新握手 TLS。
+        """
+        if cls._http_client is None or cls._http_client.is_closed:
+            cls._http_client = httpx.AsyncClient(
+                base_url=settings.DASHSCOPE_BASE_URL,
+                headers={"Authorization": f"Bearer {settings.DASHSCOPE_API_KEY}"},
+                timeout=httpx.Timeout(settings.HTTP_TIMEOUT_SECONDS),
+                limits=httpx.Limits(
+                    max_connections=settings.HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+                ),
+            )
+        return cls._http_client
+
+    @classmethod
+    async def acomplete(cls, prompt: str, model: str, temperature: float = 0) -> str:
+        """用共享连接池直接调用 DashScope 兼容接口 (单轮、非流式)，给改写 / 摘要这类小模型任务使用"""
+        response = await cls.get_http_client().post(
+            "/chat/completions",
+            json={
+                "model": model,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": temperature,
+            },
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    @classmethod
+    async def aclose(cls):
+        """服务关闭时释放连接池"""
+        if cls._http_client is not None and not cls._http_client.is_closed:
+            await cls._http_client.aclose()
+        cls._http_client = None
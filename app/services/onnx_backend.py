@@ -0,0 +1,180 @@
+# app/services/onnx_backend.py
+# ONNX Runtime 推理后端 (CPU 节点专用)
+# 把 bge-large-zh / bge-reranker-base 导出为 ONNX，可选 int8 动态量化，用 ONNX Runtime 推理。
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+ONNX_FP32_FILE = "model.onnx"
+ONNX_INT8_FILE = "model.int8.onnx"
+
+
+def export_onnx(model_path: str, output_dir: str, task: str, quantize: bool = True) -> str:
+    """
+    导出 HuggingFace 模型到 ONNX (需要 torch / transformers，只在首次导出时使用)。
+    task: "embedding" (AutoModel) 或 "rerank" (AutoModelForSequenceClassification)
+    返回最终要加载的 onnx 文件路径。
+    """
+    fp32_path = os.path.join(output_dir, ONNX_FP32_FILE)
+    int8_path = os.path.join(output_dir, ONNX_INT8_FILE)
+    target_path = int8_path if quantize else fp32_path
+    # 已导出过：直接返回，正常启动不需要导入 torch
+    if os.path.exists(target_path):
+        return target_path
+
+    os.makedirs(output_dir, exist_ok=True)
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+
+        print(f"🔄 [ONNX] 正在导出 {model_path} -> {fp32_path} ...")
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        if task == "rerank":
+            model = AutoModelForSequenceClassification.from_pretrained(model_path)
+            output_names = ["logits"]
+        else:
+            model = AutoModel.from_pretrained(model_path)
+            output_names = ["last_hidden_state"]
+        model.eval()
+
+        dummy = tokenizer(["示例文本"], ["示例文本"] if task == "rerank" else None, return_tensors="pt")
+        input_names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in dummy]
+        dynamic_axes = {name: {0: "batch", 1: "seq"} for name in input_names}
+        dynamic_axes[output_names[0]] = {0: "batch"} if task == "rerank" else {0: "batch", 1: "seq"}
+
+        with torch.no_grad():
+            torch.onnx.export(
+                model,
+                tuple(dummy[k] for k in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=output_names,
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+                do_constant_folding=True,
+            )
+        tokenizer.save_pretrained(output_dir)
+        print("✅ [ONNX] 导出完成")
+
+    if not quantize:
+        return fp32_path
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    print(f"🔄 [ONNX] 正在进行 int8 动态量化 -> {int8_path} ...")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print("✅ [ONNX] 量化完成")
+    return int8_path
+
+
+def create_session(onnx_path: str, intra_op_threads: int = 0, inter_op_threads: int = 1):
+    """
+    创建 ONNX Runtime 会话。
+    intra_op_threads=0 表示由 ORT 自动按物理核数决定；inter_op 对 BERT 类顺序图设 1 即可。
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    return ort.InferenceSession(onnx_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+class _OnnxEncoder:
+    """tokenizer + session 的薄封装，按需只喂模型真正需要的输入"""
+
+    def __init__(self, model_dir: str, onnx_path: str, intra_op_threads: int, inter_op_threads: int, max_length: int):
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = create_session(onnx_path, intra_op_threads, inter_op_threads)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.max_length = max_length
+
+    def run(self, texts, text_pairs=None) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts,
+            text_pairs,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+        return self.session.run(None, feeds)[0]
+
+
+class OnnxEmbedding(BaseEmbedding):
+    """BGE 向量模型的 ONNX 版本：CLS pooling + L2 归一化，和 HuggingFaceEmbedding 输出一致"""
+    _encoder: _OnnxEncoder = PrivateAttr()
+    _query_instruction: Optional[str] = PrivateAttr()
+
+    def __init__(
+        self,
+        model_dir: str,
+        onnx_path: str,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 1,
+        max_length: int = 512,
+        query_instruction: Optional[str] = None,
+        embed_batch_size: int = 32,
+        **kwargs
+    ):
+        super().__init__(model_name=onnx_path, embed_batch_size=embed_batch_size, **kwargs)
+        self._encoder = _OnnxEncoder(model_dir, onnx_path, intra_op_threads, inter_op_threads, max_length)
+        self._query_instruction = query_instruction
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        hidden = self._encoder.run(texts)
+        cls_vectors = hidden[:, 0]
+        norms = np.linalg.norm(cls_vectors, axis=1, keepdims=True)
+        return (cls_vectors / np.clip(norms, 1e-12, None)).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        if self._query_instruction:
+            query = f"{self._query_instruction}{query}"
+        return self._embed([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts)
+
+
+class OnnxReranker:
+    """bge-reranker 的 ONNX 版本，接口与 FlagReranker.compute_score 一致 (返回 logit)"""
+
+    def __init__(
+        self,
+        model_dir: str,
+        onnx_path: str,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 1,
+        max_length: int = 512,
+        batch_size: int = 32,
+    ):
+        self._encoder = _OnnxEncoder(model_dir, onnx_path, intra_op_threads, inter_op_threads, max_length)
+        self.batch_size = batch_size
+
+    def compute_score(self, pairs: List[Tuple[str, str]]):
+        single = len(pairs) > 0 and isinstance(pairs[0], str)
+        if single:
+            pairs = [pairs]
+        scores: List[float] = []
+        for i in range(0, len(pairs), self.batch_size):
+            chunk = pairs[i: i + self.batch_size]
+            logits = self._encoder.run([q for q, _ in chunk], [p for _, p in chunk])
+            scores.extend(logits.reshape(-1).astype(float).tolist())
+        return scores[0] if single else scores
@@ -0,0 +1,85 @@
+# app/services/prompt_registry.py
+# Langfuse Prompt 本地缓存 + 后台定时刷新
+# 请求链路只读内存里的 Prompt，永远不等 Langfuse；版本变化时通知监听者 (比如重建 Agent)
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional
+from app.core.config import get_settings
+from app.core.langfuse_client import get_langfuse
+
+settings = get_settings()
+
+# 需要托管的 Prompt
+PROMPT_NAMES = ["rag-core-system", "query-rewrite", "tool-sql-result-instruction"]
+
+
+class PromptRegistry:
+    def __init__(self, names: List[str], refresh_interval: float):
+        self.names = names
+        self.refresh_interval = refresh_interval
+        self._prompts: Dict[str, object] = {}
+        self._listeners: List[Callable[[List[str]], Awaitable[None]]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- 读取 (热路径，无网络) ----------
+    def get(self, name: str):
+        """返回缓存的 Langfuse Prompt 对象；还没拉到时返回 None，调用方使用本地兜底模板"""
+        return self._prompts.get(name)
+
+    def version(self, name: str):
+        prompt = self._prompts.get(name)
+        return getattr(prompt, "version", None) if prompt is not None else None
+
+    def add_listener(self, listener: Callable[[List[str]], Awaitable[None]]):
+        """注册版本变化回调 (async)，参数为发生变化的 Prompt 名称列表"""
+        self._listeners.append(listener)
+
+    # ---------- 刷新 ----------
+    def _fetch_all(self) -> Dict[str, object]:
+        """同步拉取全部 Prompt (在线程池里执行)；单个失败时保留旧版本"""
+        langfuse = get_langfuse()
+        fetched = {}
+        for name in self.names:
+            try:
+                fetched[name] = langfuse.get_prompt(name, cache_ttl_seconds=0)
+            except Exception as e:
+                print(f"⚠️ [PromptRegistry] Prompt '{name}' 拉取失败，继续使用旧版本/本地兜底: {e}")
+        return fetched
+
+    async def refresh(self):
+        fetched = await asyncio.to_thread(self._fetch_all)
+        changed = [
+            name for name, prompt in fetched.items()
+            if name not in self._prompts or self.version(name) != getattr(prompt, "version", None)
+        ]
+        # 整个 dict 一次性替换，读者要么看到旧版本，要么看到新版本
+        self._prompts = {**self._prompts, **fetched}
+        if changed:
+            print(f"✅ [PromptRegistry] Prompt 已更新: {', '.join(f'{n}@v{self.version(n)}' for n in changed)}")
+            for listener in self._listeners:
+                try:
+                    await listener(changed)
+                except Exception as e:
+                    print(f"⚠️ [PromptRegistry] 更新回调执行失败: {e}")
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"⚠️ [PromptRegistry] 刷新失败: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """在当前事件循环里启动后台刷新 (服务 lifespan 里调用，与 stop 成对)；重复调用无副作用"""
+        if self._task is not None and not self._task.done():
+            return
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+
+
+# 单例模式
+prompt_registry = PromptRegistry(PROMPT_NAMES, refresh_interval=settings.PROMPT_REFRESH_INTERVAL_SECONDS)
@@ -1,92 +1,191 @@
 # app/services/query_rewriter.py
 import re
-import dashscope
+import asyncio
 from http import HTTPStatus
-from typing import List
+from typing import Awaitable, List, Optional
 from app.core.config import get_settings
-from app.core.prompts import QUERY_REWRITE_TEMPLATE
-from langfuse import Langfuse
+from app.services.prompt_registry import prompt_registry
+from app.services.llm_factory import ModelFactory
+from app.services.rewrite_cache import rewrite_cache
 
 settings = get_settings()
-# 确保 API KEY 已设置
-dashscope.api_key = settings.DASHSCOPE_API_KEY
 
-langfuse = Langfuse()
 
-def condense_question(history: List[dict], latest_question: str) -> str:
+def _is_exact_code(latest_question: str) -> bool:
     """
-    结合历史记录，强制将用户的后续提问改写为包含上下文的完整问题。
-    使用 qwen-turbo 模型以保证速度。
+    ⚡️ [Smart Skip] 智能跳过逻辑
+    逻辑：长度小于 20 且包含字母和数字的组合，通常是订单号、工号、型号
     """
-    
-    # 1. ⚡️ [Smart Skip] 智能跳过逻辑
-    # 逻辑：长度小于 20 且包含字母和数字的组合，通常是订单号、工号、型号
-    # 直接返回，不让 LLM 干扰精确搜索
-    if len(latest_question) < 20 and re.search(r'[a-zA-Z]', latest_question) and re.search(r'\d', latest_question):
-        print(f"⚡️ [Rewriter] 检测到查询码/ID '{latest_question}'，保持原样。")
-        return latest_question.strip()
+    return bool(
+        len(latest_question) < 20
+        and re.search(r'[a-zA-Z]', latest_question)
+        and re.search(r'\d', latest_question)
+    )
 
-    # 2. 没有任何历史，无需改写
-    if not history:
-        return latest_question
 
-    # 3. 提取并格式化最近的历史记录 (适配 Redis 存储的 dict 格式)
+def _build_history_str(history: List[dict]) -> str:
+    """提取并格式化最近的历史记录 (适配 Redis 存储的 dict 格式)"""
     # 只取最后 2 轮 (4条消息)，避免上下文过长
-    recent_history = history[-4:] 
+    recent_history = history[-4:]
     history_str = ""
     for msg in recent_history:
         role = msg.get("role", "")
         content = msg.get("content", "")
-        
+
         # 映射 role 名称，辅助模型理解
         role_label = "用户" if role == "user" else "AI助手"
-        
+
         # 截断过长的历史回复
         clean_content = content[:200] + "..." if len(content) > 200 else content
         history_str += f"{role_label}: {clean_content}\n"
-    
+    return history_str
+
+
+def _compile_prompt(langfuse_prompt, history_str: str, latest_question: str) -> str:
+    """编译 Prompt (Langfuse 优先，拿不到时使用本地硬编码模板)"""
+    from app.core.prompts import QUERY_REWRITE_TEMPLATE
+    if langfuse_prompt is not None:
+        try:
+            return langfuse_prompt.compile(
+                history_str=history_str,
+                latest_question=latest_question
+            )
+        except Exception as e:
+            print(f"⚠️ [Rewriter] Langfuse Prompt 编译失败，使用本地兜底: {e}")
+    return QUERY_REWRITE_TEMPLATE.format(
+        history_str=history_str,
+        latest_question=latest_question
+    )
+
+
+def _clean_rewrite(new_question: str, latest_question: str) -> str:
+    new_question = new_question.strip()
+    # 清理可能产生的标点符号
+    new_question = new_question.replace('"', '').replace("'", "").replace("。", "")
+
+    # 如果改写结果和原问题差异过大，打印日志
+    if new_question != latest_question:
+        print(f"🔄 [Rewriter] 原问题: '{latest_question}' -> 新问题: '{new_question}'")
+    return new_question or latest_question
+
+
+def condense_question(history: List[dict], latest_question: str) -> str:
+    """
+    结合历史记录，强制将用户的后续提问改写为包含上下文的完整问题。
+    使用 qwen-turbo 模型以保证速度。
+    ⚠️ 同步版本，会阻塞调用线程；在 async handler 中请使用 acondense_question。
+    """
+
+    # 1. 查询码/ID 直接返回，不让 LLM 干扰精确搜索
+    if _is_exact_code(latest_question):
+        print(f"⚡️ [Rewriter] 检测到查询码/ID '{latest_question}'，保持原样。")
+        return latest_question.strip()
+
+    # 2. 没有任何历史，无需改写
+    if not history:
+        return latest_question
+
+    # 3. 格式化历史
+    history_str = _build_history_str(history)
+
     # 4. 构造 Prompt(Langfuse 优先)
-    try:
-        # 尝试从 Langfuse 拉取名为 "query-rewrite" 的 Prompt
-        # cache_ttl_seconds=600 (10分钟缓存)，既能热更新，又不会拖慢每个请求
-        langfuse_prompt = langfuse.get_prompt("query-rewrite", cache_ttl_seconds=600)
-        
-        # 编译 Prompt (填入变量)
-        prompt_content = langfuse_prompt.compile(
-            history_str=history_str,
-            latest_question=latest_question
-        )
-        print("✅ [Rewriter] Langfuse Prompt 加载成功")
-        
-    except Exception as e:
-        # 🚨 兜底逻辑：如果 Langfuse 挂了或网络超时，使用本地硬编码模板
-        print(f"⚠️ [Rewriter] Langfuse Prompt 拉取失败，使用本地兜底: {e}")
-        prompt_content = QUERY_REWRITE_TEMPLATE.format(
-            history_str=history_str,
-            latest_question=latest_question
-        )
+    # "query-rewrite" 由 PromptRegistry 在后台定时刷新，这里只读本地缓存；
+    # 🚨 还没拉到 (或 Langfuse 挂了) 时使用本地硬编码模板
+    prompt_content = _compile_prompt(prompt_registry.get("query-rewrite"), history_str, latest_question)
 
     try:
         # 5. 调用 DashScope API (使用 Turbo 模型)
+        import dashscope
+        # 确保 API KEY 已设置
+        dashscope.api_key = settings.DASHSCOPE_API_KEY
         response = dashscope.Generation.call(
-            model='qwen-turbo', 
+            model=settings.REWRITE_MODEL,
             messages=[{'role': 'user', 'content': prompt_content}],
             result_format='message'
         )
-        
+
         if response.status_code == HTTPStatus.OK:
-            new_question = response.output.choices[0]['message']['content'].strip()
-            # 清理可能产生的标点符号
-            new_question = new_question.replace('"', '').replace("'", "").replace("。", "")
-            
-            # 如果改写结果和原问题差异过大，打印日志
-            if new_question != latest_question:
-                print(f"🔄 [Rewriter] 原问题: '{latest_question}' -> 新问题: '{new_question}'")
-            return new_question
+            new_question = response.output.choices[0]['message']['content']
+            return _clean_rewrite(new_question, latest_question)
         else:
             print(f"⚠️ [Rewriter] API报错: {response.message}")
             return latest_question
-            
+
     except Exception as e:
         print(f"⚠️ [Rewriter] 执行异常: {e}")
-        return latest_question
\ No newline at end of file
+        return latest_question
+
+
+# ==========================
+# ⚡️ 异步版本 (不阻塞事件循环)
+# ==========================
+async def _arewrite(history: List[dict], latest_question: str) -> str:
+    history_str = _build_history_str(history)
+
+    # 命中缓存则完全跳过 LLM
+    if settings.REWRITE_CACHE_ENABLED:
+        try:
+            cached = await rewrite_cache.get(history_str, latest_question)
+            if cached is not None:
+                print(f"🎯 [Rewriter] 缓存命中: '{latest_question}' -> '{cached}'")
+                return cached
+        except Exception as e:
+            print(f"⚠️ [Rewriter] 读取改写缓存失败: {e}")
+
+    prompt_content = _compile_prompt(prompt_registry.get("query-rewrite"), history_str, latest_question)
+    new_question = _clean_rewrite(await ModelFactory.acomplete(prompt_content, model=settings.REWRITE_MODEL), latest_question)
+
+    if settings.REWRITE_CACHE_ENABLED:
+        try:
+            await rewrite_cache.set(history_str, latest_question, new_question)
+        except Exception as e:
+            print(f"⚠️ [Rewriter] 写入改写缓存失败: {e}")
+    return new_question
+
+
+async def acondense_question(
+    history: List[dict],
+    latest_question: str,
+    timeout: Optional[float] = None,
+) -> str:
+    """
+    condense_question 的异步版本。
+    整个改写过程 (查缓存 + 调 LLM) 受 timeout 约束，超时或出错时返回用户原话。
+    """
+    if _is_exact_code(latest_question):
+        print(f"⚡️ [Rewriter] 检测到查询码/ID '{latest_question}'，保持原样。")
+        return latest_question.strip()
+
+    if not history:
+        return latest_question
+
+    if timeout is None:
+        timeout = settings.REWRITE_TIMEOUT_SECONDS
+
+    try:
+        return await asyncio.wait_for(_arewrite(history, latest_question), timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"⏱️ [Rewriter] 改写超过 {timeout}s 预算，使用原问题: '{latest_question}'")
+        return latest_question
+    except Exception as e:
+        print(f"⚠️ [Rewriter] 执行异常: {e}")
+        return latest_question
+
+
+async def speculative_condense(history_future: Awaitable[List[dict]], latest_question: str) -> str:
+    """
+    🚀 投机改写：和历史记录加载并行启动。
+    - 查询码/ID 不需要等历史，立即返回
+    - 历史一到就发起 LLM 调用；历史为空则直接返回原问题
+    """
+    if _is_exact_code(latest_question):
+        print(f"⚡️ [Rewriter] 检测到查询码/ID '{latest_question}'，保持原样。")
+        return latest_question.strip()
+
+    try:
+        history = await history_future
+    except Exception as e:
+        print(f"⚠️ [Rewriter] 历史记录加载失败，跳过改写: {e}")
+        return latest_question
+
+    return await acondense_question(history, latest_question)
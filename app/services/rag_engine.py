@@ -1,4 +1,9 @@
 # app/services/rag_engine.py
+import asyncio
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
 import qdrant_client
 from llama_index.vector_stores.qdrant import QdrantVectorStore
 from llama_index.core import VectorStoreIndex, StorageContext
@@ -8,41 +13,179 @@ from functools import lru_cache # 👈 导入缓存装饰器
 from qdrant_client import models
 
 settings = get_settings()
+
+
+def _quantization_config():
+    """按 QDRANT_QUANTIZATION 生成量化配置 ("none" 返回 None)"""
+    kind = settings.QDRANT_QUANTIZATION.lower()
+    if kind == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=0.99,
+                always_ram=settings.QDRANT_QUANTIZATION_ALWAYS_RAM,
+            )
+        )
+    if kind == "product":
+        return models.ProductQuantization(
+            product=models.ProductQuantizationConfig(
+                compression=models.CompressionRatio(settings.QDRANT_PQ_COMPRESSION),
+                always_ram=settings.QDRANT_QUANTIZATION_ALWAYS_RAM,
+            )
+        )
+    return None
+
+
+def _collection_config() -> dict:
+    """知识库集合的创建参数 (同步 / 异步初始化共用)，性能相关参数见 Settings 第 3 节"""
+    return dict(
+        collection_name=settings.COLLECTION_NAME,
+        # 1. 密集向量配置 (BGE-Large-zh-v1.5 维度为 1024)
+        vectors_config=models.VectorParams(
+            size=1024,
+            distance=models.Distance.COSINE,
+            on_disk=settings.QDRANT_VECTORS_ON_DISK,
+        ),
+        # 2. 稀疏向量配置 (开启 hybrid 必须配置这个)
+        # LlamaIndex 默认使用的稀疏向量字段名为 "text-sparse"
+        sparse_vectors_config={
+            "text-sparse": models.SparseVectorParams(
+                index=models.SparseIndexParams(
+                    on_disk=False,
+                )
+            )
+        },
+        # 3. HNSW / 量化 / payload 存储
+        hnsw_config=models.HnswConfigDiff(
+            m=settings.QDRANT_HNSW_M,
+            ef_construct=settings.QDRANT_HNSW_EF_CONSTRUCT,
+        ),
+        quantization_config=_quantization_config(),
+        on_disk_payload=settings.QDRANT_PAYLOAD_ON_DISK,
+    )
+
+
+def search_params():
+    """检索参数：量化时用原始向量重打分 (rescore + oversampling)，可选调整 hnsw_ef"""
+    quantization = None
+    if _quantization_config() is not None:
+        quantization = models.QuantizationSearchParams(
+            rescore=settings.QDRANT_RESCORE,
+            oversampling=settings.QDRANT_OVERSAMPLING,
+        )
+    if quantization is None and not settings.QDRANT_HNSW_EF_SEARCH:
+        return None
+    return models.SearchParams(
+        hnsw_ef=settings.QDRANT_HNSW_EF_SEARCH or None,
+        quantization=quantization,
+    )
+
+
+def _missing_payload_indexes(payload_schema: dict) -> list:
+    return [
+        (field, models.PayloadSchemaType(schema))
+        for field, schema in settings.QDRANT_PAYLOAD_INDEXES.items()
+        if field not in (payload_schema or {})
+    ]
+
+
+def ensure_payload_indexes(client):
+    """为 file_name / source_type / uploaded_at 等过滤字段建 payload 索引 (已存在的跳过)"""
+    info = client.get_collection(settings.COLLECTION_NAME)
+    for field, schema in _missing_payload_indexes(info.payload_schema):
+        client.create_payload_index(
+            collection_name=settings.COLLECTION_NAME,
+            field_name=field,
+            field_schema=schema,
+        )
+        print(f"✅ 已创建 payload 索引: {field} ({schema.value})")
+
+
+async def aensure_payload_indexes(aclient):
+    info = await aclient.get_collection(settings.COLLECTION_NAME)
+    for field, schema in _missing_payload_indexes(info.payload_schema):
+        await aclient.create_payload_index(
+            collection_name=settings.COLLECTION_NAME,
+            field_name=field,
+            field_schema=schema,
+        )
+        print(f"✅ 已创建 payload 索引: {field} ({schema.value})")
+
+
+def _parse_date(value: str, end_of_day: bool = False) -> float:
+    """YYYY-MM-DD → 时间戳；作为上界时取当天 23:59:59"""
+    day = datetime.strptime(value.strip(), "%Y-%m-%d")
+    if end_of_day:
+        day += timedelta(days=1) - timedelta(microseconds=1)
+    return day.timestamp()
+
+
+def build_payload_filter(file_names: Optional[List[str]] = None, source_type: Optional[str] = None,
+                         uploaded_after: Optional[str] = None, uploaded_before: Optional[str] = None):
+    """把结构化过滤条件翻译成 Qdrant payload 过滤 (字段都有 payload 索引)；没有条件时返回 None"""
+    must = []
+    if file_names:
+        must.append(models.FieldCondition(key="file_name", match=models.MatchAny(any=list(file_names))))
+    if source_type:
+        must.append(models.FieldCondition(key="source_type", match=models.MatchValue(value=source_type)))
+    if uploaded_after or uploaded_before:
+        must.append(models.FieldCondition(key="uploaded_at", range=models.Range(
+            gte=_parse_date(uploaded_after) if uploaded_after else None,
+            lte=_parse_date(uploaded_before, end_of_day=True) if uploaded_before else None,
+        )))
+    return models.Filter(must=must) if must else None
+
+
+# 当前检索请求的原始稠密相似度 (node_id -> cosine)，由 capture_dense_scores 设置
+_dense_scores: ContextVar[Optional[Dict[str, float]]] = ContextVar("dense_scores", default=None)
+
+
+@contextmanager
+def capture_dense_scores():
+    """
+    在 with 块内的混合检索会把稠密一路的原始余弦相似度写进返回的 dict。
+    融合分是各路 min-max 归一化后的相对值，跨查询不可比，只能用来排序；
+    自适应检索的 未找到下限 / 决定性领先 / 分布过平 判断都基于这里的原始相似度
+    """
+    sink: Dict[str, float] = {}
+    token = _dense_scores.set(sink)
+    try:
+        yield sink
+    finally:
+        _dense_scores.reset(token)
+
+
+def recording_fusion(dense_result, sparse_result, alpha: float = 0.5, top_k: int = 2):
+    """排序沿用 LlamaIndex 默认的 relative_score_fusion，同时记录稠密一路的原始相似度"""
+    from llama_index.vector_stores.qdrant.utils import relative_score_fusion
+
+    sink = _dense_scores.get()
+    if sink is not None:
+        for node, score in zip(dense_result.nodes or [], dense_result.similarities or []):
+            sink[node.node_id] = score
+    return relative_score_fusion(dense_result, sparse_result, alpha=alpha, top_k=top_k)
+
+
 @lru_cache() # 👈 加上这个装饰器，确保全局只初始化一次 Index 和 连接
 def get_index():
     """获取全局唯一的 Index 对象"""
     # 1. 连接客户端
     # 建立双客户端：同步用于普通操作，异步用于高并发检索
     print("🔌 连接 Qdrant ...")
-    client = qdrant_client.QdrantClient(url=settings.QDRANT_URL)
-    aclient = qdrant_client.AsyncQdrantClient(url=settings.QDRANT_URL)
+    client = qdrant_client.QdrantClient(**settings.QDRANT_CLIENT_KWARGS)
+    aclient = qdrant_client.AsyncQdrantClient(**settings.QDRANT_CLIENT_KWARGS)
 
     # 🟢 新增：检查并自动创建集合
     if not client.collection_exists(collection_name=settings.COLLECTION_NAME):
         print(f"⚠️ 集合 {settings.COLLECTION_NAME} 不存在，正在自动创建...")
         try:
-            client.create_collection(
-                collection_name=settings.COLLECTION_NAME,
-                # 1. 密集向量配置 (BGE-Large-zh-v1.5 维度为 1024)
-                vectors_config=models.VectorParams(
-                    size=1024, 
-                    distance=models.Distance.COSINE
-                ),
-                # 2. 稀疏向量配置 (开启 hybrid 必须配置这个)
-                # LlamaIndex 默认使用的稀疏向量字段名为 "text-sparse"
-                sparse_vectors_config={
-                    "text-sparse": models.SparseVectorParams(
-                        index=models.SparseIndexParams(
-                            on_disk=False,
-                        )
-                    )
-                }
-            )
+            client.create_collection(**_collection_config())
             print("✅ 集合创建成功！")
         except Exception as e:
             print(f"❌ 创建集合失败: {e}")
             # 如果创建失败，抛出异常，防止后续逻辑报错
             raise e
+    ensure_payload_indexes(client)
 
     # 2. 定义存储后端
     vector_store = QdrantVectorStore(
@@ -50,15 +193,33 @@ def get_index():
         aclient=aclient,
         collection_name=settings.COLLECTION_NAME,
         enable_hybrid=True, # 开启混合检索 (关键词+向量)
+        hybrid_fusion_fn=recording_fusion, # 顺带记录原始稠密相似度 (见 capture_dense_scores)
         # batch_size=20,    # 如果报错内存不足，可以调小这个
     )
-    
+
     # 3. 组装上下文
     storage_context = StorageContext.from_defaults(vector_store=vector_store)
     print("✅ Qdrant 连接成功")
-    
+
     # 4. 返回 Index (注意：这里必须传入 embed_model，否则它会去下 OpenAI 的)
     return VectorStoreIndex.from_vector_store(
         vector_store=vector_store,
         embed_model=ModelFactory.get_embed_model() # 调用上面的工厂
     )
+
+
+async def ainit_index():
+    """
+    异步初始化 Index (启动预热用)。
+    集合检查 / 创建走 AsyncQdrantClient，模型加载和 Index 组装放到线程池，事件循环全程不被阻塞。
+    """
+    aclient = qdrant_client.AsyncQdrantClient(**settings.QDRANT_CLIENT_KWARGS)
+    try:
+        if not await aclient.collection_exists(collection_name=settings.COLLECTION_NAME):
+            print(f"⚠️ 集合 {settings.COLLECTION_NAME} 不存在，正在自动创建...")
+            await aclient.create_collection(**_collection_config())
+            print("✅ 集合创建成功！")
+        await aensure_payload_indexes(aclient)
+    finally:
+        await aclient.close()
+    return await asyncio.to_thread(get_index)
@@ -0,0 +1,118 @@
+# app/services/reranker.py
+# 动态微批 Reranker：把并发请求的 (query, passage) 对攒成一批，在事件循环之外统一跑 Cross-Encoder
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+
+@dataclass
+class _RerankRequest:
+    pairs: List[Tuple[str, str]]
+    future: asyncio.Future
+
+
+class MicroBatchReranker:
+    """
+    - 调用方通过 apostprocess_nodes 提交自己的候选文档，拿回的只是自己的打分结果
+    - 后台 worker 在 batch_window_ms 内尽量攒满 max_batch_size 个 pair，再一次性推理
+    - 推理跑在单线程执行器里：事件循环不被阻塞，多批之间也不会互相抢 CPU
+    """
+
+    def __init__(self, model, top_n: int = 3, max_batch_size: int = 64, batch_window_ms: float = 10.0):
+        self.model = model  # FlagEmbedding.FlagReranker (或任何带 compute_score(pairs) 的模型)
+        self.top_n = top_n
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window_ms / 1000
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop = None
+
+    # ---------- 推理 ----------
+    def _score(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        scores = self.model.compute_score([list(p) for p in pairs])
+        # 只有一个 pair 时 FlagReranker 返回的是单个 float
+        if not isinstance(scores, list):
+            scores = [scores]
+        return [float(s) for s in scores]
+
+    def _apply_scores(self, nodes: List[NodeWithScore], scores: List[float]) -> List[NodeWithScore]:
+        for node, score in zip(nodes, scores):
+            node.score = score
+        return sorted(nodes, key=lambda n: n.score, reverse=True)[: self.top_n]
+
+    # 与 FlagEmbeddingReranker 一致：带上参与 Embedding 的元数据打分，阈值才能通用
+    def postprocess_nodes(self, nodes: List[NodeWithScore], query_str: str) -> List[NodeWithScore]:
+        """同步接口 (兼容 LlamaIndex Postprocessor 的调用方式)，不参与微批"""
+        if not nodes:
+            return []
+        pairs = [(query_str, n.node.get_content(metadata_mode=MetadataMode.EMBED)) for n in nodes]
+        return self._apply_scores(nodes, self._score(pairs))
+
+    # ---------- 微批 ----------
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def _collect_batch(self) -> List[_RerankRequest]:
+        first = await self._queue.get()
+        batch = [first]
+        size = len(first.pairs)
+        deadline = self._loop.time() + self.batch_window
+        while size < self.max_batch_size:
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item.pairs)
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            # 调用方可能已经取消 (比如客户端断开)，这些请求不再推理
+            batch = [req for req in batch if not req.future.done()]
+            if not batch:
+                continue
+            all_pairs = [p for req in batch for p in req.pairs]
+            try:
+                scores = await self._loop.run_in_executor(self._executor, self._score, all_pairs)
+            except Exception as e:
+                for req in batch:
+                    if not req.future.done():
+                        req.future.set_exception(e)
+                continue
+
+            if len(batch) > 1:
+                print(f"📦 [Reranker] 合并 {len(batch)} 个请求，共 {len(all_pairs)} 个 pair")
+            # 按提交顺序切回各自的分数
+            offset = 0
+            for req in batch:
+                n = len(req.pairs)
+                if not req.future.done():
+                    req.future.set_result(scores[offset: offset + n])
+                offset += n
+
+    async def ascore(self, query_str: str, passages: List[str]) -> List[float]:
+        if not passages:
+            return []
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put(_RerankRequest(pairs=[(query_str, p) for p in passages], future=future))
+        return await future
+
+    async def apostprocess_nodes(self, nodes: List[NodeWithScore], query_str: str) -> List[NodeWithScore]:
+        if not nodes:
+            return []
+        scores = await self.ascore(query_str, [n.node.get_content(metadata_mode=MetadataMode.EMBED) for n in nodes])
+        return self._apply_scores(nodes, scores)
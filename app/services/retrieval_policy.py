@@ -0,0 +1,73 @@
+# app/services/retrieval_policy.py
+# 自适应检索：根据第一轮召回的分数分布决定 召回深度 / 是否重排 / 是否直接判定未找到
+import threading
+from typing import Dict, List
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# 路径说明
+# not_found : 最高分低于下限，直接返回未找到 (省掉重排)
+# decisive  : 第一名遥遥领先，跳过 Reranker，直接用检索排序
+# expanded  : 分数分布太平，扩大召回数后再重排
+# reranked  : 常规路径，第一轮结果直接重排
+# fixed     : 关闭自适应 (RETRIEVAL_ADAPTIVE=False)，固定 top_k + 重排
+# code_lookup / sparse_only : 编号类查询的快速通道 (见 code_lookup)，不做稠密 Embedding 和重排
+PATHS = ("not_found", "decisive", "expanded", "reranked", "fixed", "code_lookup", "sparse_only")
+
+
+class RetrievalPolicy:
+    def __init__(self, initial_k: int, max_k: int, floor: float, decisive_score: float,
+                 decisive_margin: float, flat_spread: float):
+        self.initial_k = initial_k
+        self.max_k = max_k
+        self.floor = floor
+        self.decisive_score = decisive_score
+        self.decisive_margin = decisive_margin
+        self.flat_spread = flat_spread
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {p: {"count": 0, "total_ms": 0.0} for p in PATHS}
+
+    def decide(self, scores: List[float]) -> str:
+        """
+        scores 为第一轮 (initial_k) 稠密一路的原始余弦相似度，降序。
+        不用融合分：融合分是 min-max 归一化后的相对值，首尾天然拉开、单条结果时量级不定
+        """
+        if not scores or scores[0] < self.floor:
+            return "not_found"
+        top = scores[0]
+        second = scores[1] if len(scores) > 1 else 0.0
+        if top >= self.decisive_score and top - second >= self.decisive_margin:
+            return "decisive"
+        # 召回满了且首尾几乎没有区分度：正确答案可能排在 initial_k 之外
+        if len(scores) >= self.initial_k and top - scores[-1] < self.flat_spread and self.max_k > self.initial_k:
+            return "expanded"
+        return "reranked"
+
+    def record(self, path: str, elapsed_ms: float):
+        with self._lock:
+            self._stats[path]["count"] += 1
+            self._stats[path]["total_ms"] += elapsed_ms
+
+    def stats(self) -> dict:
+        """各路径的次数和平均耗时 (进程内统计)，用来对比跳过重排省下的延迟"""
+        with self._lock:
+            return {
+                path: {
+                    "count": int(v["count"]),
+                    "avg_ms": round(v["total_ms"] / v["count"], 1) if v["count"] else None,
+                }
+                for path, v in self._stats.items()
+            }
+
+
+# 单例模式
+retrieval_policy = RetrievalPolicy(
+    initial_k=settings.RETRIEVAL_INITIAL_K,
+    max_k=settings.RETRIEVAL_MAX_K,
+    floor=settings.RETRIEVAL_SCORE_FLOOR,
+    decisive_score=settings.RETRIEVAL_DECISIVE_SCORE,
+    decisive_margin=settings.RETRIEVAL_DECISIVE_MARGIN,
+    flat_spread=settings.RETRIEVAL_FLAT_SPREAD,
+)
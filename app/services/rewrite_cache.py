@@ -0,0 +1,104 @@
+# app/services/rewrite_cache.py
+# 查询改写结果缓存 (Redis)
+# "那上个月呢" 这类追问在不同会话里反复出现，最近历史也完全一样，没必要每次都调 qwen-turbo。
+import re
+import time
+import hashlib
+import unicodedata
+from typing import Optional
+from app.core.redis import redis_manager
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# 句尾标点不影响改写结果，归一化时去掉
+_TRAILING_PUNCT = "?？。.!！,，~～ "
+
+
+def _normalize(text: str) -> str:
+    """归一化：全角转半角、合并空白、转小写、去掉句尾标点"""
+    text = unicodedata.normalize("NFKC", text or "")
+    text = re.sub(r"\s+", " ", text).strip().lower()
+    return text.rstrip(_TRAILING_PUNCT)
+
+
+class RewriteCache:
+    """
+    Key 设计：
+    - rewrite_cache:{digest}  -> 改写后的问题 (带 TTL)
+    - rewrite_cache:lru       -> ZSET，score 为最近访问时间，超过容量时淘汰最久未用的条目
+    - rewrite_cache:stats     -> HASH，hits / misses 计数
+    """
+    PREFIX = "rewrite_cache"
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lru_key = f"{self.PREFIX}:lru"
+        self.stats_key = f"{self.PREFIX}:stats"
+
+    @staticmethod
+    def make_digest(history_str: str, latest_question: str) -> str:
+        raw = f"{_normalize(history_str)}\x1f{_normalize(latest_question)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _entry_key(self, digest: str) -> str:
+        return f"{self.PREFIX}:{digest}"
+
+    async def get(self, history_str: str, latest_question: str) -> Optional[str]:
+        client = redis_manager.get_async_client()
+        digest = self.make_digest(history_str, latest_question)
+        value = await client.get(self._entry_key(digest))
+
+        pipe = client.pipeline(transaction=False)
+        if value is None:
+            pipe.hincrby(self.stats_key, "misses", 1)
+        else:
+            pipe.hincrby(self.stats_key, "hits", 1)
+            pipe.zadd(self.lru_key, {digest: time.time()})  # 刷新 LRU 时间
+        await pipe.execute()
+        return value
+
+    async def set(self, history_str: str, latest_question: str, rewritten: str):
+        client = redis_manager.get_async_client()
+        digest = self.make_digest(history_str, latest_question)
+        now = time.time()
+
+        pipe = client.pipeline(transaction=False)
+        pipe.set(self._entry_key(digest), rewritten, ex=self.ttl)
+        pipe.zadd(self.lru_key, {digest: now})
+        # 已经 TTL 过期的条目直接从 LRU 索引里清掉
+        pipe.zremrangebyscore(self.lru_key, 0, now - self.ttl)
+        pipe.zcard(self.lru_key)
+        *_, size = await pipe.execute()
+
+        # LRU 淘汰：超出容量时删除最久未访问的条目
+        overflow = size - self.max_entries
+        if overflow > 0:
+            evicted = await client.zpopmin(self.lru_key, overflow)
+            if evicted:
+                await client.delete(*[self._entry_key(d) for d, _ in evicted])
+                await client.hincrby(self.stats_key, "evictions", len(evicted))
+
+    async def stats(self) -> dict:
+        client = redis_manager.get_async_client()
+        raw = await client.hgetall(self.stats_key)
+        size = await client.zcard(self.lru_key)
+        hits = int(raw.get("hits", 0))
+        misses = int(raw.get("misses", 0))
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": int(raw.get("evictions", 0)),
+            "size": size,
+            "max_entries": self.max_entries,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
+
+
+# 单例模式
+rewrite_cache = RewriteCache(
+    ttl=settings.REWRITE_CACHE_TTL_SECONDS,
+    max_entries=settings.REWRITE_CACHE_MAX_ENTRIES,
+)
@@ -0,0 +1,165 @@
+# app/services/semantic_cache.py
+# 语义答案缓存：在 Agent 之前拦截近似重复的问题，直接回放已生成的答案
+import time
+import uuid
+from typing import List, Optional
+from app.core.redis import redis_manager
+from app.core.config import get_settings
+from app.services.llm_factory import ModelFactory
+
+settings = get_settings()
+
+
+class SemanticCache:
+    """
+    - 向量存在独立的 Qdrant 集合里 (settings.SEMANTIC_CACHE_COLLECTION)，和知识库互不干扰
+    - 每条缓存带 generation 字段；知识库有新文档入库时 generation +1，
+      旧答案立刻失效 (查询时只匹配当前 generation)，随后再异步删除
+    - semantic_cache:stats 记录 hits / misses
+    """
+    PREFIX = "semantic_cache"
+
+    def __init__(self, collection_name: str, threshold: float, ttl: int):
+        self.collection_name = collection_name
+        self.threshold = threshold
+        self.ttl = ttl
+        self.generation_key = f"{self.PREFIX}:generation"
+        self.stats_key = f"{self.PREFIX}:stats"
+        self._client = None
+        self._aclient = None
+        self._collection_ready = False
+
+    # qdrant_client 按需导入：只调 stats / 不开缓存的进程不需要加载它
+    def _get_client(self):
+        if self._client is None:
+            import qdrant_client
+            self._client = qdrant_client.QdrantClient(**settings.QDRANT_CLIENT_KWARGS)
+        return self._client
+
+    def _get_aclient(self):
+        if self._aclient is None:
+            import qdrant_client
+            self._aclient = qdrant_client.AsyncQdrantClient(**settings.QDRANT_CLIENT_KWARGS)
+        return self._aclient
+
+    async def _ensure_collection(self, dim: int):
+        if self._collection_ready:
+            return
+        from qdrant_client import models
+        aclient = self._get_aclient()
+        if not await aclient.collection_exists(self.collection_name):
+            print(f"⚠️ 缓存集合 {self.collection_name} 不存在，正在自动创建...")
+            await aclient.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE),
+            )
+            await aclient.create_payload_index(
+                collection_name=self.collection_name,
+                field_name="generation",
+                field_schema=models.PayloadSchemaType.INTEGER,
+            )
+        self._collection_ready = True
+
+    async def _embed(self, query: str) -> List[float]:
+        # 走查询向量缓存；未命中时在线程池里计算，不阻塞事件循环
+        embed_model = ModelFactory.get_embed_model()
+        return await embed_model.aget_query_embedding(query)
+
+    async def current_generation(self) -> int:
+        value = await redis_manager.get_async_client().get(self.generation_key)
+        return int(value) if value else 0
+
+    async def lookup(self, query: str, generation: int) -> Optional[dict]:
+        """
+        命中返回 {"answer", "sources", "score"}，未命中返回 None。
+        generation 由调用方在回答开始前读取，之后 store 也用同一个值
+        """
+        from qdrant_client import models
+        vector = await self._embed(query)
+        hit = None
+        try:
+            await self._ensure_collection(len(vector))
+            response = await self._get_aclient().query_points(
+                collection_name=self.collection_name,
+                query=vector,
+                limit=1,
+                score_threshold=self.threshold,
+                query_filter=models.Filter(must=[
+                    models.FieldCondition(key="generation", match=models.MatchValue(value=generation)),
+                    models.FieldCondition(key="created_at", range=models.Range(gte=time.time() - self.ttl)),
+                ]),
+                with_payload=True,
+            )
+            if response.points:
+                point = response.points[0]
+                hit = {
+                    "answer": point.payload.get("answer", ""),
+                    "sources": point.payload.get("sources", []),
+                    "score": point.score,
+                }
+        finally:
+            await redis_manager.get_async_client().hincrby(self.stats_key, "hits" if hit else "misses", 1)
+        return hit
+
+    async def store(self, query: str, answer: str, sources: list, generation: int):
+        """
+        generation 必须是生成答案之前读到的值：期间知识库有更新 (invalidate) 时，
+        这条答案会落在旧 generation 下，不会被当成新答案命中
+        """
+        from qdrant_client import models
+        vector = await self._embed(query)
+        await self._ensure_collection(len(vector))
+        await self._get_aclient().upsert(
+            collection_name=self.collection_name,
+            points=[models.PointStruct(
+                id=str(uuid.uuid4()),
+                vector=vector,
+                payload={
+                    "query": query,
+                    "answer": answer,
+                    "sources": sources,
+                    "generation": generation,
+                    "created_at": time.time(),
+                },
+            )],
+        )
+
+    def invalidate(self):
+        """
+        知识库变更时调用 (同步，供后台入库任务使用)。
+        先 bump generation 让旧答案立即失效，再尽力清理旧数据点。
+        """
+        from qdrant_client import models
+        new_generation = redis_manager.get_client().incr(self.generation_key)
+        print(f"🧹 [SemanticCache] 知识库已更新，缓存 generation -> {new_generation}")
+        try:
+            client = self._get_client()
+            if client.collection_exists(self.collection_name):
+                client.delete(
+                    collection_name=self.collection_name,
+                    points_selector=models.FilterSelector(filter=models.Filter(must=[
+                        models.FieldCondition(key="generation", range=models.Range(lt=new_generation)),
+                    ])),
+                )
+        except Exception as e:
+            print(f"⚠️ [SemanticCache] 清理旧缓存失败 (不影响正确性): {e}")
+
+    async def stats(self) -> dict:
+        raw = await redis_manager.get_async_client().hgetall(self.stats_key)
+        hits = int(raw.get("hits", 0))
+        misses = int(raw.get("misses", 0))
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "generation": await self.current_generation(),
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
+
+
+# 单例模式
+semantic_cache = SemanticCache(
+    collection_name=settings.SEMANTIC_CACHE_COLLECTION,
+    threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+    ttl=settings.SEMANTIC_CACHE_TTL_SECONDS,
+)
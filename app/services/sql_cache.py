@@ -0,0 +1,89 @@
+# app/services/sql_cache.py
+# query_business_data 结果缓存 (Redis)
+# "本周满意度是多少" 这类看板问题会反复生成同样的聚合 SQL，数据没变时没必要每次都查 MySQL。
+import re
+import hashlib
+from typing import Iterable, List, Optional
+from app.core.redis import redis_manager
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# 会被写入的业务表；SQL 里引用了哪些表，缓存 Key 就带上哪些表的版本号
+TRACKED_TABLES = ("feedbacks", "feedback_tags", "feedback_daily_stats", "feedback_daily_tag_stats")
+
+
+def normalize_sql(sql: str) -> str:
+    """合并引号外的空白、去掉末尾分号 (不改大小写，避免影响字符串字面量)"""
+    parts = re.split(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")", sql.strip().rstrip(";"))
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i])
+    return "".join(parts).strip()
+
+
+class SqlResultCache:
+    """
+    Key 设计：
+    - sql_cache:version:{table}          -> 表版本号 (INCR)，有写入时 +1
+    - sql_cache:{v1.v2...}:{digest}      -> 工具最终输出 (带 TTL)；版本号变化后旧 Key 不会再被读到，等 TTL 自然过期
+    - sql_cache:stats                    -> HASH，hits / misses / invalidations 计数
+    """
+    PREFIX = "sql_cache"
+
+    def __init__(self, ttl: int, tables: Iterable[str] = TRACKED_TABLES):
+        self.ttl = ttl
+        self.tables = tuple(tables)
+        self.stats_key = f"{self.PREFIX}:stats"
+
+    def _version_key(self, table: str) -> str:
+        return f"{self.PREFIX}:version:{table}"
+
+    def _tables_in(self, sql: str) -> List[str]:
+        lowered = sql.lower()
+        return [t for t in self.tables if re.search(rf"\b{re.escape(t)}\b", lowered)]
+
+    async def make_key(self, sql: str) -> str:
+        """读取当前表版本号拼进 Key：查询开始前取版本，期间有写入时结果存到旧版本下，不会被读到"""
+        normalized = normalize_sql(sql)
+        tables = self._tables_in(normalized)
+        versions = await redis_manager.get_async_client().mget([self._version_key(t) for t in tables]) if tables else []
+        version_tag = ".".join(v or "0" for v in versions) or "-"
+        digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+        return f"{self.PREFIX}:{version_tag}:{digest}"
+
+    async def get(self, key: str) -> Optional[str]:
+        client = redis_manager.get_async_client()
+        value = await client.get(key)
+        await client.hincrby(self.stats_key, "hits" if value is not None else "misses", 1)
+        return value
+
+    async def set(self, key: str, output: str):
+        await redis_manager.get_async_client().set(key, output, ex=self.ttl)
+
+    async def bump(self, *tables: str):
+        """业务表有写入时调用：版本号 +1，依赖这些表的缓存结果立即失效"""
+        client = redis_manager.get_async_client()
+        pipe = client.pipeline(transaction=False)
+        for table in tables:
+            pipe.incr(self._version_key(table))
+        pipe.hincrby(self.stats_key, "invalidations", 1)
+        await pipe.execute()
+
+    async def stats(self) -> dict:
+        client = redis_manager.get_async_client()
+        raw = await client.hgetall(self.stats_key)
+        versions = await client.mget([self._version_key(t) for t in self.tables])
+        hits = int(raw.get("hits", 0))
+        misses = int(raw.get("misses", 0))
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "invalidations": int(raw.get("invalidations", 0)),
+            "versions": {t: int(v or 0) for t, v in zip(self.tables, versions)},
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+        }
+
+
+# 单例模式
+sql_result_cache = SqlResultCache(ttl=settings.SQL_CACHE_TTL_SECONDS)
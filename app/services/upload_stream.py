@@ -0,0 +1,179 @@
+# app/services/upload_stream.py
+# 流式上传：直接解析 multipart 请求体，边收边写盘边算哈希
+# FastAPI 的 UploadFile 会先把整个请求体缓存 (SpooledTemporaryFile) 再进入接口函数，
+# 大小限制只能事后检查；这里在读到超限字节的那一刻就中止。
+import os
+import uuid
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import List, Optional
+
+from fastapi import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # 老版本 python-multipart
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+class UploadTooLarge(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"文件超过大小限制 ({limit // (1024 * 1024)} MB)")
+        self.limit = limit
+
+
+class InvalidUpload(Exception):
+    pass
+
+
+@dataclass
+class StreamedFile:
+    filename: str
+    tmp_path: str
+    size: int
+    sha256: str
+
+
+class _PartWriter:
+    """multipart 回调是同步的：这里只收集数据，真正的写盘在事件循环外 (to_thread) 完成"""
+
+    def __init__(self, field_name: str, upload_dir: str, max_bytes: int):
+        self.field_name = field_name
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.files: List[StreamedFile] = []
+        self._header_field = b""
+        self._header_value = b""
+        self._headers = {}
+        self._current: Optional[StreamedFile] = None
+        self._hash = None
+        self._fh = None
+        # 按顺序排队的写盘操作：(文件, 数据)；数据为 None 表示该文件已结束
+        self._ops: List[tuple] = []
+        self._created: List[str] = []
+
+    # ---------- MultipartParser 回调 ----------
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("utf-8", "replace")
+        filename = options.get(b"filename")
+        if name == self.field_name and filename:
+            # 只保留文件名部分，防止 ../ 路径穿越
+            filename = os.path.basename(filename.decode("utf-8", "replace").replace("\\", "/"))
+            tmp_path = os.path.join(self.upload_dir, f".{uuid.uuid4()}.part")
+            self._created.append(tmp_path)
+            self._current = StreamedFile(filename=filename, tmp_path=tmp_path, size=0, sha256="")
+            self._hash = hashlib.sha256()
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._current is None:
+            return
+        chunk = data[start:end]
+        self._current.size += len(chunk)
+        if self._current.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        self._hash.update(chunk)
+        self._ops.append((self._current, chunk))
+
+    def on_part_end(self):
+        if self._current is None:
+            return
+        self._current.sha256 = self._hash.hexdigest()
+        self._ops.append((self._current, None))
+        self._current = None
+
+    # ---------- 异步写盘 ----------
+    async def flush(self):
+        """把本轮收到的数据写到磁盘 (线程池里执行，不阻塞事件循环)"""
+        ops, self._ops = self._ops, []
+        i = 0
+        while i < len(ops):
+            target, data = ops[i]
+            if data is None:
+                if self._fh is None:  # 空文件
+                    self._fh = await asyncio.to_thread(open, target.tmp_path, "wb")
+                await asyncio.to_thread(self._fh.close)
+                self._fh = None
+                self.files.append(target)
+                i += 1
+                continue
+            # 同一个文件的连续数据合并成一次写入
+            chunks = []
+            while i < len(ops) and ops[i][0] is target and ops[i][1] is not None:
+                chunks.append(ops[i][1])
+                i += 1
+            if self._fh is None:
+                self._fh = await asyncio.to_thread(open, target.tmp_path, "wb")
+            await asyncio.to_thread(self._fh.write, b"".join(chunks))
+
+    @property
+    def in_progress(self) -> int:
+        return len(self.files) + (self._current is not None)
+
+    async def abort(self):
+        if self._fh is not None:
+            await asyncio.to_thread(self._fh.close)
+            self._fh = None
+        for path in self._created:
+            if os.path.exists(path):
+                await asyncio.to_thread(os.remove, path)
+
+
+async def stream_files_to_disk(request: Request, upload_dir: str, max_bytes: int,
+                               field_name: str = "file", max_files: int = 1) -> List[StreamedFile]:
+    """
+    把 multipart 请求里名为 field_name 的文件流式写入 upload_dir 下的临时文件。
+    - Content-Length 已经超限时不读请求体，直接拒绝
+    - 单个文件超过 max_bytes 时立即中止，并删除已写入的部分
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise InvalidUpload("请求必须是 multipart/form-data")
+
+    # 整个请求体的上限 = 单文件上限 * 文件数 + 少量 multipart 头部开销
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes * max_files + 64 * 1024:
+        raise UploadTooLarge(max_bytes)
+
+    writer = _PartWriter(field_name, upload_dir, max_bytes)
+    callbacks = {
+        "on_part_begin": writer.on_part_begin,
+        "on_header_field": writer.on_header_field,
+        "on_header_value": writer.on_header_value,
+        "on_header_end": writer.on_header_end,
+        "on_headers_finished": writer.on_headers_finished,
+        "on_part_data": writer.on_part_data,
+        "on_part_end": writer.on_part_end,
+    }
+    parser = MultipartParser(boundary, callbacks)
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            await writer.flush()
+            if writer.in_progress > max_files:
+                raise InvalidUpload(f"最多一次上传 {max_files} 个文件")
+        parser.finalize()
+        await writer.flush()
+    except BaseException:
+        await writer.abort()
+        raise
+
+    if not writer.files:
+        raise InvalidUpload(f"请求中没有找到文件字段 '{field_name}'")
+    return writer.files
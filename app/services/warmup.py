@@ -0,0 +1,66 @@
+# app/services/warmup.py
+# 启动预热：加载模型、初始化 Index、跑一次空推理，完成前 /ready 一直返回 503
+import time
+import asyncio
+from app.core.config import get_settings
+from app.services.llm_factory import ModelFactory
+
+settings = get_settings()
+
+
+class WarmupState:
+    def __init__(self):
+        self.enabled = settings.WARMUP_ON_STARTUP
+        # 不开启预热时，启动即就绪 (保持原来的懒加载行为)
+        self.ready = not self.enabled
+        self.stages = {}
+        self.error = None
+        self.duration_seconds = None
+
+    def to_dict(self) -> dict:
+        return {
+            "status": "ready" if self.ready else ("failed" if self.error else "warming_up"),
+            "warmup_enabled": self.enabled,
+            "stages": self.stages,
+            "error": self.error,
+            "duration_seconds": self.duration_seconds,
+        }
+
+
+warmup_state = WarmupState()
+
+
+async def _stage(name: str, coro):
+    start = time.perf_counter()
+    result = await coro
+    warmup_state.stages[name] = round(time.perf_counter() - start, 3)
+    print(f"   ✅ [Warmup] {name} ({warmup_state.stages[name]}s)")
+    return result
+
+
+async def run_warmup():
+    """按顺序预热各子系统；任意一步失败则保持 not-ready 并记录错误"""
+    from app.services.rag_engine import ainit_index
+    from app.services.agent_factory import AgentFactory
+    from app.services.prompt_registry import prompt_registry
+    print("🔥 [Warmup] 开始预热 ...")
+    start = time.perf_counter()
+    try:
+        embed_model = await _stage("embed_model", asyncio.to_thread(ModelFactory.get_embed_model))
+        reranker = await _stage("reranker", asyncio.to_thread(ModelFactory.get_reranker))
+        await _stage("index", ainit_index())
+        await _stage("prompts", prompt_registry.refresh())
+        await _stage("agent", asyncio.to_thread(AgentFactory.rebuild))
+        ModelFactory.get_http_client()
+
+        # 空推理：触发算子初始化 / 内存分配，首个真实请求不再付这部分开销
+        # 直接调用底层模型，避免预热文本进入查询向量缓存和命中率统计
+        await _stage("embed_inference", asyncio.to_thread(embed_model.inner.get_query_embedding, "预热"))
+        await _stage("rerank_inference", reranker.ascore("预热", ["预热文本"]))
+
+        warmup_state.ready = True
+        warmup_state.duration_seconds = round(time.perf_counter() - start, 3)
+        print(f"🔥 [Warmup] 预热完成，耗时 {warmup_state.duration_seconds}s")
+    except Exception as e:
+        warmup_state.error = str(e)
+        print(f"❌ [Warmup] 预热失败: {e}")
@@ -2,35 +2,150 @@
 # 文档检索工具
 from langchain.tools import tool
 from llama_index.core.vector_stores.types import VectorStoreQueryMode
-from app.services.rag_engine import get_index
+from typing import Optional
+from app.services.rag_engine import get_index, search_params, build_payload_filter, capture_dense_scores
+from app.services.document_registry import document_registry
+from app.services.retrieval_policy import retrieval_policy
+from app.services.code_lookup import code_lookup, route_codes
+from app.core.config import get_settings
 from app.services.llm_factory import ModelFactory
 import os
 import json
+import time
+
+settings = get_settings()
+
+
+def _not_found() -> str:
+    # 返回 JSON 格式的提示，而不是纯文本
+    return json.dumps({
+        "content": "系统提示：知识库中没有找到包含该问题答案的文档。请直接告诉用户未找到。",
+        "sources": [] # 空列表
+    }, ensure_ascii=False)
+
+
+async def _retrieve(index, query: str, top_k: int, payload_filter):
+    retriever = index.as_retriever(
+        similarity_top_k=top_k,
+        vector_store_query_mode=VectorStoreQueryMode.HYBRID, # 混合检索
+        alpha=0.5,
+        vector_store_kwargs={
+            # 量化集合：候选用量化向量召回，再用原始向量重打分
+            "search_params": search_params(),
+            "qdrant_filters": payload_filter,
+        },
+    )
+    return await retriever.aretrieve(query)
+
+
+async def _code_fast_path(index, query: str, codes, payload_filter):
+    """编号类查询：codes 索引精确匹配 → 纯稀疏检索；都没有结果时返回 None，交给常规检索"""
+    vector_store = index.vector_store
+    nodes = await code_lookup.lookup(vector_store, codes, payload_filter, top_n=settings.RERANK_TOP_N)
+    if nodes:
+        return nodes, "code_lookup"
+    nodes = await code_lookup.sparse_only(
+        vector_store, query, settings.RERANK_TOP_N, payload_filter, search_params=search_params()
+    )
+    if nodes:
+        return nodes, "sparse_only"
+    return None
+
+
+async def _adaptive_retrieve(index, reranker, query: str, payload_filter):
+    """返回 (最终节点, 走的路径)；决定性领先时节点分数是原始稠密相似度，否则是 Reranker 分数"""
+    if not settings.RETRIEVAL_ADAPTIVE:
+        nodes = await _retrieve(index, query, settings.RETRIEVAL_DEFAULT_K, payload_filter)
+        print(f"   检索到 {len(nodes)} 个文档。")
+        return await reranker.apostprocess_nodes(nodes, query_str=query), "fixed"
+
+    # 分流判断基于稠密一路的原始相似度 (跨查询可比)，融合分只决定排序
+    with capture_dense_scores() as dense_by_id:
+        nodes = await _retrieve(index, query, retrieval_policy.initial_k, payload_filter)
+    dense_scores = sorted(dense_by_id.values(), reverse=True)
+    path = retrieval_policy.decide(dense_scores)
+    # 融合排序的第一名和稠密第一名不一致时，领先并不确定，交给 Reranker
+    if path == "decisive" and (not nodes or dense_by_id.get(nodes[0].node.node_id) != dense_scores[0]):
+        path = "reranked"
+    print(f"   检索到 {len(nodes)} 个文档，稠密最高分 {dense_scores[0] if dense_scores else 0:.3f}，"
+          f"第二名 {dense_scores[1] if len(dense_scores) > 1 else 0:.3f}")
+
+    if path == "not_found":
+        return [], path
+    if path == "decisive":
+        # 跳过 Reranker：检索排序已经足够确定；分数换成原始稠密相似度，低于下限的不要
+        kept = []
+        for n in nodes[:settings.RERANK_TOP_N]:
+            n.score = dense_by_id.get(n.node.node_id, 0.0)
+            if n.score >= retrieval_policy.floor:
+                kept.append(n)
+        return kept, path
+    if path == "expanded":
+        nodes = await _retrieve(index, query, retrieval_policy.max_k, payload_filter)
+    # 3. 重排序 (微批执行器，不阻塞事件循环)
+    return await reranker.apostprocess_nodes(nodes, query_str=query), path
+
+
+async def _build_filter(file_name: Optional[str], source_type: Optional[str],
+                        uploaded_after: Optional[str], uploaded_before: Optional[str]):
+    """把工具参数翻译成 Qdrant payload 过滤；文件名先在登记表里解析成真实文件名"""
+    file_names = None
+    if file_name:
+        file_names = await document_registry.resolve_names(file_name)
+        if not file_names:
+            # 解析不到时不过滤，避免因为模型猜错文件名而漏检
+            print(f"   ⚠️ 未找到匹配 '{file_name}' 的文件，忽略文件名过滤")
+    try:
+        return build_payload_filter(file_names, source_type, uploaded_after, uploaded_before)
+    except ValueError:
+        print(f"   ⚠️ 日期格式无法解析 ({uploaded_after} ~ {uploaded_before})，忽略日期过滤")
+        return build_payload_filter(file_names, source_type)
+
+
 # 封装 Tools (工具):LangChain 的 @tool 装饰器非常关键，它会自动把函数的 docstring（注释）变成 Prompt 发给大模型，所以注释必须写得很清楚！
 @tool
-async def lookup_policy_doc(query: str) -> str:
+async def lookup_policy_doc(
+    query: str,
+    file_name: Optional[str] = None,
+    source_type: Optional[str] = None,
+    uploaded_after: Optional[str] = None,
+    uploaded_before: Optional[str] = None,
+) -> str:
     """
     【查文档工具】
      当用户询问公司的规章制度、合同细节、项目内容、请假流程等非结构化文本信息时，必须使用此工具。
      输入：具体的查询问题（例如："CG2023合同的金额是多少"）。
+     可选过滤 (只在问题明确指向时填写，否则留空)：
+     - file_name: 问题明确指向某个文件 / 合同时填写文件名或编号 (例如 "CG2023")
+     - source_type: 来源类型，目前只有 "file_download"
+     - uploaded_after / uploaded_before: 上传日期范围，格式 YYYY-MM-DD
     """
     try:
         # 1. 获取资源 (按需获取，不再是全局变量)
         index = get_index()  # 初始化索引
         reranker = ModelFactory.get_reranker()
 
+        # 结构化过滤：先缩小候选集，再做向量检索和重排序
+        payload_filter = await _build_filter(file_name, source_type, uploaded_after, uploaded_before)
+        if payload_filter is not None:
+            print(f"   🔎 检索过滤: file_name={file_name}, source_type={source_type}, 日期={uploaded_after}~{uploaded_before}")
 
-        # 2. 混合检索逻辑
-        retriever = index.as_retriever(
-            similarity_top_k=10, # 先多取一点
-            vector_store_query_mode=VectorStoreQueryMode.HYBRID, # 混合检索
-            alpha=0.5
-        )
-        nodes = await retriever.aretrieve(query)
-        print(f"   检索到 {len(nodes)} 个文档。")
-        
-        # 3. 重排序
-        filtered_nodes = reranker.postprocess_nodes(nodes, query_str=query)
+        # 2. 混合检索 + 自适应重排 (见 retrieval_policy)
+        start = time.perf_counter()
+        fast = None
+        codes = route_codes(query)
+        if codes:
+            print(f"   ⚡️ 编号类查询 {codes}，走快速通道")
+            fast = await _code_fast_path(index, query, codes, payload_filter)
+        if fast is not None:
+            filtered_nodes, path = fast
+        else:
+            filtered_nodes, path = await _adaptive_retrieve(index, reranker, query, payload_filter)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        retrieval_policy.record(path, elapsed_ms)
+        print(f"   🧭 [Retrieval] path={path} | {elapsed_ms:.0f}ms")
+        if path == "not_found":
+            return _not_found()
 
         # 分数截断逻辑
         # 阈值设定建议：
@@ -61,11 +176,7 @@ async def lookup_policy_doc(query: str) -> str:
                 })
         if not valid_nodes:
             print(f"🛑 [RAG Tool] 所有文档得分均低于 {SCORE_THRESHOLD}，返回未找到。")
-            # 👇 修改这里：返回 JSON 格式的提示，而不是纯文本
-            return json.dumps({
-                "content": "系统提示：知识库中没有找到包含该问题答案的文档。请直接告诉用户未找到。",
-                "sources": [] # 空列表
-            }, ensure_ascii=False)        
+            return _not_found()
         
         # 4. 结果组装
         context_str = "\n\n".join([n.text for n in valid_nodes])
@@ -4,15 +4,19 @@ from langchain.tools import tool
 from sqlalchemy import text
 # 数据库连接单独放到了 app/utils/database.py
 from app.utils.database import AsyncSessionLocal 
+from app.core.config import get_settings
+import re
 import json
-from langfuse import Langfuse
+import asyncio
+from app.services.prompt_registry import prompt_registry
+from app.services.sql_cache import sql_result_cache
 from langfuse.openai import openai
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
-# 👈 初始化实例 (Langfuse 会自动读取环境变量中的 Key)
-langfuse = Langfuse()
+settings = get_settings()
+
 
 @tool
 async def query_business_data(sql_query: str) -> str:
@@ -20,63 +24,169 @@ async def query_business_data(sql_query: str) -> str:
     【查数据库工具】
     当用户询问统计数据、数量、图表分析、反馈数量、满意度评分等结构化数据时，使用此工具。
     ⚠️ 注意：输入必须是可执行的 MySQL SQL 语句。
-    表结构：feedbacks(id, rating, tags, comment, created_at)。
+    表结构：feedbacks(id, rating, tags, comment, created_at)，feedback_tags(feedback_id, tag)，
+    汇总表 feedback_daily_stats(day, rating, feedback_count)、feedback_daily_tag_stats(day, rating, tag, feedback_count)。
+    按天 / 评分 / 标签的统计和趋势优先查汇总表。
     """
     return await execute_sql_query(sql_query)
 
+# 语句末尾的 LIMIT (MySQL 里顶层 LIMIT 只能出现在最后)：LIMIT n / LIMIT n OFFSET m / LIMIT m, n
+_TRAILING_LIMIT = re.compile(
+    r"\blimit\s+(\d+)(?:\s*,\s*(\d+)|\s+offset\s+(\d+))?\s*$", re.IGNORECASE
+)
+
+
+def _normalize_sql(sql_query: str) -> str:
+    return sql_query.strip().rstrip(";").strip()
+
+
+def _is_select(sql: str) -> bool:
+    return bool(re.match(r"^\(?\s*(select|with)\b", sql, re.IGNORECASE))
+
+
+def _pushdown_limit(sql: str, limit: int) -> str:
+    """把预览行数下推到 SQL：已有 LIMIT 取较小值，没有就追加"""
+    match = _TRAILING_LIMIT.search(sql)
+    if not match:
+        return f"{sql}\nLIMIT {limit}"
+    first, comma_count, offset = match.groups()
+    if comma_count is not None:
+        # LIMIT offset, count
+        return f"{sql[:match.start()]}LIMIT {first}, {min(int(comma_count), limit)}"
+    new_limit = f"LIMIT {min(int(first), limit)}"
+    if offset is not None:
+        new_limit += f" OFFSET {offset}"
+    return sql[:match.start()] + new_limit
+
+
+# MySQL: ER_QUERY_TIMEOUT (MAX_EXECUTION_TIME 到点中止)
+_MYSQL_QUERY_TIMEOUT = 3024
+
+
+def _is_count_timeout(e: Exception) -> bool:
+    if isinstance(e, asyncio.TimeoutError):
+        return True
+    orig = getattr(e, "orig", None)
+    return bool(orig is not None and getattr(orig, "args", None) and orig.args[0] == _MYSQL_QUERY_TIMEOUT)
+
+
+async def _count_total(sql: str, timeout: float):
+    """
+    单独连接执行 COUNT(*)；MAX_EXECUTION_TIME 让 MySQL 服务端到点自己中止，
+    客户端同时用 wait_for 兜底取消。
+    返回 (总数, 错误)：成功 (n, None)；超时 (None, "timeout")；其他失败 (None, 错误信息)
+    """
+    count_sql = f"SELECT /*+ MAX_EXECUTION_TIME({int(timeout * 1000)}) */ COUNT(*) FROM ({sql}) AS _total"
+    try:
+        async with AsyncSessionLocal() as session:
+            result = await asyncio.wait_for(session.execute(text(count_sql)), timeout=timeout + 0.5)
+            return result.scalar(), None
+    except Exception as e:
+        if _is_count_timeout(e):
+            print(f"⏱️ [SQL Tool] 总数统计超时，已取消")
+            return None, "timeout"
+        print(f"⚠️ [SQL Tool] 总数统计失败: {e}")
+        return None, str(e)
+
+
 async def execute_sql_query(sql_query: str):
     """
     [工具函数] 执行 SQL 查询并返回结果
+    相同的只读查询在表数据没变时直接返回缓存 (见 sql_result_cache)
     """
     # 🛡️ 安全防御：简单的关键词拦截，防止删库
     if "DROP" in sql_query.upper() or "DELETE" in sql_query.upper() or "UPDATE" in sql_query.upper():
         return "❌ 安全警告：禁止执行修改/删除操作，仅允许查询。"
 
+    sql = _normalize_sql(sql_query)
+    if not (settings.SQL_CACHE_ENABLED and _is_select(sql)):
+        return await _run_query(sql)
+
+    cache_key = None
+    try:
+        cache_key = await sql_result_cache.make_key(sql)
+        cached = await sql_result_cache.get(cache_key)
+        if cached is not None:
+            print("⚡️ [SQL Tool] 命中结果缓存")
+            return cached
+    except Exception as e:
+        # 缓存不可用时直接查库，不影响主流程
+        print(f"⚠️ [SQL Tool] 结果缓存读取失败: {e}")
+
+    output = await _run_query(sql)
+    # 执行失败的结果不缓存
+    if cache_key is not None and not output.startswith("❌"):
+        try:
+            await sql_result_cache.set(cache_key, output)
+        except Exception as e:
+            print(f"⚠️ [SQL Tool] 结果缓存写入失败: {e}")
+    return output
+
+
+async def _run_query(sql: str) -> str:
+    """
+    SELECT 语句的预览行数会下推成 LIMIT，并用流式游标读取；总数用单独的、可取消的 COUNT 查询统计
+    """
+    MAX_PREVIEW = settings.SQL_PREVIEW_ROWS
     try:
         async with AsyncSessionLocal() as session:
-            result = await session.execute(text(sql_query))
+            # 多取 1 行用来判断是否还有更多数据
+            run_sql = _pushdown_limit(sql, MAX_PREVIEW + 1) if _is_select(sql) else sql
+            # 流式游标 (服务端游标)：只拉取需要的行，不会把整张表读进内存
+            result = await session.stream(text(run_sql))
             keys = result.keys()
-            all_rows = result.fetchall()
-            
-            # 截断逻辑
-            MAX_PREVIEW = 10
-            total_real_count = len(all_rows)
-            
-            if total_real_count > MAX_PREVIEW:
-                display_rows = all_rows[:MAX_PREVIEW]
-                # 生成提示语
+            rows = await result.fetchmany(MAX_PREVIEW + 1)
+            await result.close()
+
+        # 截断逻辑
+        if len(rows) > MAX_PREVIEW:
+            display_rows = rows[:MAX_PREVIEW]
+            if _is_select(sql):
+                total_real_count, count_error = await _count_total(sql, settings.SQL_COUNT_TIMEOUT_SECONDS)
+            else:
+                total_real_count, count_error = None, None
+            # 生成提示语
+            if total_real_count is not None:
                 note_text = f"⚠️ 数据量较大(共{total_real_count}条)，已截取前 {MAX_PREVIEW} 条预览。"
+            elif count_error == "timeout":
+                note_text = f"⚠️ 数据量较大(超过{MAX_PREVIEW}条，总数统计超时)，已截取前 {MAX_PREVIEW} 条预览。"
+            elif count_error:
+                note_text = f"⚠️ 数据量较大(超过{MAX_PREVIEW}条，总数统计失败: {count_error})，已截取前 {MAX_PREVIEW} 条预览。"
             else:
-                display_rows = all_rows
-                # 如果是全量数据，就不需要 note，或者设为 None
-                note_text = None 
-
-            data = [dict(zip(keys, row)) for row in display_rows]
-            
-            if not data:
-                return "查询执行成功，但结果集为空。"
-
-            # 🟢 修正点：不要在这里定死 type="table"
-            # 我们返回一个纯净的数据包，让 LLM 自己决定怎么展示
-            tool_output = {
-                "raw_data": data,
-                "system_note": note_text
-            }
-            
-            # 序列化
-            json_str = json.dumps(tool_output, ensure_ascii=False, default=str)
-            
-            # 🟢 核心修改：从 Langfuse 获取指令模板
-            # SDK 默认有 60秒 缓存，不会影响性能
+                note_text = f"⚠️ 数据量较大(超过{MAX_PREVIEW}条)，已截取前 {MAX_PREVIEW} 条预览。"
+        else:
+            display_rows = rows
+            # 如果是全量数据，就不需要 note，或者设为 None
+            note_text = None 
+
+        data = [dict(zip(keys, row)) for row in display_rows]
+        
+        if not data:
+            return "查询执行成功，但结果集为空。"
+
+        # 🟢 修正点：不要在这里定死 type="table"
+        # 我们返回一个纯净的数据包，让 LLM 自己决定怎么展示
+        tool_output = {
+            "raw_data": data,
+            "system_note": note_text
+        }
+        
+        # 序列化
+        json_str = json.dumps(tool_output, ensure_ascii=False, default=str)
+        
+        # 🟢 核心修改：从 Langfuse 获取指令模板
+        # 由 PromptRegistry 后台刷新，这里只读本地缓存，不会有网络请求
+        instruction_prompt = prompt_registry.get("tool-sql-result-instruction")
+        if instruction_prompt is not None:
             try:
-               instruction_prompt = langfuse.get_prompt("tool-sql-result-instruction")
-               return instruction_prompt.compile(tool_output=json_str)
-            except Exception:
-            # 兜底：万一 Langfuse 挂了，使用硬编码的旧逻辑
-               return f"""
-            查询成功。请根据数据特征选择图表类型(bar/line/pie/table)。
-            数据: {json_str}
-            """
+                return instruction_prompt.compile(tool_output=json_str)
+            except Exception as e:
+                print(f"⚠️ SQL 结果指令编译失败: {e}")
+        # 兜底：万一 Langfuse 挂了，使用硬编码的旧逻辑
+        return f"""
+        查询成功。请根据数据特征选择图表类型(bar/line/pie/table)。
+        数据: {json_str}
+        """
 
     except Exception as e:
         return f"❌ SQL 执行失败: {str(e)}"
@@ -0,0 +1,28 @@
+# app/workers/feedback_rollup_rebuild.py
+# 从 feedbacks / feedback_tags 全量重建反馈汇总表
+# 用法: python -m app.workers.feedback_rollup_rebuild
+# 升级后执行一次 (需先执行 feedback_tags 迁移)；之后由 submit_feedback 增量维护
+import asyncio
+
+from app.utils.database import engine
+from app.core.models import FeedbackDailyStat, FeedbackDailyTagStat
+from app.services import feedback_rollup
+from app.services.sql_cache import sql_result_cache
+
+
+async def rebuild():
+    async with engine.begin() as conn:
+        for model in (FeedbackDailyStat, FeedbackDailyTagStat):
+            await conn.run_sync(lambda sync_conn, table=model.__table__: table.create(sync_conn, checkfirst=True))
+        await feedback_rollup.rebuild(conn)
+    await sql_result_cache.bump(*feedback_rollup.ROLLUP_TABLES)
+    await engine.dispose()
+
+
+def main():
+    asyncio.run(rebuild())
+    print("✅ 反馈汇总表重建完成")
+
+
+if __name__ == "__main__":
+    main()
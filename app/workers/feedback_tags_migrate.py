@@ -0,0 +1,54 @@
+# app/workers/feedback_tags_migrate.py
+# 一次性迁移：把 feedbacks.tags (逗号分隔字符串) 拆到 feedback_tags 关联表
+# 用法: python -m app.workers.feedback_tags_migrate [--batch-size 5000]
+# 可重复执行 (INSERT IGNORE)；新反馈由 submit_feedback 直接双写，迁移期间服务无需停机
+import asyncio
+import argparse
+
+from sqlalchemy import select
+from sqlalchemy.dialects.mysql import insert
+
+from app.utils.database import engine, AsyncSessionLocal
+from app.core.models import Feedback, FeedbackTag, split_tags
+from app.services.sql_cache import sql_result_cache
+
+
+async def migrate(batch_size: int) -> int:
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda sync_conn: FeedbackTag.__table__.create(sync_conn, checkfirst=True))
+
+    last_id, inserted = 0, 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            # 按主键分段读取，避免一次性拉取整张表
+            rows = (await session.execute(
+                select(Feedback.id, Feedback.tags)
+                .where(Feedback.id > last_id)
+                .order_by(Feedback.id)
+                .limit(batch_size)
+            )).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            values = [{"feedback_id": fid, "tag": tag} for fid, tags in rows for tag in split_tags(tags)]
+            if values:
+                result = await session.execute(insert(FeedbackTag).prefix_with("IGNORE"), values)
+                await session.commit()
+                inserted += max(result.rowcount or 0, 0)
+        print(f"⏳ 已处理到 feedbacks.id={last_id}，累计新增 {inserted} 条标签")
+
+    # 标签表数据变化：旧的 SQL 结果缓存作废
+    await sql_result_cache.bump("feedback_tags")
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="feedbacks.tags -> feedback_tags 迁移")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+    inserted = asyncio.run(migrate(args.batch_size))
+    print(f"✅ 反馈标签迁移完成，新增 {inserted} 条")
+
+
+if __name__ == "__main__":
+    main()
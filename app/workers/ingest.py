@@ -0,0 +1,127 @@
+# app/workers/ingest.py
+# 独立入库 Worker：python -m app.workers.ingest [--concurrency N]
+# 解析 / 切分 / 向量化都在这里完成，API 进程的事件循环和 CPU 不再被上传任务拖慢
+import os
+import time
+import signal
+import socket
+import argparse
+import threading
+
+from app.core.config import get_settings
+from app.core.redis import redis_manager
+from app.services.ingest_queue import ingest_queue
+from app.services.document_registry import document_registry
+
+settings = get_settings()
+r = redis_manager.get_client()
+
+_stop = threading.Event()
+
+
+def _handle_failure(consumer_id: str, raw: str, job: dict, error: Exception):
+    task_key = f"task:{job.get('task_id')}"
+    # attempts = 已失败的次数；第 attempts 次失败后进行第 attempts 次重试，最多 INGEST_MAX_RETRIES 次
+    attempts = job.get("attempts", 0) + 1
+    if attempts <= settings.INGEST_MAX_RETRIES:
+        # 指数退避：5s, 10s, 20s ...
+        delay = settings.INGEST_RETRY_BACKOFF_SECONDS * (2 ** (attempts - 1))
+        ingest_queue.retry_later(consumer_id, raw, job, delay)
+        r.hset(task_key, mapping={
+            "status": "retrying",
+            "message": f"处理失败，{delay:.0f}s 后第 {attempts}/{settings.INGEST_MAX_RETRIES} 次重试: {error}",
+            "attempts": attempts,
+        })
+        print(f"🔁 [Worker {consumer_id}] 任务 {job.get('task_id')} 失败，{delay:.0f}s 后重试: {error}")
+    else:
+        ingest_queue.ack(consumer_id, raw)
+        if job.get("original_filename"):
+            document_registry.mark_status(job["original_filename"], "failed", str(error))
+        r.hset(task_key, mapping={
+            "status": "failed",
+            "message": str(error),
+            "attempts": attempts,
+        })
+        r.expire(task_key, 3600)
+        print(f"❌ [Worker {consumer_id}] 任务 {job.get('task_id')} 已达最大重试次数: {error}")
+
+
+def consume(consumer_id: str):
+    """单个消费者循环：取任务 → 入库 → ACK；失败进入延迟队列"""
+    from app.services.file_service import ingest_file, ingest_batch
+
+    print(f"👷 [Worker {consumer_id}] 已启动")
+    while not _stop.is_set():
+        try:
+            ingest_queue.promote_delayed()
+            reserved = ingest_queue.reserve(consumer_id, timeout=2)
+        except Exception as e:
+            print(f"⚠️ [Worker {consumer_id}] Redis 异常: {e}")
+            time.sleep(1)
+            continue
+        if reserved is None:
+            continue
+
+        raw, job = reserved
+        try:
+            if job.get("type") == "batch":
+                ingest_batch(job["task_id"], job["files"])
+            else:
+                ingest_file(job["task_id"], job["file_path"], job["original_filename"], job["file_url"], job.get("file_hash"))
+            ingest_queue.ack(consumer_id, raw)
+        except Exception as e:
+            _handle_failure(consumer_id, raw, job, e)
+    print(f"👋 [Worker {consumer_id}] 已退出")
+
+
+def heartbeat_loop(consumer_ids):
+    """定期续约心跳，并回收崩溃 Worker 留下的孤儿任务"""
+    ttl = settings.INGEST_HEARTBEAT_TTL_SECONDS
+    interval = max(ttl // 3, 1)
+    while not _stop.is_set():
+        try:
+            for consumer_id in consumer_ids:
+                ingest_queue.heartbeat(consumer_id, ttl)
+            ingest_queue.requeue_orphans()
+        except Exception as e:
+            print(f"⚠️ [Worker] 心跳失败: {e}")
+        _stop.wait(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文件入库 Worker")
+    parser.add_argument("--concurrency", type=int, default=settings.INGEST_WORKER_CONCURRENCY)
+    args = parser.parse_args()
+
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    consumer_ids = [f"{prefix}:{i}" for i in range(max(args.concurrency, 1))]
+
+    # 先注册心跳再回收孤儿，避免把自己的任务当成孤儿
+    for consumer_id in consumer_ids:
+        ingest_queue.heartbeat(consumer_id, settings.INGEST_HEARTBEAT_TTL_SECONDS)
+    ingest_queue.requeue_orphans()
+
+    # 模型 / Index 在主线程提前加载一次，各消费者线程共享
+    from app.services.rag_engine import get_index
+    get_index()
+
+    def _shutdown(signum, frame):
+        print(f"🛑 [Worker] 收到信号 {signum}，处理完当前任务后退出 ...")
+        _stop.set()
+
+    signal.signal(signal.SIGTERM, _shutdown)
+    signal.signal(signal.SIGINT, _shutdown)
+
+    threads = [threading.Thread(target=heartbeat_loop, args=(consumer_ids,), daemon=True)]
+    threads += [threading.Thread(target=consume, args=(cid,), name=cid) for cid in consumer_ids]
+    for t in threads:
+        t.start()
+    print(f"🚀 [Worker] 入库 Worker 已启动，并发 {len(consumer_ids)}")
+
+    while any(t.is_alive() for t in threads[1:]):
+        for t in threads[1:]:
+            t.join(timeout=1)
+
+
+if __name__ == "__main__":
+    main()
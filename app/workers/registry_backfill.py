@@ -0,0 +1,21 @@
+# app/workers/registry_backfill.py
+# 一次性回填文档登记表：登记表上线前已经入库的文档 (只在 Qdrant 里有记录)
+# 用法: python -m app.workers.registry_backfill
+from app.core.config import get_settings
+from app.services.document_registry import document_registry
+
+settings = get_settings()
+
+
+def main():
+    import qdrant_client
+    client = qdrant_client.QdrantClient(**settings.QDRANT_CLIENT_KWARGS)
+    if not client.collection_exists(settings.COLLECTION_NAME):
+        print(f"⚠️ 集合 {settings.COLLECTION_NAME} 不存在，无需回填")
+        return
+    added = document_registry.backfill_from_qdrant(client, settings.COLLECTION_NAME)
+    print(f"✅ 文档登记表回填完成，新增 {added} 个文档")
+
+
+if __name__ == "__main__":
+    main()
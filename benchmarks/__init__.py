@@ -0,0 +1 @@
+# 性能基准 & 一致性检查脚本 (python -m benchmarks.xxx)
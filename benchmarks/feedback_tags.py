@@ -0,0 +1,135 @@
+# benchmarks/feedback_tags.py
+# 反馈标签统计：feedbacks.tags LIKE 全表扫描 vs feedback_tags 索引 + GROUP BY
+# 用法: python -m benchmarks.feedback_tags [--rows 1000000] [--repeat 5] [--keep]
+# 需要可写的 MySQL (settings 里的库)；在 bench_ 前缀的临时表上测试，不碰业务表，默认测完删除
+import time
+import random
+import asyncio
+import argparse
+import datetime
+
+import numpy as np
+from sqlalchemy import text
+
+from app.utils.database import engine
+
+TAGS = ["答非所问", "数据陈旧", "过于冗长", "格式错误", "引用缺失", "回答太慢", "内容有误", "其他"]
+# 标签热度不均匀 (和线上分布接近)：前几个标签占大头
+TAG_WEIGHTS = [30, 20, 15, 10, 10, 8, 5, 2]
+
+DDL = [
+    """CREATE TABLE IF NOT EXISTS bench_feedbacks (
+        id INT PRIMARY KEY AUTO_INCREMENT,
+        session_id VARCHAR(100),
+        rating INT DEFAULT 0,
+        tags VARCHAR(255),
+        created_at DATETIME,
+        INDEX ix_bench_feedbacks_session_id (session_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS bench_feedback_tags (
+        feedback_id INT NOT NULL,
+        tag VARCHAR(64) NOT NULL,
+        PRIMARY KEY (feedback_id, tag),
+        INDEX ix_bench_feedback_tags_tag (tag, feedback_id)
+    )""",
+]
+
+QUERIES = [
+    (
+        "单标签计数",
+        "SELECT COUNT(*) FROM bench_feedbacks WHERE tags LIKE '%答非所问%'",
+        "SELECT COUNT(*) FROM bench_feedback_tags WHERE tag = '答非所问'",
+    ),
+    (
+        "标签分布",
+        " UNION ALL ".join(
+            f"SELECT '{t}' AS tag, COUNT(*) FROM bench_feedbacks WHERE tags LIKE '%{t}%'" for t in TAGS
+        ),
+        "SELECT tag, COUNT(*) FROM bench_feedback_tags GROUP BY tag",
+    ),
+    (
+        "差评里的标签",
+        "SELECT COUNT(*) FROM bench_feedbacks WHERE rating = 0 AND tags LIKE '%数据陈旧%'",
+        "SELECT COUNT(*) FROM bench_feedback_tags t JOIN bench_feedbacks f ON f.id = t.feedback_id "
+        "WHERE t.tag = '数据陈旧' AND f.rating = 0",
+    ),
+]
+
+
+async def populate(n_rows: int, batch_size: int = 10000, seed: int = 42):
+    rng = random.Random(seed)
+    start_date = datetime.datetime.now() - datetime.timedelta(days=365)
+    async with engine.begin() as conn:
+        for ddl in DDL:
+            await conn.execute(text(ddl))
+        existing = (await conn.execute(text("SELECT COUNT(*) FROM bench_feedbacks"))).scalar()
+    if existing >= n_rows:
+        print(f"♻️ 复用已有的 {existing} 条测试数据")
+        return
+
+    print(f"🧪 写入 {n_rows} 条测试反馈 ...")
+    for offset in range(existing, n_rows, batch_size):
+        feedbacks, tag_rows = [], []
+        for fid in range(offset + 1, min(offset + batch_size, n_rows) + 1):
+            tags = sorted(set(rng.choices(TAGS, weights=TAG_WEIGHTS, k=rng.randint(0, 3))))
+            feedbacks.append({
+                "id": fid,
+                "session_id": f"s{rng.randint(1, n_rows // 5)}",
+                "rating": rng.randint(0, 1),
+                "tags": ",".join(tags),
+                "created_at": start_date + datetime.timedelta(seconds=rng.randint(0, 365 * 86400)),
+            })
+            tag_rows.extend({"feedback_id": fid, "tag": tag} for tag in tags)
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                "INSERT INTO bench_feedbacks (id, session_id, rating, tags, created_at) "
+                "VALUES (:id, :session_id, :rating, :tags, :created_at)"
+            ), feedbacks)
+            if tag_rows:
+                await conn.execute(text(
+                    "INSERT INTO bench_feedback_tags (feedback_id, tag) VALUES (:feedback_id, :tag)"
+                ), tag_rows)
+    async with engine.begin() as conn:
+        await conn.execute(text("ANALYZE TABLE bench_feedbacks, bench_feedback_tags"))
+
+
+async def _time(sql: str, repeat: int) -> float:
+    latencies = []
+    async with engine.connect() as conn:
+        await conn.execute(text(sql))  # 预热 (buffer pool)
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            (await conn.execute(text(sql))).all()
+            latencies.append((time.perf_counter() - t0) * 1000)
+    return float(np.median(latencies))
+
+
+async def run(n_rows: int, repeat: int, keep: bool):
+    # 关掉 SQL 回显，否则 10 万级 INSERT 参数会刷屏
+    engine.echo = False
+    try:
+        await populate(n_rows)
+        print(f"\n{'query':<14}{'LIKE 扫描(ms)':>16}{'feedback_tags(ms)':>20}{'加速':>8}")
+        print("-" * 58)
+        for name, like_sql, tag_sql in QUERIES:
+            like_ms = await _time(like_sql, repeat)
+            tag_ms = await _time(tag_sql, repeat)
+            print(f"{name:<14}{like_ms:>16.1f}{tag_ms:>20.1f}{like_ms / tag_ms:>7.1f}x")
+    finally:
+        if not keep:
+            async with engine.begin() as conn:
+                await conn.execute(text("DROP TABLE IF EXISTS bench_feedback_tags, bench_feedbacks"))
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="反馈标签统计：LIKE vs 关联表索引")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="保留测试表，下次直接复用")
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.repeat, args.keep))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# benchmarks/id_fast_path.py
+# 编号类查询快速通道 vs 常规混合检索 + 重排：延迟对比
+# 用法: python -m benchmarks.id_fast_path [--queries 100]
+# 需要已入库的知识库 (从集合里抽样真实编号作为查询)
+import time
+import asyncio
+import argparse
+import random
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.services.code_lookup import code_lookup, extract_codes, CODES_METADATA_KEY
+
+settings = get_settings()
+
+
+def sample_codes(client, n: int, seed: int = 7) -> list:
+    """从集合里抽样编号：优先用 codes 字段，旧切片没有时从正文里提取"""
+    codes, offset = set(), None
+    while len(codes) < n * 5:
+        points, offset = client.scroll(
+            collection_name=settings.COLLECTION_NAME,
+            limit=256,
+            offset=offset,
+            with_payload=[CODES_METADATA_KEY, "_node_content"],
+            with_vectors=False,
+        )
+        for point in points:
+            payload = point.payload or {}
+            codes.update(payload.get(CODES_METADATA_KEY) or extract_codes(payload.get("_node_content", "")))
+        if offset is None:
+            break
+    codes = sorted(c for c in codes if any(ch.isalpha() for ch in c))
+    random.Random(seed).shuffle(codes)
+    return codes[:n]
+
+
+async def _timed(fn, queries) -> list:
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        await fn(q)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def run(n_queries: int):
+    from app.services.rag_engine import get_index, search_params
+    from app.services.llm_factory import ModelFactory
+    from app.tools import policy_tool
+
+    index = get_index()
+    reranker = ModelFactory.get_reranker()
+    vector_store = index.vector_store
+
+    codes = sample_codes(vector_store.client, n_queries)
+    if not codes:
+        print("⚠️ 集合里没有找到编号，无法构造查询")
+        return
+    print(f"🧪 抽样 {len(codes)} 个编号作为查询 (例如 {codes[:3]})")
+
+    async def hybrid_rerank(code):
+        # 每个编号只查一次，查询向量缓存不会命中 (QUERY_EMBED_CACHE_REDIS 开启时旧结果可能命中，建议关闭)
+        nodes = await policy_tool._retrieve(index, code, settings.RETRIEVAL_DEFAULT_K, None)
+        await reranker.apostprocess_nodes(nodes, query_str=code)
+
+    async def code_index(code):
+        await code_lookup.lookup(vector_store, [code], None, top_n=settings.RERANK_TOP_N)
+
+    async def sparse_only(code):
+        await code_lookup.sparse_only(vector_store, code, settings.RERANK_TOP_N, None, search_params=search_params())
+
+    # 预热 (模型加载 / 连接建立不计入)，用一个不在查询集里的文本
+    warm = "WARMUP0000"
+    for fn in (hybrid_rerank, code_index, sparse_only):
+        await fn(warm)
+
+    rows = []
+    for name, fn in (("hybrid+rerank", hybrid_rerank), ("sparse_only", sparse_only), ("code_lookup", code_index)):
+        latencies = await _timed(fn, codes)
+        rows.append((name, np.percentile(latencies, 50), np.percentile(latencies, 95), np.mean(latencies)))
+
+    hits = 0
+    for code in codes:
+        if await code_lookup.lookup(vector_store, [code], None, top_n=1):
+            hits += 1
+
+    base = rows[0][3]
+    print(f"\n{'path':<16}{'p50(ms)':>10}{'p95(ms)':>10}{'mean(ms)':>10}{'加速':>8}")
+    print("-" * 54)
+    for name, p50, p95, mean in rows:
+        print(f"{name:<16}{p50:>10.1f}{p95:>10.1f}{mean:>10.1f}{base / mean:>7.1f}x")
+    print(f"\ncodes 索引命中率: {hits}/{len(codes)} (未命中的查询线上会退到 sparse_only)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="编号类查询快速通道延迟对比")
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.queries))
+
+
+if __name__ == "__main__":
+    main()
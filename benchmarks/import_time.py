@@ -0,0 +1,93 @@
+# benchmarks/import_time.py
+# 启动耗时预算检查：profile `import app.main`，超预算或提前加载了重依赖则以非 0 退出 (可直接放进 CI)
+# 用法: python -m benchmarks.import_time [--budget-ms 1500] [--top 15]
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# 这些依赖必须在各自子系统第一次被使用时才加载
+HEAVY_MODULES = [
+    "torch",
+    "transformers",
+    "FlagEmbedding",
+    "llama_index",
+    "langchain",
+    "langchain_core",
+    "langchain_openai",
+    "langfuse",
+    "qdrant_client",
+    "dashscope",
+    "onnxruntime",
+]
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import app.main
+elapsed_ms = (time.perf_counter() - start) * 1000
+heavy = %r
+loaded = sorted(m for m in heavy if m in sys.modules)
+print("__IMPORT_RESULT__" + json.dumps({"elapsed_ms": elapsed_ms, "loaded_heavy": loaded}))
+""" % (HEAVY_MODULES,)
+
+
+def parse_importtime(stderr: str):
+    """解析 -X importtime 输出，返回 [(cumulative_us, module, depth)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # 格式: "import time: <self_us> | <cumulative_us> | <缩进><module>"
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(cumulative_us.strip()), name.strip(), depth))
+    return rows
+
+
+def run_probe():
+    env = dict(os.environ)
+    # 只测导入耗时，不真正连库；database.py 在导入时要求 MYSQL_PASSWORD 存在
+    env.setdefault("MYSQL_PASSWORD", "import-time-probe")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    result = None
+    for line in proc.stdout.splitlines():
+        if line.startswith("__IMPORT_RESULT__"):
+            result = json.loads(line[len("__IMPORT_RESULT__"):])
+    if proc.returncode != 0 or result is None:
+        print(proc.stdout)
+        print(proc.stderr[-4000:])
+        raise SystemExit(f"❌ import app.main 失败 (exit={proc.returncode})")
+    return result, parse_importtime(proc.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_BUDGET_MS", 1500)))
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    result, rows = run_probe()
+
+    print(f"⏱️ import app.main: {result['elapsed_ms']:.0f} ms (预算 {args.budget_ms:.0f} ms)")
+    print("\n📦 耗时最多的顶层依赖 (cumulative):")
+    top_level = sorted((r for r in rows if r[2] == 0), reverse=True)[: args.top]
+    for cumulative_us, name, _ in top_level:
+        print(f"   {cumulative_us / 1000:>8.1f} ms  {name}")
+
+    failed = False
+    if result["elapsed_ms"] > args.budget_ms:
+        print(f"\n❌ 超出启动耗时预算: {result['elapsed_ms']:.0f} ms > {args.budget_ms:.0f} ms")
+        failed = True
+    if result["loaded_heavy"]:
+        print(f"\n❌ 以下重依赖在启动时被提前加载: {', '.join(result['loaded_heavy'])}")
+        failed = True
+    if not failed:
+        print("\n✅ 启动耗时预算检查通过")
+    raise SystemExit(1 if failed else 0)
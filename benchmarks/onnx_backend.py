@@ -0,0 +1,121 @@
+# benchmarks/onnx_backend.py
+# ONNX Runtime 后端：与 PyTorch 的一致性检查 + 吞吐对比
+# 用法: python -m benchmarks.onnx_backend [--rounds 5] [--batch 16]
+import os
+import time
+import argparse
+import numpy as np
+
+from app.core.config import get_settings
+from app.services.onnx_backend import OnnxEmbedding, OnnxReranker, export_onnx
+
+settings = get_settings()
+
+SAMPLE_TEXTS = [
+    "年假怎么请？需要提前几天提交申请？",
+    "病假期间工资怎么扣除？",
+    "CG2023合同的金额是多少",
+    "员工出差住宿标准是每晚多少钱",
+    "试用期员工可以享受年假吗",
+    "报销发票需要在多久之内提交",
+    "加班费按照什么标准计算",
+    "公司的考勤打卡时间是几点",
+]
+SAMPLE_PASSAGES = [
+    "员工申请年假须至少提前三个工作日在 OA 系统提交，经直属上级审批后生效。",
+    "病假期间按基本工资的 80% 发放，连续病假超过 30 天的按当地最低工资标准执行。",
+    "CG2023 采购合同总金额为人民币 1,280,000 元，分三期支付。",
+    "一线城市住宿标准为每晚 500 元，其他城市为每晚 350 元。",
+]
+
+
+def _cosine(a, b) -> np.ndarray:
+    a, b = np.asarray(a), np.asarray(b)
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def _throughput(fn, items, rounds: int) -> float:
+    fn(items)  # 预热
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn(items)
+    return len(items) * rounds / (time.perf_counter() - start)
+
+
+def load_backends(quantize: bool):
+    from FlagEmbedding import FlagReranker
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    torch_embed = HuggingFaceEmbedding(model_name=settings.EMBEDDING_MODEL_PATH, device="cpu", trust_remote_code=True)
+    torch_rerank = FlagReranker(settings.RERANK_MODEL_PATH, use_fp16=False)
+
+    embed_dir = os.path.join(settings.ONNX_MODEL_DIR, "embedding")
+    rerank_dir = os.path.join(settings.ONNX_MODEL_DIR, "reranker")
+    onnx_embed = OnnxEmbedding(
+        model_dir=embed_dir,
+        onnx_path=export_onnx(settings.EMBEDDING_MODEL_PATH, embed_dir, task="embedding", quantize=quantize),
+        intra_op_threads=settings.ONNX_INTRA_OP_THREADS,
+        inter_op_threads=settings.ONNX_INTER_OP_THREADS,
+    )
+    onnx_rerank = OnnxReranker(
+        model_dir=rerank_dir,
+        onnx_path=export_onnx(settings.RERANK_MODEL_PATH, rerank_dir, task="rerank", quantize=quantize),
+        intra_op_threads=settings.ONNX_INTRA_OP_THREADS,
+        inter_op_threads=settings.ONNX_INTER_OP_THREADS,
+    )
+    return torch_embed, torch_rerank, onnx_embed, onnx_rerank
+
+
+def check_parity(torch_embed, torch_rerank, onnx_embed, onnx_rerank) -> bool:
+    print("\n🔍 [Parity] Embedding (cosine(torch, onnx))")
+    texts = SAMPLE_TEXTS + SAMPLE_PASSAGES
+    sims = _cosine(torch_embed.get_text_embedding_batch(texts), onnx_embed.get_text_embedding_batch(texts))
+    print(f"   min={sims.min():.5f} mean={sims.mean():.5f}")
+
+    print("🔍 [Parity] Reranker (logit 差值 & 排序一致性)")
+    pairs = [(q, p) for q in SAMPLE_TEXTS[:4] for p in SAMPLE_PASSAGES]
+    torch_scores = np.asarray(torch_rerank.compute_score([list(p) for p in pairs]))
+    onnx_scores = np.asarray(onnx_rerank.compute_score(pairs))
+    max_diff = np.abs(torch_scores - onnx_scores).max()
+    # 每个 query 下 top-1 文档是否一致
+    n = len(SAMPLE_PASSAGES)
+    top1_agree = np.mean([
+        torch_scores[i:i + n].argmax() == onnx_scores[i:i + n].argmax()
+        for i in range(0, len(pairs), n)
+    ])
+    print(f"   max|Δlogit|={max_diff:.4f} top1_agreement={top1_agree:.2%}")
+
+    ok = sims.min() > 0.99 and top1_agree == 1.0
+    print("✅ 一致性检查通过" if ok else "❌ 一致性检查未通过")
+    return ok
+
+
+def run_benchmark(torch_embed, torch_rerank, onnx_embed, onnx_rerank, rounds: int, batch: int):
+    texts = (SAMPLE_TEXTS + SAMPLE_PASSAGES) * (batch // 4 + 1)
+    texts = texts[:batch]
+    pairs = [(q, p) for q in SAMPLE_TEXTS for p in SAMPLE_PASSAGES][:batch]
+
+    print(f"\n⏱️ [Benchmark] batch={batch} rounds={rounds}")
+    rows = [
+        ("embedding", "torch", _throughput(torch_embed.get_text_embedding_batch, texts, rounds)),
+        ("embedding", "onnx", _throughput(onnx_embed.get_text_embedding_batch, texts, rounds)),
+        ("rerank", "torch", _throughput(lambda ps: torch_rerank.compute_score([list(p) for p in ps]), pairs, rounds)),
+        ("rerank", "onnx", _throughput(onnx_rerank.compute_score, pairs, rounds)),
+    ]
+    print(f"   {'model':<10} {'backend':<8} {'items/s':>10}")
+    for model, backend, tput in rows:
+        print(f"   {model:<10} {backend:<8} {tput:>10.1f}")
+    print(f"   embedding 加速比: {rows[1][2] / rows[0][2]:.2f}x, rerank 加速比: {rows[3][2] / rows[2][2]:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--no-quantize", action="store_true", help="对比 fp32 ONNX 而不是 int8")
+    args = parser.parse_args()
+
+    backends = load_backends(quantize=not args.no_quantize)
+    passed = check_parity(*backends)
+    run_benchmark(*backends, rounds=args.rounds, batch=args.batch)
+    raise SystemExit(0 if passed else 1)
@@ -0,0 +1,178 @@
+# benchmarks/qdrant_profiles.py
+# Qdrant 集合性能配置对比：在合成语料上测 内存占用(估算) / 检索延迟 / Recall@10
+# 用法: python -m benchmarks.qdrant_profiles [--points 20000] [--queries 200] [--profiles baseline,scalar]
+# 需要一个可写的 Qdrant (默认 settings.QDRANT_URL)；每个配置建一个临时集合，测完删除
+import time
+import argparse
+from contextlib import contextmanager
+
+import numpy as np
+
+from app.core.config import get_settings
+from app.services import rag_engine
+
+settings = get_settings()
+
+DIM = 1024
+TOP_K = 10
+
+# 每个配置只写与默认值不同的字段 (对应 Settings 第 3 节)
+PROFILES = {
+    "baseline": {},
+    "hnsw_m32": {"QDRANT_HNSW_M": 32, "QDRANT_HNSW_EF_CONSTRUCT": 200},
+    "scalar": {"QDRANT_QUANTIZATION": "scalar"},
+    "scalar_on_disk": {"QDRANT_QUANTIZATION": "scalar", "QDRANT_VECTORS_ON_DISK": True, "QDRANT_PAYLOAD_ON_DISK": True},
+    "scalar_no_rescore": {"QDRANT_QUANTIZATION": "scalar", "QDRANT_RESCORE": False},
+    "product_x16": {"QDRANT_QUANTIZATION": "product", "QDRANT_PQ_COMPRESSION": "x16", "QDRANT_VECTORS_ON_DISK": True},
+}
+
+
+@contextmanager
+def _profile(overrides: dict, collection_name: str):
+    """临时改写 settings，让 rag_engine 的建表 / 检索参数按该配置生成"""
+    overrides = {**overrides, "COLLECTION_NAME": collection_name}
+    original = {key: getattr(settings, key) for key in overrides}
+    for key, value in overrides.items():
+        setattr(settings, key, value)
+    try:
+        yield
+    finally:
+        for key, value in original.items():
+            setattr(settings, key, value)
+
+
+def make_corpus(n_points: int, n_queries: int, n_clusters: int = 64, seed: int = 42):
+    """聚类分布的单位向量 (比纯随机向量更接近真实 Embedding 的分布)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, DIM)).astype(np.float32)
+
+    def sample(n):
+        labels = rng.integers(0, n_clusters, size=n)
+        vectors = centers[labels] + 0.6 * rng.normal(size=(n, DIM)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    return sample(n_points), sample(n_queries)
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    scores = queries @ corpus.T
+    return np.argsort(-scores, axis=1)[:, :TOP_K]
+
+
+def estimate_ram_mb(n_points: int) -> dict:
+    """按当前 settings 估算常驻内存：原始向量 + 量化向量 + HNSW 图 (第 0 层 2m 条边)"""
+    raw = n_points * DIM * 4
+    quantization = settings.QDRANT_QUANTIZATION.lower()
+    if quantization == "scalar":
+        quantized = n_points * DIM
+    elif quantization == "product":
+        quantized = n_points * DIM * 4 // int(settings.QDRANT_PQ_COMPRESSION.lstrip("x"))
+    else:
+        quantized = 0
+    if quantized and not settings.QDRANT_QUANTIZATION_ALWAYS_RAM:
+        quantized = 0
+    graph = n_points * settings.QDRANT_HNSW_M * 2 * 4
+    ram = (0 if settings.QDRANT_VECTORS_ON_DISK else raw) + quantized + graph
+    return {"ram_mb": ram / 2**20, "disk_vectors_mb": raw / 2**20 if settings.QDRANT_VECTORS_ON_DISK else 0.0}
+
+
+def _wait_indexed(client, collection_name: str, n_points: int, timeout: float = 600):
+    from qdrant_client import models
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        info = client.get_collection(collection_name)
+        if info.status == models.CollectionStatus.GREEN and (info.indexed_vectors_count or 0) >= n_points * 0.95:
+            return
+        time.sleep(1)
+    print(f"⚠️ {collection_name} 索引未在 {timeout:.0f}s 内完成，结果可能偏慢")
+
+
+def run_profile(client, name: str, overrides: dict, corpus: np.ndarray, queries: np.ndarray, truth: np.ndarray) -> dict:
+    from qdrant_client import models
+
+    collection_name = f"bench_profile_{name}"
+    with _profile(overrides, collection_name):
+        if client.collection_exists(collection_name):
+            client.delete_collection(collection_name)
+        client.create_collection(**rag_engine._collection_config())
+        try:
+            start = time.perf_counter()
+            payload = [{"file_name": f"doc_{i % 500}.pdf", "source_type": "file_download"} for i in range(len(corpus))]
+            client.upload_collection(
+                collection_name=collection_name,
+                vectors=corpus,
+                payload=payload,
+                ids=list(range(len(corpus))),
+                batch_size=256,
+                parallel=2,
+            )
+            rag_engine.ensure_payload_indexes(client)
+            _wait_indexed(client, collection_name, len(corpus))
+            build_seconds = time.perf_counter() - start
+
+            params = rag_engine.search_params()
+            latencies, hits = [], 0
+            for query, expected in zip(queries, truth):
+                t0 = time.perf_counter()
+                result = client.query_points(
+                    collection_name=collection_name,
+                    query=query.tolist(),
+                    limit=TOP_K,
+                    search_params=params,
+                    with_payload=False,
+                )
+                latencies.append((time.perf_counter() - t0) * 1000)
+                hits += len({p.id for p in result.points} & set(expected.tolist()))
+
+            # 带 payload 过滤的检索 (验证 payload 索引)
+            flt = models.Filter(must=[models.FieldCondition(key="file_name", match=models.MatchValue(value="doc_7.pdf"))])
+            filtered = []
+            for query in queries[:50]:
+                t0 = time.perf_counter()
+                client.query_points(collection_name=collection_name, query=query.tolist(), limit=TOP_K,
+                                    query_filter=flt, search_params=params, with_payload=False)
+                filtered.append((time.perf_counter() - t0) * 1000)
+
+            return {
+                "profile": name,
+                **estimate_ram_mb(len(corpus)),
+                "build_s": build_seconds,
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p95_ms": float(np.percentile(latencies, 95)),
+                "filtered_p50_ms": float(np.percentile(filtered, 50)),
+                "recall@10": hits / (len(queries) * TOP_K),
+            }
+        finally:
+            client.delete_collection(collection_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qdrant 集合性能配置对比")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="逗号分隔，可选: " + ", ".join(PROFILES))
+    args = parser.parse_args()
+
+    import qdrant_client
+    client = qdrant_client.QdrantClient(**settings.QDRANT_CLIENT_KWARGS, timeout=120)
+
+    print(f"🧪 生成合成语料: {args.points} x {DIM}, 查询 {args.queries} 条 ...")
+    corpus, queries = make_corpus(args.points, args.queries)
+    truth = exact_top_k(corpus, queries)
+
+    rows = []
+    for name in args.profiles.split(","):
+        name = name.strip()
+        print(f"▶️  {name} ...")
+        rows.append(run_profile(client, name, PROFILES[name], corpus, queries, truth))
+
+    header = f"{'profile':<20}{'RAM(MB,估算)':>14}{'磁盘向量(MB)':>14}{'建库(s)':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'过滤p50':>10}{'Recall@10':>11}"
+    print("\n" + header)
+    print("-" * len(header))
+    for row in rows:
+        print(f"{row['profile']:<20}{row['ram_mb']:>14.1f}{row['disk_vectors_mb']:>14.1f}{row['build_s']:>10.1f}"
+              f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['filtered_p50_ms']:>10.2f}{row['recall@10']:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
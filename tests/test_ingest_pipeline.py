@@ -0,0 +1,77 @@
+# tests/test_ingest_pipeline.py
+# 增量入库：改动一个段落后重新入库，其余切片的哈希和 point id 必须保持不变
+import json
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("qdrant_client")
+schema = pytest.importorskip("llama_index.core.schema")
+ingest_pipeline = pytest.importorskip("app.services.ingest_pipeline")
+
+
+class FakeQdrant:
+    """只实现 diff_against_index 用到的 scroll (单页返回全部 point)"""
+
+    def __init__(self):
+        self.points = []
+
+    def upsert_nodes(self, nodes):
+        for node in nodes:
+            self.points.append(SimpleNamespace(
+                id=str(uuid.uuid4()),
+                payload={
+                    "chunk_hash": node.metadata["chunk_hash"],
+                    "_node_content": json.dumps({"text": node.text, "metadata": node.metadata}, ensure_ascii=False),
+                },
+            ))
+
+    def scroll(self, **kwargs):
+        return self.points, None
+
+
+def _nodes(paragraphs, file_hash):
+    # 模拟 SimpleDirectoryReader + _annotate：file_path / source_url 带内容寻址的文件名，每个版本都不同
+    name = f"{file_hash[:16]}-policy.pdf"
+    nodes = [
+        schema.TextNode(text=text, metadata={
+            "file_name": "policy.pdf",
+            "file_path": f"/uploads/{name}",
+            "source_url": f"http://localhost:8000/static/{name}",
+            "source_type": "file_download",
+            "file_size": 1000 + len("".join(paragraphs)),
+            "page_label": str(i + 1),
+        })
+        for i, text in enumerate(paragraphs)
+    ]
+    ingest_pipeline.tag_chunk_hashes(nodes, file_hash)
+    return nodes
+
+
+def test_reindex_with_one_changed_paragraph_keeps_other_chunks():
+    v1 = ["年假按工龄计算，满一年 5 天。", "病假需提供医院证明。", "加班需提前审批。"]
+    v2 = [v1[0], "病假需提供二级以上医院证明。", v1[2]]
+
+    client = FakeQdrant()
+    old_nodes = _nodes(v1, "a" * 64)
+    client.upsert_nodes(old_nodes)
+    old_ids = [p.id for p in client.points]
+
+    new_nodes = _nodes(v2, "b" * 64)
+    assert new_nodes[0].metadata["chunk_hash"] == old_nodes[0].metadata["chunk_hash"]
+    assert new_nodes[2].metadata["chunk_hash"] == old_nodes[2].metadata["chunk_hash"]
+    assert new_nodes[1].metadata["chunk_hash"] != old_nodes[1].metadata["chunk_hash"]
+
+    fresh, obsolete_ids, kept = ingest_pipeline.diff_against_index(new_nodes, "policy.pdf", client=client)
+    assert [n.text for n in fresh] == [v2[1]]
+    assert obsolete_ids == [old_ids[1]]
+    assert sorted(pid for pid, _ in kept) == sorted([old_ids[0], old_ids[2]])
+
+
+def test_moved_paragraph_changes_hash():
+    same_text = "加班需提前审批。"
+    a = _nodes([same_text], "a" * 64)[0]
+    b = schema.TextNode(text=same_text, metadata={**a.metadata, "page_label": "7"})
+    ingest_pipeline.tag_chunk_hashes([b], "a" * 64)
+    assert a.metadata["chunk_hash"] != b.metadata["chunk_hash"]